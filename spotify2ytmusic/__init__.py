@@ -1,3 +1,13 @@
 #!/usr/bin/env python3
 
-from . import cli
+import importlib
+
+#  Submodules are imported on first use, so that `import spotify2ytmusic` and the
+#  command dispatcher stay fast.
+_SUBMODULES = ("backend", "cli", "gui", "spotify_backup")
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
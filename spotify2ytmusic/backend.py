@@ -1,35 +1,120 @@
 #!/usr/bin/env python3
 
+from __future__ import annotations
+
 import json
 import sys
 import os
+import threading
 import time
 import re
 
-from ytmusicapi import YTMusic
-from typing import Optional, Union, Iterator, Dict, List
+from typing import TYPE_CHECKING, Optional, Union, Iterator, Dict, List
 from collections import namedtuple
 from dataclasses import dataclass, field
 
+from . import cassette, jsoncodec, response_cache, tracing
+from .cancel import CancelToken, Cancelled
+from .events import (
+    EventBus,
+    PlaylistDone,
+    TrackError,
+    TrackResolved,
+    TrackStarted,
+    TrackWritten,
+    bus,
+)
+from .metrics import instrument_ytmusic, metrics
+from .profiling import phases
+
+if TYPE_CHECKING:
+    #  ytmusicapi is slow to import, and only needed by commands that talk to YTMusic
+    from ytmusicapi import YTMusic
+
+    from .likes import LikeWriter
 
 SongInfo = namedtuple("SongInfo", ["title", "artist", "album"])
 
+#  A playlist for `copier` to create once the tracks are looked up
+NewPlaylist = namedtuple("NewPlaylist", ["title", "description", "privacy_status"])
+
+#  Tracks per create_playlist or add_playlist_items call
+PLAYLIST_BATCH_SIZE = 50
+
+
+#  HTTP connections kept open per host, sized for the lookup and like threads
+HTTP_POOL_SIZE = 16
+
+#  One YTMusic client per credentials file, for the life of the process
+_ytmusic_clients: Dict[tuple, YTMusic] = {}
+_ytmusic_lock = threading.Lock()
+
+
+def _http_session():
+    """A `requests.Session` with a connection pool large enough for concurrent calls."""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
-def get_ytmusic() -> YTMusic:
+
+def get_ytmusic(credentials_file: str = "oauth.json") -> YTMusic:
     """
-    Get YTMusic instance
+    Get YTMusic instance, authenticated with `credentials_file`
+
+    The client and its HTTP session are created once per process and credentials
+    file, and shared by every caller (and thread).  A new one is created if the
+    file changes, e.g. after logging in again, or after `reset_ytmusic()`.
+
+    Unless `response_cache.disable()` was called, searches, albums and library
+    playlists are cached on disk.  While a cassette is in use (see `cassette.use()`)
+    the calls are recorded on it, uncached, or answered from it without credentials.
     """
-    if not os.path.exists("oauth.json"):
-        print("ERROR: No file 'oauth.json' exists in the current directory.")
+    tape = cassette.active
+    if tape is not None and tape.replaying:
+        return instrument_ytmusic(cassette.CassetteYTMusic(None, tape))
+
+    if not os.path.exists(credentials_file):
+        print(f"ERROR: No file '{credentials_file}' exists.")
         print("       Have you logged in to YTMusic?")
         print("       Click 'Login to YT Music' tab and follow the instructions")
         sys.exit(1)
 
+    key = (os.path.abspath(credentials_file), os.stat(credentials_file).st_mtime_ns)
+    with _ytmusic_lock:
+        yt = _ytmusic_clients.get(key)
+        if yt is None:
+            yt = _new_ytmusic(credentials_file)
+            if response_cache.enabled:
+                yt = response_cache.CachedYTMusic(
+                    yt, response_cache.shared(), account=key[0]
+                )
+            for stale in [k for k in _ytmusic_clients if k[0] == key[0]]:
+                del _ytmusic_clients[stale]
+            _ytmusic_clients[key] = yt
+    if tape is not None:
+        if isinstance(yt, response_cache.CachedYTMusic):
+            yt = yt._yt
+        return cassette.CassetteYTMusic(yt, tape)
+    return yt
+
+
+def _new_ytmusic(credentials_file: str) -> YTMusic:
+    from ytmusicapi import YTMusic
+
     try:
-        return YTMusic("oauth.json")
+        return instrument_ytmusic(
+            YTMusic(credentials_file, requests_session=_http_session())
+        )
     except json.decoder.JSONDecodeError as e:
         print(f"ERROR: JSON Decode error while trying start YTMusic: {e}")
-        print("       This typically means a problem with a 'oauth.json' file.")
+        print(
+            f"       This typically means a problem with a '{credentials_file}' file."
+        )
         print("       Click 'Login to YT Music' tab to regenerate credentials")
         sys.exit(1)
     except Exception as e:
@@ -38,13 +123,29 @@ def get_ytmusic() -> YTMusic:
         sys.exit(1)
 
 
+def reset_ytmusic() -> None:
+    """Forget the YTMusic clients, so the next `get_ytmusic()` authenticates again."""
+    with _ytmusic_lock:
+        _ytmusic_clients.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    #  A forked worker must not share the parent's open connections
+    os.register_at_fork(after_in_child=_ytmusic_clients.clear)
+
+
 def _ytmusic_create_playlist(
-    yt: YTMusic, title: str, description: str, privacy_status: str = "PRIVATE"
+    yt: YTMusic,
+    title: str,
+    description: str,
+    privacy_status: str = "PRIVATE",
+    video_ids: Optional[List[str]] = None,
 ) -> str:
     """Wrapper on ytmusic.create_playlist
 
     This wrapper does retries with back-off because sometimes YouTube Music will
-    rate limit requests or otherwise fail.
+    rate limit requests or otherwise fail.  It returns once the new playlist can be
+    read back, so it is ready for more tracks to be added.
 
     privacy_status can be: PRIVATE, PUBLIC, or UNLISTED
     """
@@ -56,15 +157,20 @@ def _ytmusic_create_playlist(
         for _ in range(10):
             try:
                 """Create a playlist on YTMusic, retrying if it fails."""
+                kwargs = {"video_ids": video_ids} if video_ids else {}
                 id = yt.create_playlist(
-                    title=title, description=description, privacy_status=privacy_status
+                    title=title,
+                    description=description,
+                    privacy_status=privacy_status,
+                    **kwargs,
                 )
                 return id
             except Exception as e:
                 print(
                     f"ERROR: (Retrying create_playlist: {title}) {e} in {exception_sleep} seconds"
                 )
-                time.sleep(exception_sleep)
+                metrics.retry("ytmusic", "create_playlist")
+                metrics.sleep("backoff", exception_sleep)
                 exception_sleep *= 2
 
         return {
@@ -77,14 +183,75 @@ def _ytmusic_create_playlist(
         print(f"ERROR: Failed to create playlist (name: {title}): {id}")
         sys.exit(1)
 
-    time.sleep(1)  # seems to be needed to avoid missing playlist ID error
+    if not _wait_for_playlist(yt, id):
+        #  Adding the rest of the tracks is still tried, with its own retries
+        print(
+            f"WARNING: Created playlist '{title}' (ID: {id}) can't be read yet, "
+            "adding tracks to it may fail"
+        )
 
     return id
 
 
+def _wait_for_playlist(yt: YTMusic, playlist_id: str, timeout: float = 10) -> bool:
+    """Wait until a new playlist can be read, returns False if it can't after `timeout` seconds.
+
+    Adding to a playlist right after creating it can fail with a missing playlist ID.
+    """
+    delay = 0.25
+    waited = 0.0
+    while True:
+        try:
+            yt.get_playlist(playlistId=playlist_id, limit=1)
+            return True
+        except Exception:
+            if waited >= timeout:
+                return False
+        metrics.sleep("create_playlist_wait", delay)
+        waited += delay
+        delay = min(delay * 2, 2)
+
+
+def write_batch(
+    yt: YTMusic,
+    dst_pl_id: Optional[str],
+    video_ids: List[str],
+    events: EventBus,
+    cancel: Optional[CancelToken] = None,
+) -> bool:
+    """Add `video_ids` to the playlist (or like them), with retries, returns success.
+
+    Cancelling `cancel` stops the retries, not a first attempt.
+    """
+    exception_sleep = 5
+    for _ in range(10):
+        try:
+            with phases.phase("write"):
+                if dst_pl_id is not None:
+                    yt.add_playlist_items(
+                        playlistId=dst_pl_id, videoIds=video_ids, duplicates=False
+                    )
+                else:
+                    for video_id in video_ids:
+                        yt.rate_song(video_id, "LIKE")
+            return True
+        except Exception as e:
+            events.message(
+                f"ERROR: (Retrying add_playlist_items: {dst_pl_id} {len(video_ids)} tracks) {e} in {exception_sleep} seconds",
+                "error",
+            )
+            metrics.retry("ytmusic", "add_playlist_items" if dst_pl_id else "rate_song")
+            metrics.sleep("backoff", exception_sleep, cancel)
+            if cancel is not None and cancel.cancelled:
+                break
+            exception_sleep *= 2
+    return False
+
+
 def load_playlists_json(filename: str = "playlists.json", encoding: str = "utf-8"):
     """Load the `playlists.json` Spotify playlist file"""
-    return json.load(open(filename, "r", encoding=encoding))
+    with phases.phase("json_load"):
+        return jsoncodec.load_file(filename, encoding)
 
 
 def create_playlist(pl_name: str, privacy_status: str = "PRIVATE") -> None:
@@ -124,6 +291,7 @@ def iter_spotify_playlist(
     spotify_playlist_file: str = "playlists.json",
     spotify_encoding: str = "utf-8",
     reverse_playlist: bool = True,
+    events: Optional[EventBus] = None,
 ) -> Iterator[SongInfo]:
     """Songs from a specific album ("Liked Songs" if None)
 
@@ -132,10 +300,13 @@ def iter_spotify_playlist(
         `spotify_playlist_file` (str, optional): The path to the playlists backup files. Defaults to "playlists.json".
         `spotify_encoding` (str, optional): Characters encoding. Defaults to "utf-8".
         `reverse_playlist` (bool, optional): Is the playlist reversed when loading?  Defaults to True.
+        `events` (EventBus, optional): Where to report progress. Defaults to `events.bus`.
 
     Yields:
         Iterator[SongInfo]: The song's information
     """
+    if events is None:
+        events = bus
     spotify_pls = load_playlists_json(spotify_playlist_file, spotify_encoding)
 
     def find_spotify_playlist(spotify_pls: Dict, src_pl_id: Union[str, None]) -> Dict:
@@ -153,9 +324,16 @@ def iter_spotify_playlist(
         raise ValueError(f"Could not find Spotify playlist {src_pl_id}")
 
     src_pl = find_spotify_playlist(spotify_pls, src_pl_id)
+    yield from _iter_playlist_tracks(src_pl, reverse_playlist, events)
+
+
+def _iter_playlist_tracks(
+    src_pl: Dict, reverse_playlist: bool, events: EventBus
+) -> Iterator[SongInfo]:
+    """Songs from a playlist of the `playlists.json` data structure."""
     src_pl_name = src_pl["name"]
 
-    print(f"== Spotify Playlist: {src_pl_name}")
+    events.message(f"== Spotify Playlist: {src_pl_name}")
 
     pl_tracks = src_pl["tracks"]
     if reverse_playlist:
@@ -163,8 +341,9 @@ def iter_spotify_playlist(
 
     for src_track in pl_tracks:
         if src_track["track"] is None:
-            print(
-                f"WARNING: Spotify track seems to be malformed, Skipping.  Track: {src_track!r}"
+            events.message(
+                f"WARNING: Spotify track seems to be malformed, Skipping.  Track: {src_track!r}",
+                "warning",
             )
             continue
 
@@ -172,7 +351,10 @@ def iter_spotify_playlist(
             src_album_name = src_track["track"]["album"]["name"]
             src_track_artist = src_track["track"]["artists"][0]["name"]
         except TypeError as e:
-            print(f"ERROR: Spotify track seems to be malformed.  Track: {src_track!r}")
+            events.message(
+                f"ERROR: Spotify track seems to be malformed.  Track: {src_track!r}",
+                "error",
+            )
             raise e
         src_track_name = src_track["track"]["name"]
 
@@ -221,80 +403,215 @@ class ResearchDetails:
     query: Optional[str] = field(default=None)
     songs: Optional[List[Dict]] = field(default=None)
     suggestions: Optional[List[str]] = field(default=None)
+    steps: List[str] = field(default_factory=list)
+    calls: int = field(default=0)
 
 
-def lookup_song(
-    yt: YTMusic,
-    track_name: str,
-    artist_name: str,
-    album_name,
-    yt_search_algo: int,
-    details: Optional[ResearchDetails] = None,
-) -> dict:
-    """Look up a song on YTMusic
+#  A hard cap on the number of YTMusic API calls made to resolve a single track.  The
+#  default allows the worst case of the default strategy: song search, album search,
+#  3 album fetches, and a video search.
+DEFAULT_LOOKUP_MAX_CALLS = 6
 
-    Given the Spotify track information, it does a lookup for the album by the same
-    artist on YTMusic, then looks at the first 3 hits looking for a track with exactly
-    the same name. In the event that it can't find that exact track, it then does
-    a search of songs for the track name by the same artist and simply returns the
-    first hit.
 
-    The idea is that finding the album and artist and then looking for the exact track
-    match will be more likely to be accurate than searching for the song and artist and
-    relying on the YTMusic yt_search_algorithm to figure things out, especially for short tracks
-    that might have many contradictory hits like "Survival by Yes".
+class LookupBudgetExceeded(ValueError):
+    """Raised when a track could not be resolved within its API call budget."""
 
-    Args:
-        `yt` (YTMusic)
-        `track_name` (str): The name of the researched track
-        `artist_name` (str): The name of the researched track's artist
-        `album_name` (str): The name of the researched track's album
-        `yt_search_algo` (int): 0 for exact matching, 1 for extended matching (search past 1st result), 2 for approximate matching (search in videos)
-        `details` (ResearchDetails): If specified, more information about the search and the response will be populated for use by the caller.
 
-    Raises:
-        ValueError: If no track is found, it returns an error
+@dataclass
+class LookupStepStats:
+    attempts: int = field(default=0)
+    hits: int = field(default=0)
+    calls: int = field(default=0)
 
-    Returns:
-        dict: The infos of the researched song
+
+class LookupStats:
+    """Per-step hit-rate counters for the lookup strategy chain.
+
+    Safe to update from several threads, such as the jobs of `runner`.
+    """
+
+    def __init__(self) -> None:
+        self.steps: Dict[str, LookupStepStats] = {}
+        self.tracks = 0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def record(self, step: str, hit: bool, calls: int) -> None:
+        with self._lock:
+            stats = self.steps.setdefault(step, LookupStepStats())
+            stats.attempts += 1
+            stats.hits += int(hit)
+            stats.calls += calls
+
+    def add_track(self, calls: int) -> None:
+        """Count a track looked up with `calls` API calls."""
+        with self._lock:
+            self.tracks += 1
+            self.calls += calls
+
+    def summary(self) -> str:
+        """A one-line human readable summary of the step hit rates."""
+        with self._lock:
+            parts = [
+                f"{name} {stats.hits}/{stats.attempts} hits ({stats.calls} calls)"
+                for name, stats in self.steps.items()
+            ]
+        per_track = self.calls / self.tracks if self.tracks else 0.0
+        return (
+            f"Lookup: {self.tracks} tracks, {per_track:.2f} calls/track; "
+            + ", ".join(parts)
+        )
+
+
+#  Process-wide counters, used when the caller doesn't supply its own LookupStats.
+lookup_stats = LookupStats()
+
+
+class _LookupContext:
+    """State shared between the steps of a single `lookup_song` call."""
+
+    def __init__(
+        self,
+        yt: YTMusic,
+        track_name: str,
+        artist_name: str,
+        album_name: Optional[str],
+        yt_search_algo: int,
+        details: Optional[ResearchDetails],
+        max_calls: int,
+        events: EventBus,
+    ) -> None:
+        self.yt = yt
+        self.track_name = track_name
+        self.artist_name = artist_name
+        self.album_name = album_name
+        self.yt_search_algo = yt_search_algo
+        self.details = details
+        self.max_calls = max_calls
+        self.events = events
+        self.calls = 0
+        self.exhausted = False
+        self.songs: Optional[List[Dict]] = None
+
+    def call(self, method: str, *args, **kwargs):
+        """Call `yt.<method>`, enforcing the per-track call budget."""
+        if self.calls >= self.max_calls:
+            self.exhausted = True
+            raise LookupBudgetExceeded(
+                f"Exceeded {self.max_calls} API calls looking up {self.track_name} by {self.artist_name}"
+            )
+        self.calls += 1
+        return getattr(self.yt, method)(*args, **kwargs)
+
+
+def _same(a: Optional[str], b: Optional[str]) -> bool:
+    return a is not None and b is not None and a.casefold() == b.casefold()
+
+
+def _first_artist(item: Dict) -> Optional[str]:
+    artists = item.get("artists") or []
+    return artists[0].get("name") if artists else None
+
+
+def _album_name(item: Dict) -> Optional[str]:
+    album = item.get("album")
+    return album.get("name") if isinstance(album, dict) else album
+
+
+def _step_song_search(ctx: _LookupContext) -> Optional[Dict]:
+    """Search songs (one call), accepting only a high-confidence match.
+
+    A high-confidence match has the same title, artist and album as the source track.
+    """
+    query = f"{ctx.track_name} by {ctx.artist_name}"
+    if ctx.details:
+        ctx.details.query = query
+        ctx.details.suggestions = ctx.yt.get_search_suggestions(query=query)
+    ctx.songs = ctx.call("search", query=query, filter="songs")
+    if ctx.details:
+        ctx.details.songs = ctx.songs
+
+    for song in ctx.songs:
+        if (
+            _same(song.get("title"), ctx.track_name)
+            and _same(_first_artist(song), ctx.artist_name)
+            and _same(_album_name(song), ctx.album_name)
+        ):
+            return song
+    return None
+
+
+def _rank_albums(albums: List[Dict], album_name: str, artist_name: str) -> List[Dict]:
+    """Order album search hits by how well they match, best first.
+
+    Ties keep the YTMusic ordering, so an unhelpful ranking degrades to the
+    original "first 3 hits" behavior.
+    """
+
+    def score(album: Dict) -> int:
+        title = album.get("title") or ""
+        value = 0
+        if _same(title, album_name):
+            value += 4
+        elif title and (
+            album_name.casefold() in title.casefold()
+            or title.casefold() in album_name.casefold()
+        ):
+            value += 2
+        if any(_same(a.get("name"), artist_name) for a in album.get("artists") or []):
+            value += 1
+        return value
+
+    return sorted(albums, key=score, reverse=True)
+
+
+def _step_album_browse(ctx: _LookupContext) -> Optional[Dict]:
+    """Look for the exact track on the albums matching the source album.
+
+    The first 3 album hits are ranked before fetching, so usually only the best
+    candidate needs a `get_album` call.
     """
-    albums = yt.search(query=f"{album_name} by {artist_name}", filter="albums")
-    for album in albums[:3]:
-        # print(album)
-        # print(f"ALBUM: {album['browseId']} - {album['title']} - {album['artists'][0]['name']}")
+    if not ctx.album_name:
+        return None
 
+    albums = ctx.call(
+        "search", query=f"{ctx.album_name} by {ctx.artist_name}", filter="albums"
+    )
+    for album in _rank_albums(albums[:3], ctx.album_name, ctx.artist_name):
         try:
-            for track in yt.get_album(album["browseId"])["tracks"]:
-                if track["title"] == track_name:
-                    return track
-            # print(f"{track['videoId']} - {track['title']} - {track['artists'][0]['name']}")
+            tracks = ctx.call("get_album", album["browseId"])["tracks"]
+        except LookupBudgetExceeded:
+            raise
         except Exception as e:
-            print(f"Unable to lookup album ({e}), continuing...")
+            ctx.events.message(f"Unable to lookup album ({e}), continuing...")
+            continue
+
+        for track in tracks:
+            if _same(track.get("title"), ctx.track_name):
+                return track
+    return None
 
-    query = f"{track_name} by {artist_name}"
-    if details:
-        details.query = query
-        details.suggestions = yt.get_search_suggestions(query=query)
-    songs = yt.search(query=query, filter="songs")
 
-    match yt_search_algo:
+def _step_song_fallback(ctx: _LookupContext) -> Optional[Dict]:
+    """Pick a lower-confidence match from the song search results, per `yt_search_algo`."""
+    songs = ctx.songs or []
+    track_name = ctx.track_name
+    artist_name = ctx.artist_name
+
+    match ctx.yt_search_algo:
         case 0:
-            if details:
-                details.songs = songs
-            return songs[0]
+            return songs[0] if songs else None
 
         case 1:
             for song in songs:
                 if (
                     song["title"] == track_name
-                    and song["artists"][0]["name"] == artist_name
-                    and song["album"]["name"] == album_name
+                    and _first_artist(song) == artist_name
+                    and _album_name(song) == ctx.album_name
                 ):
                     return song
-                # print(f"SONG: {song['videoId']} - {song['title']} - {song['artists'][0]['name']} - {song['album']['name']}")
-
             raise ValueError(
-                f"Did not find {track_name} by {artist_name} from {album_name}"
+                f"Did not find {track_name} by {artist_name} from {ctx.album_name}"
             )
 
         case 2:
@@ -302,52 +619,149 @@ def lookup_song(
             for song in songs:
                 # Remove everything in brackets in the song title
                 song_title_without_brackets = re.sub(r"[\[(].*?[])]", "", song["title"])
+                song_artist = _first_artist(song) or ""
                 if (
-                    (
-                        song_title_without_brackets == track_name
-                        and song["album"]["name"] == album_name
-                    )
-                    or (song_title_without_brackets == track_name)
+                    (song_title_without_brackets == track_name)
                     or (song_title_without_brackets in track_name)
                     or (track_name in song_title_without_brackets)
-                ) and (
-                    song["artists"][0]["name"] == artist_name
-                    or artist_name in song["artists"][0]["name"]
-                ):
+                ) and (song_artist == artist_name or artist_name in song_artist):
                     return song
 
-            # Finds approximate match
-            # This tries to find a song anyway. Works when the song is not released as a music but a video.
-            else:
-                track_name = track_name.lower()
-                first_song_title = songs[0]["title"].lower()
-                if (
-                    track_name not in first_song_title
-                    or songs[0]["artists"][0]["name"] != artist_name
-                ):  # If the first song is not the one we are looking for
-                    print("Not found in songs, searching videos")
-                    new_songs = yt.search(
-                        query=f"{track_name} by {artist_name}", filter="videos"
-                    )  # Search videos
-
-                    # From here, we search for videos reposting the song. They often contain the name of it and the artist. Like with 'Nekfeu - Ecrire'.
-                    for new_song in new_songs:
-                        new_song_title = new_song[
-                            "title"
-                        ].lower()  # People sometimes mess up the capitalization in the title
-                        if (
-                            track_name in new_song_title
-                            and artist_name in new_song_title
-                        ) or (track_name in new_song_title):
-                            print("Found a video")
-                            return new_song
-                    else:
-                        # Basically we only get here if the song isn't present anywhere on YouTube
-                        raise ValueError(
-                            f"Did not find {track_name} by {artist_name} from {album_name}"
-                        )
-                else:
-                    return songs[0]
+            if (
+                songs
+                and track_name.lower() in songs[0]["title"].lower()
+                and _first_artist(songs[0]) == artist_name
+            ):
+                return songs[0]
+            return None
+
+    return None
+
+
+def _step_video_search(ctx: _LookupContext) -> Optional[Dict]:
+    """Search videos for reposts of the song (algo 2 only).
+
+    This tries to find a song anyway. Works when the song is not released as a
+    music but a video.
+    """
+    if ctx.yt_search_algo != 2:
+        return None
+
+    ctx.events.message("Not found in songs, searching videos")
+    track_name = ctx.track_name.lower()
+    videos = ctx.call(
+        "search", query=f"{track_name} by {ctx.artist_name}", filter="videos"
+    )
+
+    # From here, we search for videos reposting the song. They often contain the name of it and the artist. Like with 'Nekfeu - Ecrire'.
+    for video in videos:
+        # People sometimes mess up the capitalization in the title
+        if track_name in video["title"].lower():
+            ctx.events.message("Found a video")
+            return video
+    return None
+
+
+#  The lookup strategy chain, ordered by expected cost.  Each step is given the
+#  shared context and returns a track, or None to escalate to the next step.
+LOOKUP_STRATEGY = [
+    ("song_search", _step_song_search),
+    ("album_browse", _step_album_browse),
+    ("song_fallback", _step_song_fallback),
+    ("video_search", _step_video_search),
+]
+
+
+def lookup_song(
+    yt: YTMusic,
+    track_name: str,
+    artist_name: str,
+    album_name,
+    yt_search_algo: int,
+    details: Optional[ResearchDetails] = None,
+    *,
+    max_calls: int = DEFAULT_LOOKUP_MAX_CALLS,
+    stats: Optional[LookupStats] = None,
+    strategy: Optional[List] = None,
+    events: Optional[EventBus] = None,
+) -> dict:
+    """Look up a song on YTMusic
+
+    The lookup runs a chain of steps ordered by expected cost, stopping at the
+    first one that produces a match:
+
+    1. A song search for the track by the artist, accepted only if a hit has the
+       same title, artist and album (a single API call).
+    2. A search for the album by the same artist, fetching the best ranked of the
+       first 3 hits and looking for a track with exactly the same name.
+    3. A lower-confidence pick from the song search results, per `yt_search_algo`.
+    4. For algo 2, a search of videos reposting the song.
+
+    The album lookup is more likely to be accurate than relying on the YTMusic
+    search to figure things out, especially for short tracks that might have
+    many contradictory hits like "Survival by Yes", so it is still preferred
+    over a low-confidence song search hit.
+
+    Args:
+        `yt` (YTMusic)
+        `track_name` (str): The name of the researched track
+        `artist_name` (str): The name of the researched track's artist
+        `album_name` (str): The name of the researched track's album
+        `yt_search_algo` (int): 0 for exact matching, 1 for extended matching (search past 1st result), 2 for approximate matching (search in videos)
+        `details` (ResearchDetails): If specified, more information about the search and the response will be populated for use by the caller.
+        `max_calls` (int): The maximum number of API calls to spend on this track.
+        `stats` (LookupStats): Counters to record step hit rates in, defaults to `lookup_stats`.
+        `strategy` (list): (name, step) pairs to use instead of `LOOKUP_STRATEGY`.
+        `events` (EventBus): Where to report progress, defaults to `events.bus`.
+
+    Raises:
+        ValueError: If no track is found, it returns an error
+        LookupBudgetExceeded: If the call budget ran out before a track was found
+
+    Returns:
+        dict: The infos of the researched song
+    """
+    if stats is None:
+        stats = lookup_stats
+    ctx = _LookupContext(
+        yt,
+        track_name,
+        artist_name,
+        album_name,
+        yt_search_algo,
+        details,
+        max_calls,
+        events if events is not None else bus,
+    )
+
+    try:
+        for name, step in strategy or LOOKUP_STRATEGY:
+            calls_before = ctx.calls
+            if details:
+                details.steps.append(name)
+            try:
+                track = step(ctx)
+            except LookupBudgetExceeded:
+                #  Steps that don't need any further calls may still produce a match
+                track = None
+            except ValueError:
+                #  A step giving up is only conclusive if the earlier steps ran in full
+                if not ctx.exhausted:
+                    raise
+                track = None
+            stats.record(name, track is not None, ctx.calls - calls_before)
+            if track is not None:
+                return track
+    finally:
+        stats.add_track(ctx.calls)
+        if details:
+            details.calls = ctx.calls
+
+    if ctx.exhausted:
+        raise LookupBudgetExceeded(
+            f"Did not find {track_name} by {artist_name} from {album_name} within {max_calls} API calls"
+        )
+    raise ValueError(f"Did not find {track_name} by {artist_name} from {album_name}")
 
 
 def copier(
@@ -358,12 +772,38 @@ def copier(
     yt_search_algo: int = 0,
     *,
     yt: Optional[YTMusic] = None,
-):
+    lookup_max_calls: int = DEFAULT_LOOKUP_MAX_CALLS,
+    events: Optional[EventBus] = None,
+    lookup_cache: Optional[Dict] = None,
+    like_writer: Optional[LikeWriter] = None,
+    new_playlist: Optional[NewPlaylist] = None,
+    cancel: Optional[CancelToken] = None,
+) -> PlaylistDone:
     """
-    @@@
+    Copy `src_tracks` to the YTMusic playlist `dst_pl_id`, or to the liked songs if it is None.
+
+    Progress is reported as events on `events` (default: the process-wide `events.bus`),
+    and the final `PlaylistDone` event is returned.
+
+    If a `lookup_cache` dict is given, lookups are answered from it when possible, and
+    their results (including songs that were not found) are stored in it, so it can be
+    shared between calls.
+
+    When copying to the liked songs, a `like_writer` takes over the likes: they run
+    concurrently with the lookups, paced by its own rate limit instead of
+    `track_sleep`, and songs that are already liked are skipped.
+
+    With `new_playlist` instead of a `dst_pl_id`, all the tracks are looked up first,
+    then the playlist is created with them, `PLAYLIST_BATCH_SIZE` tracks per call.
+
+    `cancel` is checked before each track: pausing it holds the copy there, and
+    cancelling it stops the copy after writing the tracks looked up so far (the
+    pending likes, or the new playlist), with `cancelled` set on the result.
     """
     if yt is None:
         yt = get_ytmusic()
+    if events is None:
+        events = bus
 
     if dst_pl_id is not None:
         try:
@@ -375,63 +815,217 @@ def copier(
             )
             print("      'PL_DhcdsaJ7echjfdsaJFhdsWUd73HJFca'")
             sys.exit(1)
-        print(f"== Youtube Playlist: {yt_pl['title']}")
+        events.message(f"== Youtube Playlist: {yt_pl['title']}")
+
+    if dst_pl_id is not None:
+        like_writer = None
+        new_playlist = None
+    #  Tracks to create `new_playlist` with, once they are all looked up
+    pending: List[tuple] = []
+    like_errors_before = like_writer.errors if like_writer else 0
 
     tracks_added_set = set()
     duplicate_count = 0
     error_count = 0
+    stats = LookupStats()
+    start = time.perf_counter()
+    cancelled = False
 
-    for src_track in src_tracks:
-        print(f"Spotify:   {src_track.title} - {src_track.artist} - {src_track.album}")
-
+    for index, src_track in enumerate(src_tracks):
+        if cancel is not None:
+            try:
+                cancel.check()
+            except Cancelled:
+                cancelled = True
+                break
+        tracing.begin_track(src_track, index)
+        events.emit(TrackStarted(src_track, index))
+
+        lookup_start = time.perf_counter()
+        cache_key = (src_track, yt_search_algo)
         try:
-            dst_track = lookup_song(
-                yt, src_track.title, src_track.artist, src_track.album, yt_search_algo
-            )
+            if lookup_cache is not None and cache_key in lookup_cache:
+                metrics.cache_hit("ytmusic", "lookup_song")
+                dst_track = lookup_cache[cache_key]
+                if isinstance(dst_track, ValueError):
+                    raise dst_track
+            else:
+                try:
+                    with phases.phase("lookup"):
+                        dst_track = lookup_song(
+                            yt,
+                            src_track.title,
+                            src_track.artist,
+                            src_track.album,
+                            yt_search_algo,
+                            max_calls=lookup_max_calls,
+                            stats=stats,
+                            events=events,
+                        )
+                except ValueError as e:
+                    #  Not found, other errors may be transient and are not cached
+                    if lookup_cache is not None:
+                        lookup_cache[cache_key] = e
+                    raise
+                if lookup_cache is not None:
+                    lookup_cache[cache_key] = dst_track
         except Exception as e:
-            print(f"ERROR: Unable to look up song on YTMusic: {e}")
+            events.emit(TrackError(src_track, "lookup", str(e)))
             error_count += 1
             continue
 
-        yt_artist_name = "<Unknown>"
-        if "artists" in dst_track and len(dst_track["artists"]) > 0:
-            yt_artist_name = dst_track["artists"][0]["name"]
-        print(
-            f"  Youtube: {dst_track['title']} - {yt_artist_name} - {dst_track['album'] if 'album' in dst_track else '<Unknown>'}"
+        video_id = dst_track["videoId"]
+        duplicate = video_id in tracks_added_set
+        events.emit(
+            TrackResolved(
+                src_track,
+                video_id,
+                dst_track["title"],
+                _first_artist(dst_track) or "<Unknown>",
+                _album_name(dst_track),
+                duplicate,
+                time.perf_counter() - lookup_start,
+            )
         )
-
-        if dst_track["videoId"] in tracks_added_set:
-            print("(DUPLICATE, this track has already been added)")
+        if duplicate:
             duplicate_count += 1
-        tracks_added_set.add(dst_track["videoId"])
+        tracks_added_set.add(video_id)
+
+        if not dry_run and like_writer is not None:
+            if not duplicate and not like_writer.submit(src_track, video_id, events):
+                events.message("(ALREADY LIKED, skipping)")
+                duplicate_count += 1
+            continue
+
+        if new_playlist is not None:
+            if not duplicate:
+                pending.append((src_track, video_id))
+            continue
 
         if not dry_run:
-            exception_sleep = 5
-            for _ in range(10):
-                try:
-                    if dst_pl_id is not None:
-                        yt.add_playlist_items(
-                            playlistId=dst_pl_id,
-                            videoIds=[dst_track["videoId"]],
-                            duplicates=False,
+            write_start = time.perf_counter()
+            with phases.phase("write"):
+                exception_sleep = 5
+                for _ in range(10):
+                    try:
+                        if dst_pl_id is not None:
+                            yt.add_playlist_items(
+                                playlistId=dst_pl_id,
+                                videoIds=[video_id],
+                                duplicates=False,
+                            )
+                        else:
+                            yt.rate_song(video_id, "LIKE")
+                        events.emit(
+                            TrackWritten(
+                                src_track,
+                                video_id,
+                                dst_pl_id,
+                                time.perf_counter() - write_start,
+                            )
+                        )
+                        break
+                    except Exception as e:
+                        events.message(
+                            f"ERROR: (Retrying add_playlist_items: {dst_pl_id} {video_id}) {e} in {exception_sleep} seconds",
+                            "error",
+                        )
+                        metrics.retry(
+                            "ytmusic",
+                            "add_playlist_items" if dst_pl_id else "rate_song",
+                        )
+                        metrics.sleep("backoff", exception_sleep, cancel)
+                        if cancel is not None and cancel.cancelled:
+                            events.emit(
+                                TrackError(
+                                    src_track, "write", f"Cancelled adding {video_id}"
+                                )
+                            )
+                            error_count += 1
+                            break
+                        exception_sleep *= 2
+                else:
+                    events.emit(
+                        TrackError(
+                            src_track,
+                            "write",
+                            f"Could not add {video_id} after retries",
                         )
-                    else:
-                        yt.rate_song(dst_track["videoId"], "LIKE")
-                    break
-                except Exception as e:
-                    print(
-                        f"ERROR: (Retrying add_playlist_items: {dst_pl_id} {dst_track['videoId']}) {e} in {exception_sleep} seconds"
                     )
-                    time.sleep(exception_sleep)
-                    exception_sleep *= 2
+                    error_count += 1
 
         if track_sleep:
-            time.sleep(track_sleep)
+            metrics.sleep("track_sleep", track_sleep, cancel)
+    tracing.end_track()
+
+    if like_writer is not None:
+        error_count += like_writer.join() - like_errors_before
 
-    print()
-    print(
-        f"Added {len(tracks_added_set)} tracks, encountered {duplicate_count} duplicates, {error_count} errors"
+    if new_playlist is not None and not dry_run and (pending or not cancelled):
+        dst_pl_id, write_errors = _create_populated_playlist(
+            yt, new_playlist, pending, events, cancel
+        )
+        error_count += write_errors
+
+    done = PlaylistDone(
+        dst_pl_id,
+        len(tracks_added_set),
+        duplicate_count,
+        error_count,
+        time.perf_counter() - start,
+        stats.summary(),
+        cancelled,
     )
+    events.emit(done)
+    return done
+
+
+def _create_populated_playlist(
+    yt: YTMusic,
+    new_playlist: NewPlaylist,
+    tracks: List[tuple],
+    events: EventBus,
+    cancel: Optional[CancelToken] = None,
+) -> tuple:
+    """Create `new_playlist` with `tracks` (source track, video ID) in as few calls as
+    possible, returns its ID and the number of tracks that could not be added."""
+    write_start = time.perf_counter()
+    first = tracks[:PLAYLIST_BATCH_SIZE]
+    with phases.phase("write"):
+        dst_pl_id = _ytmusic_create_playlist(
+            yt,
+            title=new_playlist.title,
+            description=new_playlist.description,
+            privacy_status=new_playlist.privacy_status,
+            video_ids=[video_id for _, video_id in first],
+        )
+    events.message(
+        f"NOTE: Created playlist '{new_playlist.title}' with ID: {dst_pl_id}"
+    )
+    errors = 0
+    for start in range(0, len(tracks), PLAYLIST_BATCH_SIZE):
+        batch = tracks[start : start + PLAYLIST_BATCH_SIZE]
+        if start:
+            write_start = time.perf_counter()
+            video_ids = [video_id for _, video_id in batch]
+            if not write_batch(yt, dst_pl_id, video_ids, events, cancel):
+                for src_track, video_id in batch:
+                    events.emit(
+                        TrackError(
+                            src_track,
+                            "write",
+                            f"Could not add {video_id} after retries",
+                        )
+                    )
+                errors += len(batch)
+                continue
+        for src_track, video_id in batch:
+            events.emit(
+                TrackWritten(
+                    src_track, video_id, dst_pl_id, time.perf_counter() - write_start
+                )
+            )
+    return dst_pl_id, errors
 
 
 def copy_playlist(
@@ -443,56 +1037,129 @@ def copy_playlist(
     yt_search_algo: int = 0,
     reverse_playlist: bool = True,
     privacy_status: str = "PRIVATE",
-):
+    lookup_max_calls: int = DEFAULT_LOOKUP_MAX_CALLS,
+    *,
+    spotify_playlist_file: str = "playlists.json",
+    yt: Optional[YTMusic] = None,
+    events: Optional[EventBus] = None,
+    cancel: Optional[CancelToken] = None,
+) -> PlaylistDone:
     """
     Copy a Spotify playlist to a YTMusic playlist
     @@@
     """
-    print("Using search algo n°: ", yt_search_algo)
-    yt = get_ytmusic()
+    if events is None:
+        events = bus
+    events.message(f"Using search algo n°:  {yt_search_algo}")
+    if yt is None:
+        yt = get_ytmusic()
     pl_name: str = ""
 
     if ytmusic_playlist_id.startswith("+"):
         pl_name = ytmusic_playlist_id[1:]
 
         ytmusic_playlist_id = get_playlist_id_by_name(yt, pl_name)
-        print(f"Looking up playlist '{pl_name}': id={ytmusic_playlist_id}")
+        events.message(f"Looking up playlist '{pl_name}': id={ytmusic_playlist_id}")
 
     if ytmusic_playlist_id is None:
         if pl_name == "":
-            print("No playlist name or ID provided, creating playlist...")
-            spotify_pls: dict = load_playlists_json()
+            events.message("No playlist name or ID provided, creating playlist...")
+            spotify_pls: dict = load_playlists_json(
+                spotify_playlist_file, spotify_playlists_encoding
+            )
             for pl in spotify_pls["playlists"]:
                 if len(pl.keys()) > 3 and pl["id"] == spotify_playlist_id:
                     pl_name = pl["name"]
 
-        ytmusic_playlist_id = _ytmusic_create_playlist(
-            yt,
-            title=pl_name,
-            description=pl_name,
-            privacy_status=privacy_status,
-        )
-
-        #  create_playlist returns a dict if there was an error
-        if isinstance(ytmusic_playlist_id, dict):
-            print(f"ERROR: Failed to create playlist: {ytmusic_playlist_id}")
-            sys.exit(1)
-        print(f"NOTE: Created playlist '{pl_name}' with ID: {ytmusic_playlist_id}")
+        #  Created by `copier` once the tracks are looked up
+        new_playlist = NewPlaylist(pl_name, pl_name, privacy_status)
+    else:
+        new_playlist = None
 
-    copier(
+    return copier(
         iter_spotify_playlist(
             spotify_playlist_id,
+            spotify_playlist_file=spotify_playlist_file,
             spotify_encoding=spotify_playlists_encoding,
             reverse_playlist=reverse_playlist,
+            events=events,
         ),
         ytmusic_playlist_id,
         dry_run,
         track_sleep,
         yt_search_algo,
         yt=yt,
+        lookup_max_calls=lookup_max_calls,
+        events=events,
+        new_playlist=new_playlist,
+        cancel=cancel,
     )
 
 
+def copy_tracks(
+    src_tracks: Iterator[SongInfo],
+    ytmusic_playlist_id: str,
+    dry_run: bool = False,
+    track_sleep: float = 0.1,
+    yt_search_algo: int = 0,
+    privacy_status: str = "PRIVATE",
+    lookup_max_calls: int = DEFAULT_LOOKUP_MAX_CALLS,
+    *,
+    yt: Optional[YTMusic] = None,
+    events: Optional[EventBus] = None,
+    cancel: Optional[CancelToken] = None,
+) -> PlaylistDone:
+    """
+    Copy `src_tracks` (e.g. from `readers.iter_tracks()`) to a YTMusic playlist
+
+    `ytmusic_playlist_id` is a playlist ID, or "+" and the name of a playlist, which
+    is created if it does not exist.
+    """
+    if events is None:
+        events = bus
+    if yt is None:
+        yt = get_ytmusic()
+    new_playlist = None
+    if ytmusic_playlist_id.startswith("+"):
+        pl_name = ytmusic_playlist_id[1:]
+        ytmusic_playlist_id = get_playlist_id_by_name(yt, pl_name)
+        events.message(f"Looking up playlist '{pl_name}': id={ytmusic_playlist_id}")
+        if ytmusic_playlist_id is None:
+            new_playlist = NewPlaylist(pl_name, pl_name, privacy_status)
+
+    return copier(
+        src_tracks,
+        ytmusic_playlist_id,
+        dry_run,
+        track_sleep,
+        yt_search_algo,
+        yt=yt,
+        lookup_max_calls=lookup_max_calls,
+        events=events,
+        new_playlist=new_playlist,
+        cancel=cancel,
+    )
+
+
+def ensure_playlist(
+    yt: YTMusic, pl_name: str, privacy_status: str, events: EventBus
+) -> str:
+    """The ID of the YTMusic playlist named `pl_name`, which is created if needed."""
+    dst_pl_id = get_playlist_id_by_name(yt, pl_name)
+    events.message(f"Looking up playlist '{pl_name}': id={dst_pl_id}")
+    if dst_pl_id is None:
+        dst_pl_id = _ytmusic_create_playlist(
+            yt, title=pl_name, description=pl_name, privacy_status=privacy_status
+        )
+
+        #  create_playlist returns a dict if there was an error
+        if isinstance(dst_pl_id, dict):
+            print(f"ERROR: Failed to create playlist: {dst_pl_id}")
+            sys.exit(1)
+        events.message(f"NOTE: Created playlist '{pl_name}' with ID: {dst_pl_id}")
+    return dst_pl_id
+
+
 def copy_all_playlists(
     track_sleep: float = 0.1,
     dry_run: bool = False,
@@ -500,45 +1167,77 @@ def copy_all_playlists(
     yt_search_algo: int = 0,
     reverse_playlist: bool = True,
     privacy_status: str = "PRIVATE",
-):
+    lookup_max_calls: int = DEFAULT_LOOKUP_MAX_CALLS,
+    *,
+    spotify_playlist_file: str = "playlists.json",
+    yt: Optional[YTMusic] = None,
+    events: Optional[EventBus] = None,
+    cancel: Optional[CancelToken] = None,
+    journal_file: Optional[str] = None,
+) -> List[PlaylistDone]:
     """
     Copy all Spotify playlists (except Liked Songs) to YTMusic playlists
+
+    Each finished playlist is appended to `journal_file`, if given, and the
+    playlists recorded there without errors are skipped, as with
+    `sharding.copy_all_playlists_sharded`.  `cancel` is checked between playlists
+    and passed to `copier`; once cancelled, no further playlist is started.
+
+    Returns the `PlaylistDone` event of each playlist copied.
     """
-    spotify_pls = load_playlists_json()
-    yt = get_ytmusic()
+    from .sharding import append_journal, journal_record, read_journal
+
+    if events is None:
+        events = bus
+    spotify_pls = load_playlists_json(spotify_playlist_file, spotify_playlists_encoding)
+    if yt is None:
+        yt = get_ytmusic()
+    finished = read_journal(journal_file) if journal_file else {}
+    if finished:
+        events.message(
+            f"Skipping {len(finished)} playlists already done in {journal_file}"
+        )
+    results = []
 
     for src_pl in spotify_pls["playlists"]:
         if str(src_pl.get("name")) == "Liked Songs":
             continue
+        if src_pl.get("id") in finished:
+            continue
+        if cancel is not None:
+            try:
+                cancel.check()
+            except Cancelled:
+                break
 
         pl_name = src_pl["name"]
         if pl_name == "":
             pl_name = f"Unnamed Spotify Playlist {src_pl['id']}"
 
         dst_pl_id = get_playlist_id_by_name(yt, pl_name)
-        print(f"Looking up playlist '{pl_name}': id={dst_pl_id}")
-        if dst_pl_id is None:
-            dst_pl_id = _ytmusic_create_playlist(
-                yt, title=pl_name, description=pl_name, privacy_status=privacy_status
-            )
+        events.message(f"Looking up playlist '{pl_name}': id={dst_pl_id}")
 
-            #  create_playlist returns a dict if there was an error
-            if isinstance(dst_pl_id, dict):
-                print(f"ERROR: Failed to create playlist: {dst_pl_id}")
-                sys.exit(1)
-            print(f"NOTE: Created playlist '{pl_name}' with ID: {dst_pl_id}")
-
-        copier(
-            iter_spotify_playlist(
-                src_pl["id"],
-                spotify_encoding=spotify_playlists_encoding,
-                reverse_playlist=reverse_playlist,
-            ),
+        done = copier(
+            _iter_playlist_tracks(src_pl, reverse_playlist, events),
             dst_pl_id,
             dry_run,
             track_sleep,
             yt_search_algo,
+            yt=yt,
+            lookup_max_calls=lookup_max_calls,
+            events=events,
+            new_playlist=NewPlaylist(pl_name, pl_name, privacy_status),
+            cancel=cancel,
         )
-        print("\nPlaylist done!\n")
-
-    print("All done!")
+        results.append(done)
+        if journal_file:
+            append_journal(journal_file, journal_record(src_pl["id"], pl_name, done))
+        if done.cancelled:
+            break
+        events.message("\nPlaylist done!\n")
+
+    if cancel is not None and cancel.cancelled:
+        events.message(f"Cancelled after {len(results)} playlists.")
+    else:
+        events.message("All done!")
+    return results
@@ -0,0 +1,534 @@
+#!/usr/bin/env python3
+
+"""Offline copy throughput benchmarks, run against `fake_ytmusic`."""
+
+import contextlib
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from argparse import ArgumentParser
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional
+
+from . import backend
+from .fake_ytmusic import FakeCatalog, FakeYTMusic, HTTPYTMusic, LatencyModel, serve
+from .profiling import profiled
+
+SCENARIOS = ("copier", "copy_playlist", "copy_all_playlists")
+
+#  Modules that must not be imported just to start a command that doesn't need them
+HEAVY_MODULES = ("ytmusicapi", "requests", "tkinter")
+
+_IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from spotify2ytmusic.commands import resolve
+resolve(sys.argv[1])
+print(json.dumps({
+    "seconds": time.perf_counter() - start,
+    "heavy": [m for m in sys.argv[2:] if m in sys.modules],
+}))
+"""
+
+#  The file handling paths measured by `file_benchmark`
+FILE_OPERATIONS = (
+    "load_playlists_json",
+    "iter_spotify_playlist",
+    "iter_spotify_liked_albums",
+    "reverse_playlist",
+    "write_to_file",
+    "write_to_file_compact",
+)
+
+_FILE_PROBE = """
+import json, sys, time
+from spotify2ytmusic import jsoncodec
+from spotify2ytmusic.bench import file_operation, peak_rss_mb
+run = file_operation(*sys.argv[1:])
+baseline = peak_rss_mb()
+start = time.perf_counter()
+run()
+print(json.dumps({
+    "codec": jsoncodec.name,
+    "seconds": time.perf_counter() - start,
+    "peak_rss_mb": peak_rss_mb(),
+    "baseline_rss_mb": baseline,
+}))
+"""
+
+_WORDS = (
+    "night day love heart fire rain blue gold city river dream light shadow "
+    "road home wild star echo storm glass ocean paper silver summer winter"
+).split()
+
+
+def synthetic_backup(
+    n_tracks: int, n_playlists: int = 1, seed: int = 0, prefix: str = ""
+) -> Dict:
+    """A `playlists.json` backup with `n_tracks` tracks spread over `n_playlists` playlists."""
+    rnd = random.Random(seed)
+    playlists = []
+    per_playlist, extra = divmod(n_tracks, n_playlists)
+    for p in range(n_playlists):
+        tracks = []
+        for t in range(per_playlist + (1 if p < extra else 0)):
+            artist = f"{prefix}Artist {rnd.randrange(max(1, n_tracks // 20))}"
+            album = f"{rnd.choice(_WORDS).title()} {rnd.choice(_WORDS).title()}"
+            name = f"{' '.join(rnd.sample(_WORDS, 3)).title()} {p}.{t}"
+            tracks.append(
+                {
+                    "track": {
+                        "name": name,
+                        "artists": [{"name": artist}],
+                        "album": {"name": album, "release_date": "2001-01-01"},
+                        "uri": f"spotify:track:{seed}x{p}x{t}",
+                    }
+                }
+            )
+        playlists.append(
+            {"id": f"{prefix}pl{p}", "name": f"{prefix}Playlist {p}", "tracks": tracks}
+        )
+    return {"playlists": playlists, "albums": []}
+
+
+class _TimedClient:
+    """Counts and times every call made through it, as seen by the client."""
+
+    def __init__(self, yt) -> None:
+        self._yt = yt
+        self.calls = 0
+        self.latencies: List[float] = []
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        method = getattr(self._yt, name)
+        if not callable(method):
+            return method
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.calls += 1
+                    self.latencies.append(elapsed)
+
+        return timed
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+@dataclass
+class BenchResult:
+    scenario: str
+    size: int
+    concurrency: int
+    seconds: float
+    api_calls: int
+    tracks_per_sec: float
+    calls_per_track: float
+    p50_ms: float
+    p95_ms: float
+
+
+def run_scenario(
+    scenario: str,
+    size: int,
+    concurrency: int,
+    latency: LatencyModel,
+    use_http: bool = False,
+    playlist_size: int = 50,
+) -> BenchResult:
+    """Copy a synthetic library of `size` tracks, split over `concurrency` parallel jobs."""
+    per_job = max(1, size // concurrency)
+    n_playlists = 1
+    if scenario == "copy_all_playlists":
+        n_playlists = max(1, per_job // playlist_size)
+    backups = [
+        synthetic_backup(per_job, n_playlists, seed=job, prefix=f"J{job} ")
+        for job in range(concurrency)
+    ]
+
+    catalog = FakeCatalog()
+    for data in backups:
+        for pl in data["playlists"]:
+            for item in pl["tracks"]:
+                track = item["track"]
+                catalog.add(
+                    backend.SongInfo(
+                        track["name"],
+                        track["artists"][0]["name"],
+                        track["album"]["name"],
+                    )
+                )
+    fake = FakeYTMusic(catalog, latency)
+    server = None
+    client = fake
+    if use_http:
+        server = serve(fake)
+        client = HTTPYTMusic("http://%s:%d" % server.server_address)
+    timed = _TimedClient(client)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        files = []
+        for job, data in enumerate(backups):
+            filename = os.path.join(tmpdir, f"playlists{job}.json")
+            with open(filename, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            files.append(filename)
+
+        def job(n: int) -> None:
+            filename = files[n]
+            pl_id = backups[n]["playlists"][0]["id"]
+            if scenario == "copier":
+                dst_pl_id = fake.create_playlist(f"J{n} copier", "")
+                backend.copier(
+                    backend.iter_spotify_playlist(
+                        pl_id, spotify_playlist_file=filename
+                    ),
+                    dst_pl_id,
+                    track_sleep=0,
+                    yt=timed,
+                )
+            elif scenario == "copy_playlist":
+                backend.copy_playlist(
+                    pl_id,
+                    f"+J{n} copy_playlist",
+                    track_sleep=0,
+                    spotify_playlist_file=filename,
+                    yt=timed,
+                )
+            else:
+                backend.copy_all_playlists(
+                    track_sleep=0, spotify_playlist_file=filename, yt=timed
+                )
+
+        threads = [threading.Thread(target=job, args=(n,)) for n in range(concurrency)]
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            for th in threads:
+                th.start()
+            for th in threads:
+                th.join()
+            elapsed = time.perf_counter() - start
+
+    if server is not None:
+        server.shutdown()
+
+    tracks = per_job * concurrency
+    return BenchResult(
+        scenario=scenario,
+        size=tracks,
+        concurrency=concurrency,
+        seconds=elapsed,
+        api_calls=timed.calls,
+        tracks_per_sec=tracks / elapsed if elapsed else 0.0,
+        calls_per_track=timed.calls / tracks,
+        p50_ms=_percentile(timed.latencies, 50) * 1000,
+        p95_ms=_percentile(timed.latencies, 95) * 1000,
+    )
+
+
+@dataclass
+class FileBenchResult:
+    operation: str
+    codec: str
+    tracks: int
+    file_mb: float
+    seconds: float
+    peak_rss_mb: Optional[float]
+    baseline_rss_mb: Optional[float]
+
+
+def peak_rss_mb() -> Optional[float]:
+    """The peak resident set size of this process in MiB, None where unknown."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #  Bytes on macOS, KiB elsewhere
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def file_operation(operation: str, filename: str, workdir: str) -> Callable[[], None]:
+    """Set up `operation` on the backup `filename`, returns a function running it."""
+    from . import spotify_backup
+    from .events import EventBus
+    from .reverse_playlist import reverse_playlist
+
+    quiet = EventBus()
+    if operation == "load_playlists_json":
+        return lambda: backend.load_playlists_json(filename)
+    if operation == "iter_spotify_playlist":
+        return lambda: sum(
+            1
+            for _ in backend.iter_spotify_playlist(
+                None, spotify_playlist_file=filename, events=quiet
+            )
+        )
+    if operation == "iter_spotify_liked_albums":
+        return lambda: sum(1 for _ in backend.iter_spotify_liked_albums(filename))
+    if operation == "reverse_playlist":
+        return lambda: reverse_playlist(
+            filename,
+            verbose=False,
+            replace=True,
+            output_file=os.path.join(workdir, "reversed.json"),
+        )
+    if operation in ("write_to_file", "write_to_file_compact"):
+        data = backend.load_playlists_json(filename)
+        spotify_backup.bus = quiet
+        return lambda: spotify_backup.write_to_file(
+            os.path.join(workdir, "written.json"),
+            "json",
+            data["playlists"],
+            data["albums"],
+            compact=operation == "write_to_file_compact",
+        )
+    raise ValueError(f"Unknown operation: {operation}")
+
+
+def generate_backup(filename: str, tracks: int, seed: int = 0) -> None:
+    """Write a synthetic backup of `tracks` tracks with `s2yt synth`.
+
+    In a separate process, as the peak RSS of a process carries over to the
+    processes it starts.
+    """
+    subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            f"{__package__}.synth",
+            "--tracks",
+            str(tracks),
+            "--seed",
+            str(seed),
+            "--output",
+            filename,
+        ],
+        check=True,
+    )
+
+
+def file_benchmark(
+    operation: str,
+    tracks: int,
+    filename: str,
+    workdir: str,
+    codec: Optional[str] = None,
+) -> FileBenchResult:
+    """Time `operation` on the backup `filename`, in a fresh interpreter so its peak
+    RSS is its own.
+
+    `codec` "stdlib" forces the `json` module, otherwise `jsoncodec` picks orjson
+    if it is installed.
+    """
+    env = dict(os.environ)
+    if codec is not None:
+        env["S2YT_JSON"] = codec
+    out = subprocess.run(
+        [sys.executable, "-c", _FILE_PROBE, operation, filename, workdir],
+        check=True,
+        capture_output=True,
+        text=True,
+        env=env,
+    ).stdout
+    result = json.loads(out.splitlines()[-1])
+    return FileBenchResult(
+        operation=operation,
+        tracks=tracks,
+        file_mb=os.path.getsize(filename) / 2**20,
+        **result,
+    )
+
+
+def import_time(command: str, repeat: int = 5) -> Dict:
+    """Time resolving `command` in a fresh interpreter, the best of `repeat` runs.
+
+    Also reports which of `HEAVY_MODULES` were imported by doing so.
+    """
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", _IMPORT_PROBE, command, *HEAVY_MODULES],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        runs.append(json.loads(out))
+    return {
+        "command": command,
+        "import_ms": min(run["seconds"] for run in runs) * 1000,
+        "heavy_modules": runs[0]["heavy"],
+    }
+
+
+@profiled
+def main():
+    """Run the copy throughput benchmarks and print a report."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        help=f"Comma separated scenarios to run (default: {','.join(SCENARIOS)})",
+    )
+    parser.add_argument(
+        "--sizes",
+        default="100,1000",
+        help="Comma separated library sizes, in tracks (default: 100,1000)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        default="1,4",
+        help="Comma separated numbers of parallel copy jobs (default: 1,4)",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Simulated latency of each API call in seconds (default: 0)",
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0.0,
+        help="Random +/- variation of the latency in seconds (default: 0)",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Probability that an API call fails (default: 0)",
+    )
+    parser.add_argument(
+        "--throttle-rate",
+        type=float,
+        default=0.0,
+        help="Probability that an API call fails with HTTP 429 (default: 0)",
+    )
+    parser.add_argument(
+        "--http",
+        action="store_true",
+        help="Serve the fake YTMusic over a local HTTP server instead of in-process",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed for the latency model (default: 0)"
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="Output results as JSON lines"
+    )
+    parser.add_argument(
+        "--import-time",
+        action="store_true",
+        help="Instead, measure the time each `s2yt` command takes to import",
+    )
+    parser.add_argument(
+        "--files",
+        action="store_true",
+        help="Instead, measure the time and peak memory of reading and writing backups "
+        "of --file-sizes tracks, generated with `s2yt synth`",
+    )
+    parser.add_argument(
+        "--file-sizes",
+        default="1000,100000",
+        help="Comma separated backup sizes for --files, in tracks (default: 1000,100000)",
+    )
+    parser.add_argument(
+        "--codecs",
+        default="stdlib,orjson",
+        help="Comma separated JSON libraries to compare with --files (default: "
+        "stdlib,orjson, orjson is skipped if it is not installed)",
+    )
+    parser.add_argument(
+        "--operations",
+        default=",".join(FILE_OPERATIONS),
+        help=f"Comma separated operations for --files (default: {','.join(FILE_OPERATIONS)})",
+    )
+    args = parser.parse_args()
+
+    if args.files:
+        if not args.json:
+            print(
+                f"{'operation':26} {'codec':7} {'tracks':>8} {'file MiB':>9} {'seconds':>8} "
+                f"{'peak MiB':>9} {'base MiB':>9}"
+            )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for size in [int(x) for x in args.file_sizes.split(",")]:
+                filename = os.path.join(tmpdir, f"playlists{size}.json")
+                generate_backup(filename, size, args.seed)
+                for operation in args.operations.split(","):
+                    for codec in args.codecs.split(","):
+                        result = file_benchmark(
+                            operation, size, filename, tmpdir, codec
+                        )
+                        if result.codec != codec:
+                            continue  # orjson is not installed
+                        if args.json:
+                            print(json.dumps(asdict(result)), flush=True)
+                        else:
+                            print(
+                                f"{result.operation:26} {result.codec:7} {result.tracks:8} "
+                                f"{result.file_mb:9.1f} {result.seconds:8.2f} "
+                                f"{result.peak_rss_mb or 0:9.1f} "
+                                f"{result.baseline_rss_mb or 0:9.1f}",
+                                flush=True,
+                            )
+        return
+
+    if args.import_time:
+        from .commands import COMMANDS
+
+        for command in COMMANDS:
+            result = import_time(command)
+            if args.json:
+                print(json.dumps(result), flush=True)
+            else:
+                print(
+                    f"{command:20} {result['import_ms']:8.1f} ms  "
+                    f"{' '.join(result['heavy_modules'])}",
+                    flush=True,
+                )
+        return
+
+    if not args.json:
+        print(
+            f"{'scenario':20} {'tracks':>8} {'conc':>5} {'tracks/s':>10} "
+            f"{'calls/trk':>10} {'p50 ms':>8} {'p95 ms':>8}"
+        )
+    for scenario in args.scenarios.split(","):
+        for size in [int(x) for x in args.sizes.split(",")]:
+            for concurrency in [int(x) for x in args.concurrency.split(",")]:
+                latency = LatencyModel(
+                    args.latency,
+                    args.jitter,
+                    args.error_rate,
+                    args.throttle_rate,
+                    seed=args.seed,
+                )
+                result = run_scenario(scenario, size, concurrency, latency, args.http)
+                if args.json:
+                    print(json.dumps(asdict(result)), flush=True)
+                else:
+                    print(
+                        f"{result.scenario:20} {result.size:8} {result.concurrency:5} "
+                        f"{result.tracks_per_sec:10.1f} {result.calls_per_track:10.2f} "
+                        f"{result.p50_ms:8.2f} {result.p95_ms:8.2f}",
+                        flush=True,
+                    )
+
+
+if __name__ == "__main__":
+    main()
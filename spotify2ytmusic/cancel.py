@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+"""Cooperative cancellation and pausing of long running jobs.
+
+A `CancelToken` is handed to `backend.copier`, `backend.copy_all_playlists` or
+`spotify_backup.fetch_user_data`, which check it between tracks, playlists and
+pages.  Pausing holds the job at its next check, cancelling stops it there: the
+tracks already looked up are still written, and the finished playlists recorded,
+so nothing that was done is lost.  Any thread may pause, resume or cancel.
+"""
+
+import threading
+from typing import Optional
+
+
+class Cancelled(BaseException):
+    """Raised by `CancelToken.check()` once the job is cancelled.
+
+    Not an `Exception`, like `KeyboardInterrupt`, so the handlers that skip a
+    failed track or playlist don't swallow it.
+    """
+
+
+class CancelToken:
+    """Lets one thread pause, resume or cancel a job running in another."""
+
+    def __init__(self) -> None:
+        self._cancelled = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self) -> bool:
+        return not self._running.is_set()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+        #  A paused job must wake up to notice
+        self._running.set()
+
+    def pause(self) -> None:
+        if not self.cancelled:
+            self._running.clear()
+
+    def resume(self) -> None:
+        self._running.set()
+
+    def check(self) -> None:
+        """Wait while the job is paused, then raise `Cancelled` if it was cancelled."""
+        self._running.wait()
+        if self.cancelled:
+            raise Cancelled()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Sleep for `timeout` seconds, or less if cancelled, returns whether it was."""
+        return self._cancelled.wait(timeout)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+"""Record the YTMusic and Spotify API calls of a run, and replay them offline.
+
+A cassette is a gzipped JSONL file, one line per call: the API, the method (the
+YTMusic method, or the Spotify URL), its arguments, and what it returned or raised,
+with how long it took.  Replaying a cassette answers the same calls in the same
+order without network access, either taking as long as they did when recorded or
+returning at once, so a migration can be re-run as a deterministic test or
+benchmark.
+"""
+
+import gzip
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Optional
+
+RECORD = "record"
+REPLAY = "replay"
+LATENCY_MODES = ("recorded", "none")
+
+#  The cassette in use by `backend.get_ytmusic()` and `SpotifyAPI`, see `use()`
+active: Optional["Cassette"] = None
+
+
+class CassetteMiss(LookupError):
+    """A call that was not recorded on the cassette being replayed."""
+
+
+class ReplayedError(Exception):
+    """An exception that was raised by the API when the cassette was recorded."""
+
+
+def _key(api: str, method: str, args: tuple, kwargs: Dict) -> str:
+    return json.dumps(
+        [api, method, list(args), kwargs],
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+
+
+class Cassette:
+    """Records calls to `filename`, or replays the calls recorded in it.
+
+    When replaying, calls with the same arguments are answered in the order they
+    were recorded, and the last answer is repeated if they are made more often.
+    With `latency="recorded"` each answer takes as long as the recorded call did.
+    """
+
+    def __init__(
+        self, filename: str, mode: str = REPLAY, latency: str = "recorded"
+    ) -> None:
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        if latency not in LATENCY_MODES:
+            raise ValueError(f"Unknown cassette latency: {latency}")
+        self.filename = filename
+        self.mode = mode
+        self.latency = latency
+        self.calls = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._tape: Dict[str, Deque[Dict]] = {}
+        self._file = None
+        if mode == RECORD:
+            self._file = gzip.open(filename, "wt", encoding="utf-8")
+        else:
+            with gzip.open(filename, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        key = _key(
+                            entry["api"],
+                            entry["method"],
+                            entry["args"],
+                            entry["kwargs"],
+                        )
+                        self._tape.setdefault(key, deque()).append(entry)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == REPLAY
+
+    def call(self, api: str, method: str, args: tuple, kwargs: Dict, func: Callable):
+        """Make the call with `func()` and record it, or answer it from the cassette."""
+        if self.replaying:
+            return self._replay(api, method, args, kwargs)
+
+        start = time.perf_counter()
+        entry = {"api": api, "method": method, "args": list(args), "kwargs": kwargs}
+        try:
+            entry["result"] = func()
+            return entry["result"]
+        except Exception as e:
+            entry["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            entry["seconds"] = round(time.perf_counter() - start, 6)
+            line = json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+            with self._lock:
+                self.calls += 1
+                self._file.write(line)
+
+    def _replay(self, api: str, method: str, args: tuple, kwargs: Dict):
+        key = _key(api, method, args, kwargs)
+        with self._lock:
+            self.calls += 1
+            answers = self._tape.get(key)
+            if not answers:
+                self.misses += 1
+                raise CassetteMiss(
+                    f"No recorded {api} call {method}{tuple(args)} {kwargs}"
+                )
+            entry = answers.popleft() if len(answers) > 1 else answers[0]
+        if self.latency == "recorded":
+            time.sleep(entry.get("seconds", 0))
+        if entry.get("error") is not None:
+            raise ReplayedError(entry["error"])
+        return entry.get("result")
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "Cassette":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class CassetteYTMusic:
+    """Wraps a YTMusic client, recording its method calls on `cassette`.
+
+    When replaying, `yt` is not used and may be None.
+    """
+
+    def __init__(self, yt, cassette: Cassette) -> None:
+        self._yt = yt
+        self._cassette = cassette
+
+    def __getattr__(self, name: str):
+        if self._cassette.replaying:
+            if name.startswith("_"):
+                raise AttributeError(name)
+            method = None
+        else:
+            method = getattr(self._yt, name)
+            if name.startswith("_") or not callable(method):
+                return method
+
+        def recorded(*args, **kwargs):
+            return self._cassette.call(
+                "ytmusic", name, args, kwargs, lambda: method(*args, **kwargs)
+            )
+
+        return recorded
+
+
+@contextmanager
+def use(cassette: Optional[Cassette]):
+    """Make `cassette` the one used by new YTMusic clients and by `SpotifyAPI`."""
+    global active
+    previous = active
+    active = cassette
+    try:
+        yield cassette
+    finally:
+        active = previous
+        if cassette is not None:
+            cassette.close()
+
+
+def from_args(args) -> Optional[Cassette]:
+    """The cassette selected by `--record` or `--replay` on the command line, if any."""
+    if getattr(args, "record", None):
+        return Cassette(args.record, RECORD)
+    if getattr(args, "replay", None):
+        return Cassette(args.replay, REPLAY, args.replay_latency)
+    return None
+
+
+def add_arguments(parser) -> None:
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument(
+        "--record",
+        metavar="CASSETTE",
+        help="Record the YTMusic and Spotify API calls to CASSETTE (gzipped JSONL)",
+    )
+    group.add_argument(
+        "--replay",
+        metavar="CASSETTE",
+        help="Answer the YTMusic and Spotify API calls from CASSETTE, offline",
+    )
+    parser.add_argument(
+        "--replay-latency",
+        choices=LATENCY_MODES,
+        default="recorded",
+        help="With --replay, take as long as the recorded calls did, or no time at all "
+        "(default: recorded)",
+    )
@@ -5,8 +5,12 @@ from argparse import ArgumentParser
 import pprint
 
 from . import backend
+from . import reporting
+from .likes import DEFAULT_LIKE_RATE, DEFAULT_LIKE_WORKERS, LikeWriter
+from .profiling import profiled
 
 
+@profiled
 def list_liked_albums():
     """
     List albums that have been liked.
@@ -15,6 +19,7 @@ def list_liked_albums():
         print(f"{song.album} - {song.artist} - {song.title}")
 
 
+@profiled
 def list_playlists():
     """
     List the playlists on Spotify and YTMusic
@@ -36,6 +41,7 @@ def list_playlists():
         print(f"{pl['playlistId']} - {pl['title']:40} ({pl.get('count', '?')} tracks)")
 
 
+@profiled
 def create_playlist():
     """
     Create a YTMusic playlist
@@ -61,6 +67,7 @@ def create_playlist():
     backend.create_playlist(args.playlist_name, privacy_status=args.privacy)
 
 
+@profiled
 def search():
     """Search for a track on ytmusic"""
 
@@ -87,27 +94,43 @@ def search():
             default=0,
             help="Algorithm to use for search (0 = exact, 1 = extended, 2 = approximate)",
         )
+        parser.add_argument(
+            "--max-calls",
+            type=int,
+            default=backend.DEFAULT_LOOKUP_MAX_CALLS,
+            help="Maximum number of YTMusic API calls to spend looking up each track "
+            f"(default: {backend.DEFAULT_LOOKUP_MAX_CALLS})",
+        )
+        reporting.add_arguments(parser)
         return parser.parse_args()
 
     args = parse_arguments()
+    with reporting.use(args):
+        yt = backend.get_ytmusic()
+        details = backend.ResearchDetails()
+        ret = backend.lookup_song(
+            yt,
+            args.track_name,
+            args.artist,
+            args.album,
+            args.algo,
+            details=details,
+            max_calls=args.max_calls,
+        )
 
-    yt = backend.get_ytmusic()
-    details = backend.ResearchDetails()
-    ret = backend.lookup_song(
-        yt, args.track_name, args.artist, args.album, args.algo, details=details
-    )
-
-    print(f"Query: '{details.query}'")
-    print("Selected song:")
-    pprint.pprint(ret)
-    print()
-    print(f"Search Suggestions: '{details.suggestions}'")
-    if details.songs:
-        print("Top 5 songs returned from search:")
-        for song in details.songs[:5]:
-            pprint.pprint(song)
+        print(f"Query: '{details.query}'")
+        print(f"Lookup steps: {', '.join(details.steps)} ({details.calls} API calls)")
+        print("Selected song:")
+        pprint.pprint(ret)
+        print()
+        print(f"Search Suggestions: '{details.suggestions}'")
+        if details.songs:
+            print("Top 5 songs returned from search:")
+            for song in details.songs[:5]:
+                pprint.pprint(song)
 
 
+@profiled
 def load_liked_albums():
     """
     Load the "Liked" albums from Spotify into YTMusic.  Spotify stores liked albums separately
@@ -138,24 +161,33 @@ def load_liked_albums():
             default=0,
             help="Algorithm to use for search (0 = exact, 1 = extended, 2 = approximate)",
         )
+        parser.add_argument(
+            "--max-calls",
+            type=int,
+            default=backend.DEFAULT_LOOKUP_MAX_CALLS,
+            help="Maximum number of YTMusic API calls to spend looking up each track "
+            f"(default: {backend.DEFAULT_LOOKUP_MAX_CALLS})",
+        )
+
+        reporting.add_arguments(parser)
 
         return parser.parse_args()
 
     args = parse_arguments()
-
-    spotify_pls = backend.load_playlists_json()
-
-    backend.copier(
-        backend.iter_spotify_liked_albums(
-            spotify_encoding=args.spotify_playlists_encoding
-        ),
-        None,
-        args.dry_run,
-        args.track_sleep,
-        args.algo,
-    )
+    with reporting.use(args):
+        backend.copier(
+            backend.iter_spotify_liked_albums(
+                spotify_encoding=args.spotify_playlists_encoding
+            ),
+            None,
+            args.dry_run,
+            args.track_sleep,
+            args.algo,
+            lookup_max_calls=args.max_calls,
+        )
 
 
+@profiled
 def load_liked():
     """
     Load the "Liked Songs" playlist from Spotify into YTMusic.
@@ -185,30 +217,72 @@ def load_liked():
             default=0,
             help="Algorithm to use for search (0 = exact, 1 = extended, 2 = approximate)",
         )
+        parser.add_argument(
+            "--max-calls",
+            type=int,
+            default=backend.DEFAULT_LOOKUP_MAX_CALLS,
+            help="Maximum number of YTMusic API calls to spend looking up each track "
+            f"(default: {backend.DEFAULT_LOOKUP_MAX_CALLS})",
+        )
         parser.add_argument(
             "--reverse-playlist",
             action="store_true",
             help="Reverse playlist on load, normally this is not set for liked songs as "
-            "they are added in the opposite order from other commands in this program.",
+            "they are added in the opposite order from other commands in this program.  "
+            "Implies --preserve-order.",
+        )
+        parser.add_argument(
+            "--like-workers",
+            type=int,
+            default=DEFAULT_LIKE_WORKERS,
+            help=f"Number of songs to like at once (default: {DEFAULT_LIKE_WORKERS})",
+        )
+        parser.add_argument(
+            "--like-rate",
+            type=float,
+            default=DEFAULT_LIKE_RATE,
+            help=f"Maximum number of songs to like per second, 0 for no limit "
+            f"(default: {DEFAULT_LIKE_RATE})",
+        )
+        parser.add_argument(
+            "--preserve-order",
+            action="store_true",
+            help="Like the songs one at a time, so they are ordered as in the backup",
         )
 
+        reporting.add_arguments(parser)
+
         return parser.parse_args()
 
     args = parse_arguments()
-
-    backend.copier(
-        backend.iter_spotify_playlist(
-            None,
-            spotify_encoding=args.spotify_playlists_encoding,
-            reverse_playlist=args.reverse_playlist,
-        ),
-        None,
-        args.dry_run,
-        args.track_sleep,
-        args.algo,
-    )
-
-
+    with reporting.use(args):
+        yt = backend.get_ytmusic()
+        like_writer = LikeWriter(
+            yt,
+            args.like_workers,
+            args.like_rate,
+            preserve_order=args.preserve_order or args.reverse_playlist,
+        )
+        try:
+            backend.copier(
+                backend.iter_spotify_playlist(
+                    None,
+                    spotify_encoding=args.spotify_playlists_encoding,
+                    reverse_playlist=args.reverse_playlist,
+                ),
+                None,
+                args.dry_run,
+                args.track_sleep,
+                args.algo,
+                yt=yt,
+                lookup_max_calls=args.max_calls,
+                like_writer=like_writer,
+            )
+        finally:
+            like_writer.close()
+
+
+@profiled
 def copy_playlist():
     """
     Copy a Spotify playlist to a YTMusic playlist
@@ -248,6 +322,13 @@ def copy_playlist():
             default=0,
             help="Algorithm to use for search (0 = exact, 1 = extended, 2 = approximate)",
         )
+        parser.add_argument(
+            "--max-calls",
+            type=int,
+            default=backend.DEFAULT_LOOKUP_MAX_CALLS,
+            help="Maximum number of YTMusic API calls to spend looking up each track "
+            f"(default: {backend.DEFAULT_LOOKUP_MAX_CALLS})",
+        )
         parser.add_argument(
             "--no-reverse-playlist",
             action="store_true",
@@ -260,20 +341,108 @@ def copy_playlist():
             help="The privacy seting of created playlists (PRIVATE, PUBLIC, UNLISTED, default PRIVATE)",
         )
 
+        reporting.add_arguments(parser)
+
         return parser.parse_args()
 
     args = parse_arguments()
-    backend.copy_playlist(
-        spotify_playlist_id=args.spotify_playlist_id,
-        ytmusic_playlist_id=args.ytmusic_playlist_id,
-        track_sleep=args.track_sleep,
-        dry_run=args.dry_run,
-        spotify_playlists_encoding=args.spotify_playlists_encoding,
-        reverse_playlist=not args.no_reverse_playlist,
-        privacy_status=args.privacy,
-    )
+    with reporting.use(args):
+        backend.copy_playlist(
+            spotify_playlist_id=args.spotify_playlist_id,
+            ytmusic_playlist_id=args.ytmusic_playlist_id,
+            track_sleep=args.track_sleep,
+            dry_run=args.dry_run,
+            spotify_playlists_encoding=args.spotify_playlists_encoding,
+            yt_search_algo=args.algo,
+            reverse_playlist=not args.no_reverse_playlist,
+            privacy_status=args.privacy,
+            lookup_max_calls=args.max_calls,
+        )
+
 
+@profiled
+def copy_tracks():
+    """
+    Copy the tracks of a TSV, CSV or JSONL file to a YTMusic playlist
+    """
+    from . import readers
 
+    def parse_arguments():
+        parser = ArgumentParser()
+        parser.add_argument(
+            "tracks_file",
+            help="The file to read the tracks from, '-' for standard input",
+        )
+        parser.add_argument(
+            "ytmusic_playlist_id",
+            type=str,
+            help="ID of the YTMusic playlist to copy to.  If this argument starts with a '+', it is asumed to be the playlist title rather than playlist ID, and if a playlist of that name is not found, it will be created (without the +).",
+        )
+        parser.add_argument(
+            "--format",
+            choices=readers.FORMATS,
+            help="The format of the tracks file: tsv (as written by spotify_backup), "
+            "csv (Exportify) or jsonl (default: by the file extension or contents)",
+        )
+        parser.add_argument(
+            "--playlist",
+            help="Only copy the tracks of this playlist of a tsv file",
+        )
+        parser.add_argument(
+            "--encoding",
+            default="utf-8",
+            help="The encoding of the tracks file (default: utf-8)",
+        )
+        parser.add_argument(
+            "--track-sleep",
+            type=float,
+            default=0.1,
+            help="Time to sleep between each track that is added (default: 0.1)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Do not add songs to destination playlist (default: False)",
+        )
+        parser.add_argument(
+            "--algo",
+            type=int,
+            default=0,
+            help="Algorithm to use for search (0 = exact, 1 = extended, 2 = approximate)",
+        )
+        parser.add_argument(
+            "--max-calls",
+            type=int,
+            default=backend.DEFAULT_LOOKUP_MAX_CALLS,
+            help="Maximum number of YTMusic API calls to spend looking up each track "
+            f"(default: {backend.DEFAULT_LOOKUP_MAX_CALLS})",
+        )
+        parser.add_argument(
+            "--privacy",
+            default="PRIVATE",
+            help="The privacy seting of created playlists (PRIVATE, PUBLIC, UNLISTED, default PRIVATE)",
+        )
+
+        reporting.add_arguments(parser)
+
+        return parser.parse_args()
+
+    args = parse_arguments()
+    with reporting.use(args):
+        backend.copy_tracks(
+            readers.iter_tracks(
+                args.tracks_file, args.format, args.encoding, args.playlist
+            ),
+            args.ytmusic_playlist_id,
+            dry_run=args.dry_run,
+            track_sleep=args.track_sleep,
+            yt_search_algo=args.algo,
+            privacy_status=args.privacy,
+            lookup_max_calls=args.max_calls,
+        )
+
+
+@profiled
 def copy_all_playlists():
     """
     Copy all Spotify playlists (except Liked Songs) to YTMusic playlists
@@ -303,6 +472,13 @@ def copy_all_playlists():
             default=0,
             help="Algorithm to use for search (0 = exact, 1 = extended, 2 = approximate)",
         )
+        parser.add_argument(
+            "--max-calls",
+            type=int,
+            default=backend.DEFAULT_LOOKUP_MAX_CALLS,
+            help="Maximum number of YTMusic API calls to spend looking up each track "
+            f"(default: {backend.DEFAULT_LOOKUP_MAX_CALLS})",
+        )
         parser.add_argument(
             "--no-reverse-playlist",
             action="store_true",
@@ -314,19 +490,67 @@ def copy_all_playlists():
             default="PRIVATE",
             help="The privacy seting of created playlists (PRIVATE, PUBLIC, UNLISTED, default PRIVATE)",
         )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=1,
+            help="Copy playlists in this many worker processes, largest first (default: 1)",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=0.0,
+            help="With --processes, the YTMusic API calls per second allowed over all "
+            "workers, 0 for no limit (default: 0)",
+        )
+        parser.add_argument(
+            "--journal",
+            metavar="FILE",
+            help="Record each finished playlist in FILE, and skip the playlists it "
+            "records as done, to resume an interrupted copy",
+        )
 
-        return parser.parse_args()
+        reporting.add_arguments(parser)
+
+        args = parser.parse_args()
+        if (args.processes > 1 or args.journal) and (args.trace or args.record):
+            parser.error(
+                "--trace and --record can't be used with --processes or --journal, "
+                "which copy the playlists in worker processes"
+            )
+        return args
 
     args = parse_arguments()
-    backend.copy_all_playlists(
-        track_sleep=args.track_sleep,
-        dry_run=args.dry_run,
-        spotify_playlists_encoding=args.spotify_playlists_encoding,
-        reverse_playlist=not args.no_reverse_playlist,
-        privacy_status=args.privacy,
-    )
+    with reporting.use(args):
+        if args.processes > 1 or args.journal:
+            from .sharding import copy_all_playlists_sharded
+
+            copy_all_playlists_sharded(
+                args.processes,
+                track_sleep=args.track_sleep,
+                dry_run=args.dry_run,
+                spotify_playlists_encoding=args.spotify_playlists_encoding,
+                yt_search_algo=args.algo,
+                reverse_playlist=not args.no_reverse_playlist,
+                privacy_status=args.privacy,
+                lookup_max_calls=args.max_calls,
+                rate=args.rate,
+                journal_file=args.journal,
+                output=args.output,
+            )
+            return
+        backend.copy_all_playlists(
+            track_sleep=args.track_sleep,
+            dry_run=args.dry_run,
+            spotify_playlists_encoding=args.spotify_playlists_encoding,
+            yt_search_algo=args.algo,
+            reverse_playlist=not args.no_reverse_playlist,
+            privacy_status=args.privacy,
+            lookup_max_calls=args.max_calls,
+        )
 
 
+@profiled
 def gui():
     """
     Run the Spotify2YTMusic GUI.
@@ -336,6 +560,7 @@ def gui():
     gui.main()
 
 
+@profiled
 def ytoauth():
     """
     Run the "ytmusicapi oauth" login.
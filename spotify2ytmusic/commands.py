@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+"""The `s2yt` command dispatcher.
+
+Commands are listed here by name, as "module:function" strings, and their module is
+only imported when the command is run.  `s2yt list_liked_albums` therefore never
+imports ytmusicapi, and `s2yt` without arguments imports nothing but this module.
+"""
+
+import importlib
+import os
+import sys
+from typing import Callable, Dict, Tuple
+
+#  name: (entry point, one line description)
+COMMANDS: Dict[str, Tuple[str, str]] = {
+    "list_liked_albums": (
+        "cli:list_liked_albums",
+        "List the liked albums in the Spotify backup",
+    ),
+    "list_playlists": ("cli:list_playlists", "List the Spotify and YTMusic playlists"),
+    "create_playlist": ("cli:create_playlist", "Create a YTMusic playlist"),
+    "search": ("cli:search", "Look up a song on YTMusic"),
+    "load_liked_albums": (
+        "cli:load_liked_albums",
+        "Copy the Spotify liked albums to YTMusic",
+    ),
+    "load_liked": ("cli:load_liked", "Copy the Spotify liked songs to YTMusic"),
+    "copy_playlist": ("cli:copy_playlist", "Copy a Spotify playlist to YTMusic"),
+    "copy_all_playlists": (
+        "cli:copy_all_playlists",
+        "Copy all Spotify playlists to YTMusic",
+    ),
+    "copy_tracks": (
+        "cli:copy_tracks",
+        "Copy the tracks of a TSV, CSV or JSONL file to YTMusic",
+    ),
+    "ytoauth": ("cli:ytoauth", "Set up the YTMusic OAuth credentials"),
+    "reverse_playlist": (
+        "reverse_playlist:main",
+        "Reverse the track order of backed up playlists",
+    ),
+    "plan": (
+        "plan:plan",
+        "Look up tracks and write a plan file, without writing to YTMusic",
+    ),
+    "apply": ("plan:apply", "Create the playlists and add the tracks of a plan file"),
+    "daemon": ("daemon:main", "Watch the Spotify backup and sync changed playlists"),
+    "runner": (
+        "runner:main",
+        "Run migration jobs for many accounts over a local HTTP API",
+    ),
+    "gui": ("gui:main", "Run the graphical user interface"),
+    "bench": ("bench:main", "Run the offline copy throughput benchmarks"),
+    "synth": ("synth:main", "Write a synthetic Spotify backup for benchmarks"),
+}
+
+
+def resolve(name: str) -> Callable:
+    """Import and return the entry point of command `name`."""
+    module, _, function = COMMANDS[name][0].partition(":")
+    return getattr(importlib.import_module(f"{__package__}.{module}"), function)
+
+
+def usage() -> None:
+    print("usage: s2yt [--profile[=FILE]] COMMAND <ARGUMENTS>")
+    print("Available commands:")
+    for name, (_, description) in COMMANDS.items():
+        print(f"  {name:20} {description}")
+    print("For example, try 's2yt list_playlists'")
+
+
+def main() -> None:
+    # Force UTF-8 encoding on Windows
+    if sys.platform == "win32":
+        os.environ["PYTHONIOENCODING"] = "utf-8"
+        import io
+
+        sys.stdout = io.TextIOWrapper(
+            sys.stdout.buffer, encoding="utf-8", errors="replace"
+        )
+        sys.stderr = io.TextIOWrapper(
+            sys.stderr.buffer, encoding="utf-8", errors="replace"
+        )
+
+    # Global options (e.g. --profile) may come before the command, the command handles them
+    global_options = []
+    while len(sys.argv) > 1 and sys.argv[1].startswith("--profile"):
+        global_options.append(sys.argv.pop(1))
+
+    if len(sys.argv) < 2 or sys.argv[1] in ("-h", "--help"):
+        usage()
+        sys.exit(1)
+
+    if sys.argv[1] not in COMMANDS:
+        print(
+            f"ERROR: Unknown command '{sys.argv[1]}', see https://github.com/linsomniac/spotify_to_ytmusic"
+        )
+        print("Available commands: ", ", ".join(COMMANDS))
+        sys.exit(1)
+
+    fn = resolve(sys.argv[1])
+    sys.argv = sys.argv[1:] + global_options
+    fn()
+
+
+if __name__ == "__main__":
+    main()
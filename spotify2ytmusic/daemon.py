@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+
+"""Keep YTMusic in sync with a Spotify backup, as a long running process.
+
+`s2yt_daemon` authenticates with YTMusic once, then watches `playlists.json` (and
+optionally re-runs the Spotify backup on a schedule).  When the backup changes, only
+the playlists whose tracks changed are synced, and only their new tracks are looked
+up and added.  Lookups are cached in memory for the life of the process.
+
+What has been synced is kept in a state file, so a restarted daemon (or a single
+`--once` run from cron) picks up where the last one left off.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+from typing import Dict, List, Optional
+
+from . import backend
+from .events import EventBus, PlaylistDone, TrackResolved, TrackWritten, bus
+from .profiling import profiled
+
+LIKED_SONGS = "Liked Songs"
+
+
+def _track_key(song: backend.SongInfo) -> str:
+    return "\t".join(str(field) for field in song)
+
+
+def playlist_hash(tracks: List[backend.SongInfo]) -> str:
+    """A hash of the tracks of a playlist, in order."""
+    digest = hashlib.sha1()
+    for song in tracks:
+        digest.update(_track_key(song).encode("utf-8") + b"\n")
+    return digest.hexdigest()
+
+
+class SyncState:
+    """Per playlist: the hash of its tracks when last synced, and the synced tracks."""
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self.playlists: Dict[str, Dict] = {}
+        if os.path.exists(filename):
+            with open(filename, "r", encoding="utf-8") as f:
+                self.playlists = json.load(f).get("playlists", {})
+
+    def save(self) -> None:
+        tmp = f"{self.filename}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"playlists": self.playlists}, f, ensure_ascii=False)
+        os.replace(tmp, self.filename)
+
+
+class Daemon:
+    """Syncs the changed playlists of `spotify_playlist_file` to YTMusic through `yt`."""
+
+    def __init__(
+        self,
+        yt,
+        spotify_playlist_file: str = "playlists.json",
+        state_file: str = "s2yt_daemon_state.json",
+        *,
+        liked: bool = False,
+        dry_run: bool = False,
+        track_sleep: float = 0.1,
+        yt_search_algo: int = 0,
+        reverse_playlist: bool = True,
+        privacy_status: str = "PRIVATE",
+        lookup_max_calls: int = backend.DEFAULT_LOOKUP_MAX_CALLS,
+        spotify_encoding: str = "utf-8",
+    ) -> None:
+        self.yt = yt
+        self.spotify_playlist_file = spotify_playlist_file
+        self.state = SyncState(state_file)
+        self.liked = liked
+        self.dry_run = dry_run
+        self.track_sleep = track_sleep
+        self.yt_search_algo = yt_search_algo
+        self.reverse_playlist = reverse_playlist
+        self.privacy_status = privacy_status
+        self.lookup_max_calls = lookup_max_calls
+        self.spotify_encoding = spotify_encoding
+        self.lookup_cache: Dict = {}
+
+    def sync_playlist(self, src_pl: Dict) -> Optional[PlaylistDone]:
+        """Sync one Spotify playlist, returns None if it has not changed."""
+        is_liked = str(src_pl.get("name")) == LIKED_SONGS
+        key = "liked" if is_liked else str(src_pl["id"])
+        quiet = EventBus()
+        tracks = list(
+            backend._iter_playlist_tracks(
+                src_pl, self.reverse_playlist and not is_liked, quiet
+            )
+        )
+        digest = playlist_hash(tracks)
+        state = self.state.playlists.get(key, {})
+        if state.get("hash") == digest:
+            return None
+
+        pl_name = src_pl["name"] or f"Unnamed Spotify Playlist {src_pl['id']}"
+        bus.message(f"== Spotify Playlist: {pl_name}")
+        synced = set(state.get("synced", []))
+
+        dst_pl_id = None
+        if not is_liked:
+            dst_pl_id = state.get("ytmusic_playlist_id")
+            if dst_pl_id is not None and not self._playlist_exists(dst_pl_id):
+                bus.message(
+                    f"WARNING: YTMusic playlist {dst_pl_id} of '{pl_name}' is gone, "
+                    "it will be created again",
+                    "warning",
+                )
+                dst_pl_id = None
+                #  None of the tracks synced before are in the new playlist
+                synced = set()
+            #  A dry run looks the tracks up without creating the playlist
+            if dst_pl_id is None and not self.dry_run:
+                dst_pl_id = backend.ensure_playlist(
+                    self.yt, pl_name, self.privacy_status, bus
+                )
+        synced &= {_track_key(t) for t in tracks}
+        new_tracks = [t for t in tracks if _track_key(t) not in synced]
+
+        events = EventBus()
+        events.subscribe(bus.emit)
+
+        def record(event) -> None:
+            if isinstance(event, TrackWritten) or (
+                isinstance(event, TrackResolved) and event.duplicate
+            ):
+                synced.add(_track_key(event.track))
+
+        events.subscribe(record)
+        done = backend.copier(
+            iter(new_tracks),
+            dst_pl_id,
+            self.dry_run,
+            self.track_sleep,
+            self.yt_search_algo,
+            yt=self.yt,
+            lookup_max_calls=self.lookup_max_calls,
+            events=events,
+            lookup_cache=self.lookup_cache,
+        )
+        if not self.dry_run:
+            self.state.playlists[key] = {
+                "name": pl_name,
+                "ytmusic_playlist_id": dst_pl_id,
+                #  Retry the failed tracks on the next sync, even if nothing changed
+                "hash": digest if not done.errors else None,
+                "synced": sorted(synced),
+            }
+            self.state.save()
+        return done
+
+    def _playlist_exists(self, playlist_id: str) -> bool:
+        try:
+            self.yt.get_playlist(playlistId=playlist_id, limit=1)
+        except Exception:
+            return False
+        return True
+
+    def sync(self) -> List[PlaylistDone]:
+        """Sync every changed playlist."""
+        spotify_pls = backend.load_playlists_json(
+            self.spotify_playlist_file, self.spotify_encoding
+        )
+        results = []
+        for src_pl in spotify_pls["playlists"]:
+            if str(src_pl.get("name")) == LIKED_SONGS and not self.liked:
+                continue
+            done = self.sync_playlist(src_pl)
+            if done is not None:
+                results.append(done)
+        bus.message(f"Synced {len(results)} changed playlists")
+        return results
+
+    def watch(
+        self,
+        interval: float = 60,
+        backup=None,
+        backup_interval: float = 0,
+        stop: Optional[threading.Event] = None,
+    ) -> None:
+        """Sync whenever the backup file changes, checking every `interval` seconds.
+
+        If `backup` is given, it is called every `backup_interval` seconds to refresh
+        the backup file.  Runs until `stop` is set.
+        """
+        stop = stop or threading.Event()
+        last_mtime = None
+        last_backup = 0.0
+        while not stop.is_set():
+            if backup is not None and time.monotonic() - last_backup >= backup_interval:
+                last_backup = time.monotonic()
+                try:
+                    backup()
+                except (Exception, SystemExit) as e:
+                    bus.message(f"ERROR: Spotify backup failed: {e}", "error")
+            try:
+                mtime = os.stat(self.spotify_playlist_file).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if mtime is not None and mtime != last_mtime:
+                try:
+                    self.sync()
+                    last_mtime = mtime
+                except (Exception, SystemExit) as e:
+                    bus.message(f"ERROR: Sync failed, will retry: {e}", "error")
+            stop.wait(interval)
+
+
+@profiled
+def main():
+    """Watch the Spotify backup and sync changed playlists to YTMusic."""
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--spotify-playlist-file",
+        default="playlists.json",
+        help="The Spotify backup to watch (default: playlists.json)",
+    )
+    parser.add_argument(
+        "--state-file",
+        default="s2yt_daemon_state.json",
+        help="Where to keep track of what has been synced (default: s2yt_daemon_state.json)",
+    )
+    parser.add_argument(
+        "--credentials-file",
+        default="oauth.json",
+        help="The YTMusic credentials (default: oauth.json)",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=60,
+        help="Seconds between checks of the backup file (default: 60)",
+    )
+    parser.add_argument(
+        "--backup-interval",
+        type=float,
+        default=0,
+        help="Also re-run the Spotify backup every this many seconds, authorizing "
+        "once at startup (default: 0, never)",
+    )
+    parser.add_argument(
+        "--once", action="store_true", help="Sync once and exit, e.g. from cron"
+    )
+    parser.add_argument(
+        "--liked", action="store_true", help="Also sync the liked songs"
+    )
+    parser.add_argument(
+        "--track-sleep",
+        type=float,
+        default=0.1,
+        help="Time to sleep between each track that is added (default: 0.1)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Do not add songs to destination playlist (default: False)",
+    )
+    parser.add_argument(
+        "--spotify-playlists-encoding",
+        default="utf-8",
+        help="The encoding of the `playlists.json` file.",
+    )
+    parser.add_argument(
+        "--algo",
+        type=int,
+        default=0,
+        help="Algorithm to use for search (0 = exact, 1 = extended, 2 = approximate)",
+    )
+    parser.add_argument(
+        "--max-calls",
+        type=int,
+        default=backend.DEFAULT_LOOKUP_MAX_CALLS,
+        help="Maximum number of YTMusic API calls to spend looking up each track "
+        f"(default: {backend.DEFAULT_LOOKUP_MAX_CALLS})",
+    )
+    parser.add_argument(
+        "--no-reverse-playlist",
+        action="store_true",
+        help="Do not reverse playlist on load, regular playlists are reversed normally "
+        "so they end up in the same order as on Spotify.",
+    )
+    parser.add_argument(
+        "--privacy",
+        default="PRIVATE",
+        help="The privacy seting of created playlists (PRIVATE, PUBLIC, UNLISTED, default PRIVATE)",
+    )
+    args = parser.parse_args()
+
+    daemon = Daemon(
+        backend.get_ytmusic(args.credentials_file),
+        args.spotify_playlist_file,
+        args.state_file,
+        liked=args.liked,
+        dry_run=args.dry_run,
+        track_sleep=args.track_sleep,
+        yt_search_algo=args.algo,
+        reverse_playlist=not args.no_reverse_playlist,
+        privacy_status=args.privacy,
+        lookup_max_calls=args.max_calls,
+        spotify_encoding=args.spotify_playlists_encoding,
+    )
+    if args.once:
+        daemon.sync()
+        return
+
+    backup = None
+    if args.backup_interval:
+        from . import spotify_backup
+
+        spotify = spotify_backup.SpotifyAPI.authorize(
+            client_id="5c098bcc800e45d49e476265bc9b6934",
+            scope="playlist-read-private playlist-read-collaborative user-library-read",
+        )
+
+        def backup():
+            playlists, liked_albums = spotify_backup.fetch_user_data(
+                spotify, "playlists,liked"
+            )
+            spotify_backup.write_to_file(
+                args.spotify_playlist_file, "json", playlists, liked_albums
+            )
+
+    print(
+        f"Watching {args.spotify_playlist_file}, press Ctrl-C to stop", file=sys.stderr
+    )
+    try:
+        daemon.watch(args.interval, backup, args.backup_interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+"""Structured progress events.
+
+`copier`, the Spotify playlist iterators, `copy_all_playlists` and `spotify_backup`
+report progress by emitting typed events on an `EventBus` rather than printing.
+Callers subscribe with a callback, or with a `queue.Queue` via `QueueSubscriber`.
+The process-wide `bus` starts with a `ConsolePrinter` subscribed, which prints the
+familiar human readable output; `set_output()` switches it to a `JsonlWriter`, which
+writes one JSON object per event, or to no output at all.
+"""
+
+import json
+import queue
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING, Callable, List, Optional, TextIO
+
+if TYPE_CHECKING:
+    from .backend import SongInfo
+
+
+@dataclass
+class Event:
+    def to_dict(self) -> dict:
+        data = {"event": type(self).__name__}
+        data.update(asdict(self))
+        if data.get("track") is not None:
+            data["track"] = data["track"]._asdict()
+        return data
+
+
+@dataclass
+class Message(Event):
+    """Free-form progress text, such as "== Spotify Playlist: <name>"."""
+
+    text: str
+    level: str = field(default="info")
+    timestamp: float = field(default_factory=time.time)
+
+
+@dataclass
+class TrackStarted(Event):
+    track: "SongInfo"
+    index: int
+    timestamp: float = field(default_factory=time.time)
+
+
+@dataclass
+class TrackResolved(Event):
+    track: "SongInfo"
+    video_id: str
+    title: str
+    artist: str
+    album: Optional[str]
+    duplicate: bool
+    lookup_seconds: float
+    timestamp: float = field(default_factory=time.time)
+
+
+@dataclass
+class TrackWritten(Event):
+    track: "SongInfo"
+    video_id: str
+    playlist_id: Optional[str]
+    write_seconds: float
+    timestamp: float = field(default_factory=time.time)
+
+
+@dataclass
+class TrackError(Event):
+    track: Optional["SongInfo"]
+    stage: str
+    error: str
+    timestamp: float = field(default_factory=time.time)
+
+
+@dataclass
+class PlaylistDone(Event):
+    playlist_id: Optional[str]
+    added: int
+    duplicates: int
+    errors: int
+    seconds: float
+    lookup_summary: str = field(default="")
+    #  Stopped early by a `cancel.CancelToken`
+    cancelled: bool = field(default=False)
+    timestamp: float = field(default_factory=time.time)
+
+
+class EventBus:
+    """Delivers events to subscribers, synchronously, in the emitting thread."""
+
+    def __init__(self) -> None:
+        self._subscribers: List[Callable[[Event], None]] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback: Callable[[Event], None]) -> Callable[[], None]:
+        """Call `callback(event)` for every event, returns a function to unsubscribe."""
+        with self._lock:
+            self._subscribers = self._subscribers + [callback]
+
+        def unsubscribe() -> None:
+            with self._lock:
+                self._subscribers = [s for s in self._subscribers if s is not callback]
+
+        return unsubscribe
+
+    def emit(self, event: Event) -> None:
+        for callback in self._subscribers:
+            callback(event)
+
+    def message(self, text: str, level: str = "info") -> None:
+        self.emit(Message(text, level))
+
+
+class QueueSubscriber:
+    """Puts every event on a queue, for consumption by another thread."""
+
+    def __init__(self, q: Optional[queue.Queue] = None) -> None:
+        self.queue = q if q is not None else queue.Queue()
+
+    def __call__(self, event: Event) -> None:
+        self.queue.put(event)
+
+
+class ConsolePrinter:
+    """Prints events in the human readable format."""
+
+    def __init__(self, stream: Optional[TextIO] = None) -> None:
+        self.stream = stream
+
+    def _print(self, text: str = "") -> None:
+        print(text, file=self.stream if self.stream is not None else sys.stdout)
+
+    def __call__(self, event: Event) -> None:
+        if isinstance(event, Message):
+            self._print(event.text)
+        elif isinstance(event, TrackStarted):
+            t = event.track
+            self._print(f"Spotify:   {t.title} - {t.artist} - {t.album}")
+        elif isinstance(event, TrackResolved):
+            self._print(
+                f"  Youtube: {event.title} - {event.artist} - {event.album or '<Unknown>'}"
+            )
+            if event.duplicate:
+                self._print("(DUPLICATE, this track has already been added)")
+        elif isinstance(event, TrackError):
+            if event.stage == "lookup":
+                self._print(f"ERROR: Unable to look up song on YTMusic: {event.error}")
+            else:
+                self._print(f"ERROR: {event.error}")
+        elif isinstance(event, PlaylistDone):
+            self._print()
+            if event.cancelled:
+                self._print("Cancelled, the tracks looked up so far were written.")
+            self._print(
+                f"Added {event.added} tracks, encountered {event.duplicates} duplicates, {event.errors} errors"
+            )
+            if event.lookup_summary:
+                self._print(event.lookup_summary)
+
+
+class JsonlWriter:
+    """Writes each event as a line of JSON."""
+
+    def __init__(self, stream: Optional[TextIO] = None) -> None:
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def __call__(self, event: Event) -> None:
+        stream = self.stream if self.stream is not None else sys.stdout
+        line = json.dumps(event.to_dict(), ensure_ascii=False)
+        with self._lock:
+            stream.write(line + "\n")
+            stream.flush()
+
+
+#  Process-wide event bus
+bus = EventBus()
+
+OUTPUT_MODES = ("text", "jsonl", "quiet")
+_unsubscribe_output: Optional[Callable[[], None]] = None
+
+
+def set_output(mode: str, stream: Optional[TextIO] = None) -> None:
+    """Choose how `bus` events are output: "text", "jsonl" or "quiet" (not at all)."""
+    global _unsubscribe_output
+    if _unsubscribe_output is not None:
+        _unsubscribe_output()
+        _unsubscribe_output = None
+    if mode == "text":
+        _unsubscribe_output = bus.subscribe(ConsolePrinter(stream))
+    elif mode == "jsonl":
+        _unsubscribe_output = bus.subscribe(JsonlWriter(stream))
+    elif mode != "quiet":
+        raise ValueError(
+            f"Unknown output mode {mode!r}, expected one of {OUTPUT_MODES}"
+        )
+
+
+set_output("text")
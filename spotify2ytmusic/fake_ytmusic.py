@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+
+"""An offline stand-in for YTMusic, for tests and benchmarks.
+
+`FakeYTMusic` serves the subset of the YTMusic API that this package uses from a
+synthetic catalog, with a configurable latency and failure model.  `serve()` and
+`HTTPYTMusic` put the same fake behind a local HTTP server, so that benchmarks can
+include real sockets and JSON serialization.
+"""
+
+import functools
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import http.server
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .backend import SongInfo
+
+
+class FakeYTMusicError(Exception):
+    """A simulated YTMusic failure."""
+
+
+@dataclass
+class LatencyModel:
+    """How slow and how unreliable the fake service is.
+
+    `latency` and `jitter` are in seconds, every call sleeps for `latency` plus a
+    uniformly distributed `[-jitter, +jitter]`.  `error_rate` and `throttle_rate`
+    are the probabilities that a call fails with a generic error or a HTTP 429.
+    """
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    seed: Optional[int] = None
+    _random: random.Random = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self._random = random.Random(self.seed)
+
+    def delay(self) -> float:
+        if not self.latency and not self.jitter:
+            return 0.0
+        return max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+
+    def failure(self, endpoint: str) -> Optional[FakeYTMusicError]:
+        roll = self._random.random()
+        if roll < self.throttle_rate:
+            return FakeYTMusicError(
+                f"Server returned HTTP 429: Too Many Requests. ({endpoint})"
+            )
+        if roll < self.throttle_rate + self.error_rate:
+            return FakeYTMusicError(
+                f"Server returned HTTP 500: Internal Error. ({endpoint})"
+            )
+        return None
+
+
+class FakeCatalog:
+    """The songs, albums and videos the fake service knows about."""
+
+    def __init__(self) -> None:
+        self.tracks: Dict[str, Dict] = {}
+        self.albums: Dict[str, Dict] = {}
+        self._by_title_artist: Dict[Tuple[str, str], List[str]] = {}
+        self._by_artist: Dict[str, List[str]] = {}
+        self._albums_by_title_artist: Dict[Tuple[str, str], str] = {}
+
+    def add(self, song: SongInfo) -> Dict:
+        """Add a song (and its album) to the catalog, returning the track."""
+        artist_key = song.artist.casefold()
+        album_key = (str(song.album).casefold(), artist_key)
+        album_id = self._albums_by_title_artist.get(album_key)
+        if album_id is None:
+            album_id = f"MPREb_{len(self.albums):08d}"
+            self._albums_by_title_artist[album_key] = album_id
+            self.albums[album_id] = {
+                "browseId": album_id,
+                "title": song.album,
+                "artists": [{"name": song.artist}],
+                "tracks": [],
+            }
+        album = self.albums[album_id]
+        for track in album["tracks"]:
+            if track["title"] == song.title:
+                return track
+
+        track = {
+            "videoId": f"v{len(self.tracks):010d}",
+            "title": song.title,
+            "artists": [{"name": song.artist}],
+            "album": {"name": song.album, "id": album_id},
+        }
+        self.tracks[track["videoId"]] = track
+        album["tracks"].append(track)
+        self._by_title_artist.setdefault(
+            (song.title.casefold(), artist_key), []
+        ).append(track["videoId"])
+        self._by_artist.setdefault(artist_key, []).append(track["videoId"])
+        return track
+
+    @classmethod
+    def from_songs(cls, songs: Iterable[SongInfo]) -> "FakeCatalog":
+        catalog = cls()
+        for song in songs:
+            catalog.add(song)
+        return catalog
+
+    @classmethod
+    def from_backup(cls, data: Dict) -> "FakeCatalog":
+        """A catalog containing every track of a `playlists.json` backup."""
+        catalog = cls()
+        for pl in data.get("playlists", []):
+            for item in pl["tracks"]:
+                track = item.get("track")
+                if track:
+                    catalog.add(
+                        SongInfo(
+                            track["name"],
+                            track["artists"][0]["name"],
+                            track["album"]["name"],
+                        )
+                    )
+        for item in data.get("albums", []):
+            album = item["album"]
+            for track in album["tracks"]["items"]:
+                catalog.add(
+                    SongInfo(track["name"], track["artists"][0]["name"], album["name"])
+                )
+        return catalog
+
+    def search(self, query: str, filter: Optional[str], limit: int) -> List[Dict]:
+        title, _, artist = query.rpartition(" by ")
+        title_key, artist_key = title.casefold(), artist.casefold()
+
+        if filter == "albums":
+            album_id = self._albums_by_title_artist.get((title_key, artist_key))
+            if album_id is None:
+                return []
+            album = self.albums[album_id]
+            return [{k: v for k, v in album.items() if k != "tracks"}]
+
+        ids = list(self._by_title_artist.get((title_key, artist_key), []))
+        ids += [i for i in self._by_artist.get(artist_key, [])[:limit] if i not in ids]
+        hits = [dict(self.tracks[i]) for i in ids[:limit]]
+        if filter == "videos":
+            for hit in hits:
+                hit[
+                    "title"
+                ] = f"{hit['artists'][0]['name']} - {hit['title']} (Official Video)"
+                hit.pop("album", None)
+        return hits
+
+
+class FakeYTMusic:
+    """An in-process fake of the YTMusic client.
+
+    Every call is counted per endpoint in `calls`, and its wall clock duration is
+    appended to `latencies`.
+    """
+
+    def __init__(
+        self,
+        catalog: Optional[FakeCatalog] = None,
+        latency: Optional[LatencyModel] = None,
+    ) -> None:
+        self.catalog = catalog if catalog is not None else FakeCatalog()
+        self.latency = latency if latency is not None else LatencyModel()
+        self.playlists: Dict[str, Dict] = {}
+        self.liked: List[str] = []
+        self.calls: Counter = Counter()
+        self.latencies: List[float] = []
+        self._lock = threading.Lock()
+
+    def _call(self, endpoint: str) -> None:
+        start = time.perf_counter()
+        with self._lock:
+            self.calls[endpoint] += 1
+            delay = self.latency.delay()
+            failure = self.latency.failure(endpoint)
+        if delay:
+            time.sleep(delay)
+        with self._lock:
+            self.latencies.append(time.perf_counter() - start)
+        if failure:
+            raise failure
+
+    def search(
+        self, query: str, filter: Optional[str] = None, limit: int = 20, **kwargs
+    ) -> List[Dict]:
+        self._call(f"search:{filter}")
+        return self.catalog.search(query, filter, limit)
+
+    def get_search_suggestions(self, query: str, **kwargs) -> List[str]:
+        self._call("get_search_suggestions")
+        return [query]
+
+    def get_album(self, browseId: str) -> Dict:
+        self._call("get_album")
+        try:
+            album = self.catalog.albums[browseId]
+        except KeyError:
+            raise FakeYTMusicError(f"Album {browseId} not found")
+        return dict(album, tracks=list(album["tracks"]))
+
+    def create_playlist(
+        self,
+        title: str,
+        description: str,
+        privacy_status: str = "PRIVATE",
+        video_ids: Optional[List[str]] = None,
+        source_playlist: Optional[str] = None,
+    ) -> str:
+        self._call("create_playlist")
+        with self._lock:
+            playlist_id = f"PLfake{len(self.playlists):010d}"
+            self.playlists[playlist_id] = {
+                "playlistId": playlist_id,
+                "title": title,
+                "description": description,
+                "privacy": privacy_status,
+                "videoIds": list(video_ids or []),
+            }
+        return playlist_id
+
+    def get_playlist(
+        self, playlistId: str, limit: Optional[int] = 100, **kwargs
+    ) -> Dict:
+        self._call("get_playlist")
+        try:
+            pl = self.playlists[playlistId]
+        except KeyError:
+            raise FakeYTMusicError(f"Playlist {playlistId} not found")
+        return {
+            "id": playlistId,
+            "title": pl["title"],
+            "trackCount": len(pl["videoIds"]),
+            "tracks": [self.catalog.tracks[i] for i in pl["videoIds"][:limit]],
+        }
+
+    def get_library_playlists(self, limit: Optional[int] = 25) -> List[Dict]:
+        self._call("get_library_playlists")
+        return [
+            {
+                "playlistId": pl["playlistId"],
+                "title": pl["title"],
+                "count": len(pl["videoIds"]),
+            }
+            for pl in list(self.playlists.values())[:limit]
+        ]
+
+    def add_playlist_items(
+        self,
+        playlistId: str,
+        videoIds: Optional[List[str]] = None,
+        source_playlist: Optional[str] = None,
+        duplicates: bool = False,
+    ) -> Dict:
+        self._call("add_playlist_items")
+        with self._lock:
+            try:
+                existing = self.playlists[playlistId]["videoIds"]
+            except KeyError:
+                raise FakeYTMusicError(f"Playlist {playlistId} not found")
+            for video_id in videoIds or []:
+                if duplicates or video_id not in existing:
+                    existing.append(video_id)
+        return {"status": "STATUS_SUCCEEDED"}
+
+    def get_liked_songs(self, limit: Optional[int] = 100) -> Dict:
+        self._call("get_liked_songs")
+        with self._lock:
+            liked = list(reversed(self.liked))[:limit]
+        return {
+            "id": "LM",
+            "title": "Liked Music",
+            "trackCount": len(liked),
+            "tracks": [self.catalog.tracks[i] for i in liked],
+        }
+
+    def rate_song(self, videoId: str, rating: str = "INDIFFERENT") -> Dict:
+        self._call("rate_song")
+        with self._lock:
+            if rating == "LIKE" and videoId not in self.liked:
+                self.liked.append(videoId)
+            elif rating != "LIKE" and videoId in self.liked:
+                self.liked.remove(videoId)
+        return {}
+
+
+#  Methods exposed by `serve()`
+_HTTP_METHODS = (
+    "search",
+    "get_search_suggestions",
+    "get_album",
+    "create_playlist",
+    "get_playlist",
+    "get_library_playlists",
+    "add_playlist_items",
+    "get_liked_songs",
+    "rate_song",
+)
+
+
+class _FakeHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        method = self.path.strip("/")
+        length = int(self.headers.get("Content-Length", 0))
+        kwargs = json.loads(self.rfile.read(length) or b"{}")
+        if method not in _HTTP_METHODS:
+            self.send_error(404)
+            return
+        try:
+            status, body = 200, {"result": getattr(self.server.fake, method)(**kwargs)}
+        except FakeYTMusicError as e:
+            status = 429 if "429" in str(e) else 500
+            body = {"error": str(e)}
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(
+    fake: FakeYTMusic, host: str = "127.0.0.1", port: int = 0
+) -> http.server.ThreadingHTTPServer:
+    """Serve `fake` over HTTP on a background thread, returning the server.
+
+    Use `port=0` to pick a free port, see `server.server_address`.  Call
+    `server.shutdown()` when done.
+    """
+    server = http.server.ThreadingHTTPServer((host, port), _FakeHandler)
+    server.daemon_threads = True
+    server.fake = fake
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class HTTPYTMusic:
+    """A client for a fake served with `serve()`, with the YTMusic method signatures."""
+
+    def __init__(self, url: str) -> None:
+        self.url = url.rstrip("/")
+
+    def _post(self, method: str, kwargs: Dict):
+        req = urllib.request.Request(
+            f"{self.url}/{method}",
+            data=json.dumps(kwargs).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(req) as res:
+                return json.load(res)["result"]
+        except urllib.error.HTTPError as e:
+            raise FakeYTMusicError(
+                f"Server returned HTTP {e.code}: {json.load(e).get('error')}"
+            )
+
+    def __getattr__(self, name: str):
+        if name not in _HTTP_METHODS:
+            raise AttributeError(name)
+
+        def method(*args, **kwargs):
+            if args:
+                kwargs = dict(zip(_POSITIONAL.get(name, ()), args), **kwargs)
+            return self._post(name, kwargs)
+
+        return method
+
+
+def _http_client(url: str, credentials_file: Optional[str] = None) -> HTTPYTMusic:
+    return HTTPYTMusic(url)
+
+
+def http_client_factory(url: str):
+    """A picklable `client_factory(credentials_file)` for a fake served at `url`,
+    for code that creates its clients in other processes."""
+    return functools.partial(_http_client, url)
+
+
+_POSITIONAL = {
+    "get_album": ("browseId",),
+    "rate_song": ("videoId", "rating"),
+    "search": ("query", "filter"),
+}
@@ -1,17 +1,53 @@
 #!/usr/bin/env python3
 
+import importlib
 import os
+import queue
 import subprocess
 import sys
 import threading
 import json
+import logging
+import logging.handlers
 import tkinter as tk
 from tkinter import ttk
 
-from . import cli
-from . import backend
-from . import spotify_backup
-from typing import Callable
+from .cancel import CancelToken
+from .profiling import profiled
+from typing import Any, Callable, Optional
+
+#  How often the UI drains the output and job completion queue
+POLL_INTERVAL_MS = 50
+
+#  The log view keeps only the most recent lines, the full log goes to LOG_FILE
+DEFAULT_MAX_LOG_LINES = 5000
+LOG_FILE = "s2yt_gui.log"
+LOG_FILE_MAX_BYTES = 10 * 1024 * 1024
+LOG_FILE_BACKUPS = 3
+
+
+def _module(name: str):
+    """Import a sibling module on first use, so the window comes up without
+    waiting for ytmusicapi and friends to load."""
+    return importlib.import_module(f".{name}", __package__)
+
+
+def create_log_file_logger(filename: str = LOG_FILE) -> logging.Logger:
+    """A logger that streams the raw GUI output to a rotating file."""
+    logger = logging.getLogger("spotify2ytmusic.gui.log")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    if not logger.handlers:
+        handler = logging.handlers.RotatingFileHandler(
+            filename,
+            maxBytes=LOG_FILE_MAX_BYTES,
+            backupCount=LOG_FILE_BACKUPS,
+            encoding="utf-8",
+        )
+        handler.terminator = ""
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+    return logger
 
 
 def create_label(parent: tk.Frame, text: str, **kwargs) -> tk.Label:
@@ -55,6 +91,106 @@ def create_button(parent: tk.Frame, text: str, **kwargs) -> tk.Button:
     )
 
 
+class JobRunner:
+    """Runs functions on a worker thread without blocking the Tk event loop.
+
+    Worker threads never touch Tk: their output and completion notices go through a
+    thread-safe queue, which the UI thread drains every `POLL_INTERVAL_MS` using
+    `root.after()`, appending all the pending output to the log in one go.
+    """
+
+    def __init__(self, root: tk.Tk, write: Callable[[str], None]) -> None:
+        self.root = root
+        self.write = write
+        self.queue: queue.Queue = queue.Queue()
+        self.busy = False
+        #  The token of the running job, if it can be paused and cancelled
+        self.token: Optional[CancelToken] = None
+        self.root.after(POLL_INTERVAL_MS, self._poll)
+
+    def output(self, text: str) -> int:
+        """Queue text for the log, callable from any thread (a `stdout.write` replacement)."""
+        self.queue.put(("output", text))
+        return len(text)
+
+    def submit(
+        self,
+        func: Callable,
+        args: tuple = (),
+        on_done: Optional[Callable[[Any], None]] = None,
+        cancellable: bool = False,
+    ) -> bool:
+        """Run `func(*args)` on a worker thread, then `on_done(result)` on the UI thread.
+
+        A `cancellable` job is given a `cancel.CancelToken` as its `cancel` argument,
+        so `pause()`, `resume()` and `cancel()` act on it.  Returns False, without
+        running anything, if a job is already running.
+        """
+        if self.busy:
+            self.output("A job is already running, please wait for it to finish.\n")
+            return False
+        self.busy = True
+        kwargs = {}
+        if cancellable:
+            self.token = kwargs["cancel"] = CancelToken()
+
+        def run() -> None:
+            result = None
+            try:
+                result = func(*args, **kwargs)
+            except SystemExit:
+                pass
+            except Exception as e:
+                self.output(f"ERROR: {e}\n")
+            self.queue.put(("done", (on_done, result)))
+
+        threading.Thread(target=run, daemon=True).start()
+        return True
+
+    def pause(self) -> bool:
+        """Pause the running job, or resume it if paused, returns whether it is paused."""
+        if self.token is None:
+            self.output("No job that can be paused is running.\n")
+            return False
+        if self.token.paused:
+            self.token.resume()
+            self.output("Resuming...\n")
+        else:
+            self.token.pause()
+            self.output("Pausing at the next track or page...\n")
+        return self.token.paused
+
+    def cancel(self) -> None:
+        """Cancel the running job, it stops once it has written the tracks found so far."""
+        if self.token is None:
+            self.output("No job that can be cancelled is running.\n")
+            return
+        self.token.cancel()
+        self.output("Cancelling at the next track or page...\n")
+
+    def _poll(self) -> None:
+        chunks = []
+        done = []
+        try:
+            while True:
+                kind, value = self.queue.get_nowait()
+                if kind == "output":
+                    chunks.append(value)
+                else:
+                    done.append(value)
+        except queue.Empty:
+            pass
+
+        if chunks:
+            self.write("".join(chunks))
+        for on_done, result in done:
+            self.busy = False
+            self.token = None
+            if on_done is not None:
+                on_done(result)
+        self.root.after(POLL_INTERVAL_MS, self._poll)
+
+
 class Window:
     """The main window of the application. It contains the tabs and the logs."""
 
@@ -78,8 +214,10 @@ class Window:
         style.configure("TFrame", background="#26242f")
         style.configure("TNotebook", background="#121212")
 
-        # Redirect stdout to GUI
-        sys.stdout.write = self.redirector
+        # Redirect stdout to GUI, through the job runner's queue
+        self.log_file = create_log_file_logger()
+        self.jobs = JobRunner(self.root, self.redirector)
+        sys.stdout.write = self.jobs.output
 
         self.root.after(1, lambda: self.yt_login(auto=True))
         self.root.after(1, lambda: self.load_write_settings(0))
@@ -121,6 +259,17 @@ class Window:
         self.paned_window.add(self.log_frame, weight=1)
 
         # Create the Text widget for the logs
+        # Pause and cancel the running job
+        self.job_controls = tk.Frame(self.log_frame, background="#26242f")
+        self.job_controls.pack(fill=tk.X)
+        self.pause_button = create_button(
+            self.job_controls, text="Pause", command=self.pause_job
+        )
+        self.pause_button.pack(side=tk.LEFT)
+        create_button(self.job_controls, text="Cancel", command=self.jobs.cancel).pack(
+            side=tk.LEFT
+        )
+
         self.logs = tk.Text(self.log_frame, font=("Helvetica", 14))
         self.logs.pack(fill=tk.BOTH, expand=1)
         self.logs.config(background="#26242f", foreground="white")
@@ -143,7 +292,10 @@ class Window:
             self.tab2,
             text="Backup",
             command=lambda: self.call_func(
-                func=spotify_backup.main, args=(), next_tab=self.tab3
+                func=_module("spotify_backup").main,
+                args=(),
+                next_tab=self.tab3,
+                cancellable=True,
             ),
         ).pack(anchor=tk.CENTER, expand=True)
 
@@ -155,15 +307,16 @@ class Window:
             self.tab3,
             text="Load",
             command=lambda: self.call_func(
-                func=backend.copier,
+                func=_module("backend").copier,
                 args=(
-                    backend.iter_spotify_playlist(),
+                    _module("backend").iter_spotify_playlist(),
                     None,
                     False,
                     0.1,
                     self.var_algo.get(),
                 ),
                 next_tab=self.tab4,
+                cancellable=True,
             ),
         ).pack(anchor=tk.CENTER, expand=True)
 
@@ -175,7 +328,7 @@ class Window:
             self.tab4,
             text="List",
             command=lambda: self.call_func(
-                func=cli.list_playlists, args=(), next_tab=self.tab5
+                func=_module("cli").list_playlists, args=(), next_tab=self.tab5
             ),
         ).pack(anchor=tk.CENTER, expand=True)
 
@@ -189,9 +342,10 @@ class Window:
             self.tab5,
             text="Copy",
             command=lambda: self.call_func(
-                func=backend.copy_all_playlists,
+                func=_module("backend").copy_all_playlists,
                 args=(0.1, False, "utf-8", self.var_algo.get()),
                 next_tab=self.tab6,
+                cancellable=True,
             ),
         ).pack(anchor=tk.CENTER, expand=True)
 
@@ -214,7 +368,7 @@ class Window:
             self.tab6,
             text="Copy",
             command=lambda: self.call_func(
-                func=backend.copy_playlist,
+                func=_module("backend").copy_playlist,
                 args=(
                     self.spotify_playlist_id.get(),
                     self.yt_playlist_id.get(),
@@ -224,6 +378,7 @@ class Window:
                     self.var_algo.get(),
                 ),
                 next_tab=self.tab6,
+                cancellable=True,
             ),
         ).pack(anchor=tk.CENTER, expand=True)
 
@@ -259,34 +414,80 @@ class Window:
         menu_algo.pack(anchor=tk.CENTER, expand=True)
         menu_algo.config(background="#696969", foreground="#ffffff", border=1)
 
+        self.var_max_lines = tk.IntVar()
+        self.var_max_lines.set(DEFAULT_MAX_LOG_LINES)
+
+        create_label(
+            self.tab7, text=f"Log lines to keep on screen (full log in {LOG_FILE}):"
+        ).pack(anchor=tk.CENTER, expand=True)
+        max_lines = tk.Spinbox(
+            self.tab7,
+            from_=100,
+            to=1000000,
+            increment=1000,
+            textvariable=self.var_max_lines,
+            command=lambda: self.load_write_settings(1),
+        )
+        max_lines.bind("<FocusOut>", lambda e: self.load_write_settings(1))
+        max_lines.bind("<Return>", lambda e: self.load_write_settings(1))
+        max_lines.pack(anchor=tk.CENTER, expand=True)
+
     def redirector(self, input_str="") -> None:
         """
         Inserts the input string into the logs widget and disables editing.
 
+        The widget is capped at the configured number of lines, dropping the oldest,
+        so its cost stays constant however long a job runs.  The full output is
+        streamed to the log file.
+
         Args:
             self: The instance of the class.
             input_str (str): The string to be inserted into the logs' widget.
         """
+        self.log_file.info(input_str)
         self.logs.config(state=tk.NORMAL)
         self.logs.insert(tk.END, input_str)
+        lines = int(self.logs.index("end-1c").split(".")[0])
+        excess = lines - self.max_log_lines()
+        if excess > 0:
+            self.logs.delete("1.0", f"{excess + 1}.0")
         self.logs.config(state=tk.DISABLED)
         if self.var_scroll.get():
             self.logs.see(tk.END)
 
-    def call_func(self, func: Callable, args: tuple, next_tab: ttk.Frame) -> None:
+    def max_log_lines(self) -> int:
+        try:
+            return max(1, self.var_max_lines.get())
+        except tk.TclError:  # Not a number while being edited
+            return DEFAULT_MAX_LOG_LINES
+
+    def call_func(
+        self,
+        func: Callable,
+        args: tuple,
+        next_tab: ttk.Frame,
+        cancellable: bool = False,
+    ) -> None:
         """Calls the given function in a separate thread and switches to the next tab when the function is done.
 
         Args:
             func (Callable): The function to be called.
             args (tuple): The arguments to be passed to the function. If no arguments are needed, pass an empty tuple.
             next_tab (ttk.Frame): The tab to switch to when the function is done. If no switch needed, pass the current one.
+            cancellable (bool, optional): Whether the function takes a `cancel` token, for the Pause and Cancel buttons. Defaults to False.
         """
-        th = threading.Thread(target=func, args=args)
-        th.start()
-        while th.is_alive():
-            self.root.update()
-        self.tabControl.select(next_tab)
-        print()
+
+        def done(result) -> None:
+            self.pause_button.config(text="Pause")
+            self.tabControl.select(next_tab)
+            print()
+
+        self.jobs.submit(func, args, on_done=done, cancellable=cancellable)
+
+    def pause_job(self) -> None:
+        """Pauses the running job, or resumes it if it is paused."""
+        paused = self.jobs.pause()
+        self.pause_button.config(text="Resume" if paused else "Pause")
 
     def yt_login(self, auto=False) -> None:
         """Logs in to YT Music. If the oauth.json file is not found, it opens a new console window to run the 'ytmusicapi oauth' command.
@@ -300,7 +501,7 @@ class Window:
                 print("✓ File detected, auto login")
             elif auto:
                 print("No file detected. Manual login required")
-                return
+                return False
             else:
                 print("File not detected, login required")
 
@@ -308,13 +509,14 @@ class Window:
                 if os.name == "nt":  # If the OS is Windows
                     try:
                         import sys
+
                         python_exe = sys.executable
-                        
+
                         # Run the custom setup script in a new console
                         process = subprocess.Popen(
                             [python_exe, "setup_yt_oauth.py"],
                             creationflags=subprocess.CREATE_NEW_CONSOLE,
-                            cwd=os.getcwd()
+                            cwd=os.getcwd(),
                         )
                         print("YouTube Music login window opened. Please log in...")
                         process.wait()
@@ -333,13 +535,17 @@ class Window:
 
             if os.path.exists("oauth.json"):
                 print("✓ oauth.json is ready!")
-                
-            self.tabControl.select(self.tab2)
-            print()
+            #  The next action authenticates with the new credentials
+            _module("backend").reset_ytmusic()
+            return True
+
+        def done(switch_tab) -> None:
+            if switch_tab:
+                self.tabControl.select(self.tab2)
+                print()
 
         # Run the function in a separate thread
-        th = threading.Thread(target=run_in_thread)
-        th.start()
+        self.jobs.submit(run_in_thread, on_done=done)
 
     def load_write_settings(self, action: int) -> None:
         """Loads or writes the settings to the settings.json file.
@@ -362,11 +568,15 @@ class Window:
                     settings = json.load(f)
                     self.var_scroll.set(settings["auto_scroll"])
                     self.var_algo.set(settings["algo_number"])
+                    self.var_max_lines.set(
+                        settings.get("max_log_lines", DEFAULT_MAX_LOG_LINES)
+                    )
         else:
             with open("settings.json", "w+") as f:
                 settings = {
                     "auto_scroll": self.var_scroll.get(),
                     "algo_number": self.var_algo.get(),
+                    "max_log_lines": self.max_log_lines(),
                 }
                 json.dump(settings, f)
 
@@ -374,6 +584,7 @@ class Window:
         self.root.update()
 
 
+@profiled
 def main() -> None:
     ui = Window()
     ui.root.mainloop()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+"""JSON encoding and decoding of backups, with orjson when it is installed.
+
+orjson writes a large `playlists.json` many times faster than the `json` module,
+and parses it faster; both parse faster with the garbage collector paused.  It is
+optional: without it, or with `S2YT_JSON=stdlib` in the environment, the `json`
+module is used.  Either way the output is the same: UTF-8
+text, not ASCII escaped, indented by 2 spaces unless `compact`.  Values orjson
+can't encode (integers over 64 bits, non-string keys) fall back to `json`.
+"""
+
+import gc
+import json
+import os
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Iterator
+
+from . import compression
+
+try:
+    if os.environ.get("S2YT_JSON", "orjson") == "stdlib":
+        raise ImportError("disabled by S2YT_JSON")
+    import orjson
+except ImportError:
+    orjson = None
+
+#  The library in use, "orjson" or "stdlib"
+name = "orjson" if orjson is not None else "stdlib"
+
+
+@contextmanager
+def _gc_paused() -> Iterator[None]:
+    #  Decoding creates millions of containers, none of them in a cycle, and the
+    #  collections they trigger take most of the time of decoding a large backup
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def loads(data) -> Any:
+    """Decode the JSON document `data` (str or UTF-8 bytes)."""
+    with _gc_paused():
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data)
+
+
+def dumps(value: Any, compact: bool = False) -> bytes:
+    """Encode `value` as UTF-8 JSON, indented by 2 spaces unless `compact`."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, option=0 if compact else orjson.OPT_INDENT_2)
+        except TypeError:
+            pass
+    if compact:
+        text = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    else:
+        text = json.dumps(value, ensure_ascii=False, indent=2)
+    return text.encode("utf-8")
+
+
+def load_file(filename: str, encoding: str = "utf-8") -> Any:
+    """Decode the JSON file `filename`, of text encoding `encoding`.
+
+    The file may be gzip or zstd compressed, see `compression`.
+    """
+    if encoding.lower().replace("-", "").replace("_", "") == "utf8":
+        with compression.open_file(filename, "rb") as f:
+            return loads(f.read())
+    with compression.open_file(filename, "rt", encoding=encoding) as f:
+        return loads(f.read())
+
+
+def dump_file(value: Any, f: BinaryIO, compact: bool = False) -> None:
+    """Write `value` as JSON to the binary file `f`."""
+    f.write(dumps(value, compact))
+
+
+def dump_text(value: Any, compact: bool = True) -> str:
+    """`value` as a JSON string, for writing to a text stream."""
+    return dumps(value, compact).decode("utf-8")
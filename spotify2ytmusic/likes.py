@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+"""A concurrent writer for liking songs.
+
+There is no batch API for likes, every song is a `rate_song` call.  `LikeWriter`
+runs those calls on a few threads, paced by its own rate limit, while `copier` goes
+on looking up the next tracks.  It fetches the liked songs once up front, so songs
+that are already liked cost no call at all.
+"""
+
+import queue
+import threading
+import time
+from typing import Optional, Set
+
+from .cancel import CancelToken
+from .events import EventBus, TrackError, TrackWritten, bus
+from .metrics import metrics
+from .profiling import phases
+from .ratelimit import RateLimiter
+
+DEFAULT_LIKE_WORKERS = 4
+DEFAULT_LIKE_RATE = 5.0
+
+
+class LikeWriter:
+    """Likes songs on `workers` threads, at most `rate` likes per second.
+
+    With `preserve_order`, a single thread likes the songs in the order they are
+    submitted, since YTMusic orders the liked songs by when they were liked.  Once
+    `cancel` (a `cancel.CancelToken`) is cancelled, failed likes are not retried.
+    """
+
+    def __init__(
+        self,
+        yt,
+        workers: int = DEFAULT_LIKE_WORKERS,
+        rate: float = DEFAULT_LIKE_RATE,
+        preserve_order: bool = False,
+        *,
+        events: Optional[EventBus] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> None:
+        self.yt = yt
+        self.cancel = cancel
+        self.workers = 1 if preserve_order else max(1, workers)
+        self.limiter = RateLimiter(rate, self.workers)
+        self.events = events if events is not None else bus
+        self.errors = 0
+        self._liked: Optional[Set[str]] = None
+        #  Queued or being liked, so a song submitted twice is liked once
+        self._pending: Set[str] = set()
+        self._queue: queue.Queue = queue.Queue(maxsize=self.workers * 4)
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"like-writer-{n}", daemon=True)
+            for n in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _load_liked(self) -> Set[str]:
+        try:
+            tracks = self.yt.get_liked_songs(limit=None).get("tracks") or []
+        except Exception as e:
+            self.events.message(
+                f"WARNING: Unable to get the liked songs ({e}), liking all songs",
+                "warning",
+            )
+            return set()
+        self.events.message(f"{len(tracks)} songs are already liked")
+        return {track["videoId"] for track in tracks if track.get("videoId")}
+
+    def submit(self, track, video_id: str, events: Optional[EventBus] = None) -> bool:
+        """Queue `video_id` to be liked, returns False if it is already liked.
+
+        Blocks while the writers are behind, so lookups don't run ahead too far.
+        """
+        with self._lock:
+            if self._liked is None:
+                self._liked = self._load_liked()
+            if video_id in self._liked or video_id in self._pending:
+                return False
+            self._pending.add(video_id)
+        self._queue.put((track, video_id, events or self.events))
+        return True
+
+    def _like(self, video_id: str, events: EventBus) -> bool:
+        exception_sleep = 5
+        for _ in range(10):
+            self.limiter.acquire()
+            try:
+                with phases.phase("write"):
+                    self.yt.rate_song(video_id, "LIKE")
+                return True
+            except Exception as e:
+                if self.cancel is not None and self.cancel.cancelled:
+                    return False
+                events.message(
+                    f"ERROR: (Retrying rate_song: {video_id}) {e} in {exception_sleep} seconds",
+                    "error",
+                )
+                metrics.retry("ytmusic", "rate_song")
+                metrics.sleep("backoff", exception_sleep, self.cancel)
+                exception_sleep *= 2
+        return False
+
+    def _worker(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            track, video_id, events = item
+            start = time.perf_counter()
+            try:
+                liked = self._like(video_id, events)
+                with self._lock:
+                    self._pending.discard(video_id)
+                    if liked:
+                        #  Only once it succeeded, a failed like is tried again
+                        #  if the song is submitted again
+                        self._liked.add(video_id)
+                    else:
+                        self.errors += 1
+                if liked:
+                    events.emit(
+                        TrackWritten(track, video_id, None, time.perf_counter() - start)
+                    )
+                else:
+                    events.emit(
+                        TrackError(
+                            track, "write", f"Could not like {video_id} after retries"
+                        )
+                    )
+            finally:
+                self._queue.task_done()
+
+    def join(self) -> int:
+        """Wait for the queued likes, returns the number that failed so far."""
+        self._queue.join()
+        return self.errors
+
+    def close(self) -> None:
+        """Finish the queued likes and stop the threads."""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+
+"""Per-endpoint API call metrics.
+
+Every YTMusic call made through a client from `backend.get_ytmusic()`, and every
+Spotify API request, is recorded in the process-wide `metrics`: call and error
+counts, a latency histogram, retries, cache hits and bytes transferred.  Time spent
+sleeping (back-off, `--track-sleep`, ...) is recorded per reason, so a slow run can be
+attributed to the service, to throttling, or to our own sleeps.
+"""
+
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from . import tracing
+from .profiling import phases
+
+#  Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+@dataclass
+class EndpointStats:
+    calls: int = field(default=0)
+    errors: int = field(default=0)
+    retries: int = field(default=0)
+    cache_hits: int = field(default=0)
+    bytes: int = field(default=0)
+    seconds: float = field(default=0.0)
+    buckets: List[int] = field(default_factory=lambda: [0] * (len(BUCKETS) + 1))
+
+    def observe(self, seconds: float) -> None:
+        self.seconds += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate a latency quantile from the histogram (the bucket's upper bound)."""
+        total = sum(self.buckets)
+        if not total:
+            return 0.0
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= q * total:
+                return BUCKETS[i] if i < len(BUCKETS) else float("inf")
+        return float("inf")
+
+
+class Metrics:
+    """Thread-safe registry of per-endpoint statistics and sleep time."""
+
+    def __init__(self) -> None:
+        self.endpoints: Dict[Tuple[str, str], EndpointStats] = {}
+        self.sleeps: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _endpoint(self, service: str, endpoint: str) -> EndpointStats:
+        key = (service, endpoint)
+        stats = self.endpoints.get(key)
+        if stats is None:
+            stats = self.endpoints.setdefault(key, EndpointStats())
+        return stats
+
+    def observe(
+        self, service: str, endpoint: str, seconds: float, error: bool = False
+    ) -> None:
+        """Record one call to `endpoint` that took `seconds`."""
+        with self._lock:
+            stats = self._endpoint(service, endpoint)
+            stats.calls += 1
+            stats.errors += int(error)
+            stats.observe(seconds)
+        if tracing.active is not None:
+            tracing.active.call(service, endpoint, seconds, error)
+
+    def retry(self, service: str, endpoint: str) -> None:
+        with self._lock:
+            self._endpoint(service, endpoint).retries += 1
+        if tracing.active is not None:
+            tracing.active.retry(service, endpoint)
+
+    def cache_hit(self, service: str, endpoint: str) -> None:
+        with self._lock:
+            self._endpoint(service, endpoint).cache_hits += 1
+        if tracing.active is not None:
+            tracing.active.call(service, endpoint, 0.0, cache="hit")
+
+    def add_bytes(self, service: str, endpoint: str, nbytes: int) -> None:
+        with self._lock:
+            self._endpoint(service, endpoint).bytes += nbytes
+
+    def sleep(self, reason: str, seconds: float, cancel=None) -> None:
+        """`time.sleep()`, recording the time slept under `reason`.
+
+        With a `cancel.CancelToken`, returns early when it is cancelled.
+        """
+        if seconds <= 0:
+            return
+        with phases.phase("sleep", reason):
+            if cancel is None:
+                time.sleep(seconds)
+            else:
+                start = time.perf_counter()
+                cancel.wait(seconds)
+                seconds = time.perf_counter() - start
+        with self._lock:
+            self.sleeps[reason] = self.sleeps.get(reason, 0.0) + seconds
+
+    def merge(self, data: Dict) -> None:
+        """Add in the statistics of another registry's `to_dict()`, such as one from a
+        worker process."""
+        with self._lock:
+            for e in data["endpoints"]:
+                stats = self._endpoint(e["service"], e["endpoint"])
+                stats.calls += e["calls"]
+                stats.errors += e["errors"]
+                stats.retries += e["retries"]
+                stats.cache_hits += e["cache_hits"]
+                stats.bytes += e["bytes"]
+                stats.seconds += e["seconds"]
+                for i, count in enumerate(e["buckets"].values()):
+                    stats.buckets[i] += count
+            for reason, seconds in data["sleep_seconds"].items():
+                self.sleeps[reason] = self.sleeps.get(reason, 0.0) + seconds
+
+    def reset(self) -> None:
+        with self._lock:
+            self.endpoints.clear()
+            self.sleeps.clear()
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "endpoints": [
+                    {
+                        "service": service,
+                        "endpoint": endpoint,
+                        "calls": stats.calls,
+                        "errors": stats.errors,
+                        "retries": stats.retries,
+                        "cache_hits": stats.cache_hits,
+                        "bytes": stats.bytes,
+                        "seconds": stats.seconds,
+                        "p50_seconds": stats.quantile(0.5),
+                        "p95_seconds": stats.quantile(0.95),
+                        "buckets": dict(
+                            zip([str(b) for b in BUCKETS] + ["+Inf"], stats.buckets)
+                        ),
+                    }
+                    for (service, endpoint), stats in sorted(self.endpoints.items())
+                ],
+                "sleep_seconds": dict(self.sleeps),
+            }
+
+    def summary(self) -> str:
+        """A human readable table of the statistics."""
+        data = self.to_dict()
+        lines = [
+            f"{'endpoint':40} {'calls':>7} {'errors':>6} {'retries':>7} "
+            f"{'cached':>6} {'KiB':>9} {'total s':>8} {'p50<=':>6} {'p95<=':>6}"
+        ]
+        for e in data["endpoints"]:
+            lines.append(
+                f"{e['service'] + ' ' + e['endpoint']:40} {e['calls']:7} {e['errors']:6} "
+                f"{e['retries']:7} {e['cache_hits']:6} {e['bytes'] / 1024:9.1f} "
+                f"{e['seconds']:8.2f} {e['p50_seconds']:6} {e['p95_seconds']:6}"
+            )
+        for reason, seconds in sorted(data["sleep_seconds"].items()):
+            lines.append(f"Slept {seconds:.2f}s: {reason}")
+        return "\n".join(lines)
+
+    def write_json(self, filename: str) -> None:
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def write_prometheus(self, filename: str) -> None:
+        """Write the statistics in the Prometheus text format.
+
+        The file is written to a temporary name and renamed into place, as the node
+        exporter's textfile collector requires.
+        """
+        data = self.to_dict()
+        lines = []
+
+        def metric(name: str, kind: str, help: str) -> None:
+            lines.append(f"# HELP s2yt_{name} {help}")
+            lines.append(f"# TYPE s2yt_{name} {kind}")
+
+        def labels(e: Dict, **extra) -> str:
+            values = {"service": e["service"], "endpoint": e["endpoint"], **extra}
+            return ",".join(f'{k}="{v}"' for k, v in values.items())
+
+        for name, key, help in (
+            ("api_calls_total", "calls", "API calls made."),
+            ("api_errors_total", "errors", "API calls that failed."),
+            ("api_retries_total", "retries", "API calls retried."),
+            ("api_cache_hits_total", "cache_hits", "API calls answered from a cache."),
+            ("api_bytes_total", "bytes", "Response bytes transferred."),
+        ):
+            metric(name, "counter", help)
+            for e in data["endpoints"]:
+                lines.append(f"s2yt_{name}{{{labels(e)}}} {e[key]}")
+
+        metric("api_latency_seconds", "histogram", "API call latency.")
+        for e in data["endpoints"]:
+            cumulative = 0
+            for bound, count in e["buckets"].items():
+                cumulative += count
+                lines.append(
+                    f"s2yt_api_latency_seconds_bucket{{{labels(e, le=bound)}}} {cumulative}"
+                )
+            lines.append(f"s2yt_api_latency_seconds_sum{{{labels(e)}}} {e['seconds']}")
+            lines.append(f"s2yt_api_latency_seconds_count{{{labels(e)}}} {e['calls']}")
+
+        metric("sleep_seconds_total", "counter", "Time spent sleeping, by reason.")
+        for reason, seconds in sorted(data["sleep_seconds"].items()):
+            lines.append(f's2yt_sleep_seconds_total{{reason="{reason}"}} {seconds}')
+
+        tmp = f"{filename}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, filename)
+
+
+#  Process-wide metrics
+metrics = Metrics()
+
+_current = threading.local()
+
+
+def endpoint_name(method: str, args: tuple, kwargs: Dict) -> str:
+    """The endpoint a YTMusic call is counted under: the method, and the search filter."""
+    if method == "search":
+        return f"search:{kwargs.get('filter', args[1] if len(args) > 1 else None)}"
+    return method
+
+
+class InstrumentedYTMusic:
+    """Wraps a YTMusic client, recording every method call in `metrics`."""
+
+    def __init__(self, yt, registry: Metrics = metrics) -> None:
+        self._yt = yt
+        self._metrics = registry
+        session = getattr(yt, "_session", None)
+        if session is not None and hasattr(session, "hooks"):
+            session.hooks["response"].append(self._response_hook)
+
+    def _response_hook(self, response, *args, **kwargs):
+        endpoint = getattr(_current, "endpoint", None)
+        if endpoint is not None:
+            self._metrics.add_bytes("ytmusic", endpoint, len(response.content))
+        return response
+
+    def __getattr__(self, name: str):
+        method = getattr(self._yt, name)
+        if name.startswith("_") or not callable(method):
+            return method
+
+        def instrumented(*args, **kwargs):
+            endpoint = endpoint_name(name, args, kwargs)
+            _current.endpoint = endpoint
+            start = time.perf_counter()
+            error = False
+            try:
+                return method(*args, **kwargs)
+            except Exception:
+                error = True
+                raise
+            finally:
+                _current.endpoint = None
+                self._metrics.observe(
+                    "ytmusic", endpoint, time.perf_counter() - start, error
+                )
+
+        return instrumented
+
+
+def instrument_ytmusic(yt, registry: Metrics = metrics):
+    """Wrap `yt` in an `InstrumentedYTMusic`, unless it already is one."""
+    if isinstance(yt, InstrumentedYTMusic):
+        return yt
+    return InstrumentedYTMusic(yt, registry)
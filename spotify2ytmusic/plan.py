@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+
+"""Resolve first, write later: plan files.
+
+`s2yt_plan` looks up every track of the selected Spotify playlists, many at a time,
+and writes a plan file without changing anything on YTMusic.  The plan has one JSON
+object per line and per track:
+
+    {"playlist": "Road Trip", "spotify_playlist_id": "37i9...", "index": 0,
+     "track": {"title": ..., "artist": ..., "album": ...},
+     "video_id": "dQw4w9WgXcQ", "title": ..., "artist": ..., "album": ...,
+     "step": "song_search", "confidence": 1.0, "error": null}
+
+`"playlist"` is the name of the target YTMusic playlist, or null for the liked songs.
+The plan can be reviewed (and edited) before `s2yt_apply` performs only the writes:
+it creates the missing playlists and adds the tracks in batches.
+"""
+
+import json
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, TextIO
+
+from . import backend, reporting
+from .events import (
+    EventBus,
+    PlaylistDone,
+    TrackError,
+    TrackResolved,
+    TrackStarted,
+    TrackWritten,
+    bus,
+)
+from .profiling import phases, profiled
+
+#  How much a match from each lookup step can be trusted
+STEP_CONFIDENCE = {
+    "song_search": 1.0,
+    "album_browse": 0.9,
+    "song_fallback": 0.6,
+    "video_search": 0.4,
+}
+
+#  Tracks added per `add_playlist_items` call
+DEFAULT_BATCH_SIZE = backend.PLAYLIST_BATCH_SIZE
+
+
+def confidence(step: str, src: backend.SongInfo, dst: Dict) -> float:
+    """How likely `dst`, found by lookup step `step`, is the same song as `src`.
+
+    The exact steps are trusted as is, the fallbacks lose 0.2 for each of a
+    different title or artist.
+    """
+    value = STEP_CONFIDENCE.get(step, 0.5)
+    if step in ("song_fallback", "video_search"):
+        if not backend._same(dst.get("title"), src.title):
+            value -= 0.2
+        if not backend._same(backend._first_artist(dst), src.artist):
+            value -= 0.2
+    return round(max(value, 0.0), 2)
+
+
+_stats_lock = threading.Lock()
+
+
+def _resolve(
+    yt,
+    song: backend.SongInfo,
+    yt_search_algo: int,
+    max_calls: int,
+    stats: backend.LookupStats,
+) -> Dict:
+    """Look up `song`, returning the match part of its plan entry, and add its step
+    hit rates to `stats`."""
+    track_stats = backend.LookupStats()
+    start = time.perf_counter()
+    try:
+        with phases.phase("lookup"):
+            dst = backend.lookup_song(
+                yt,
+                song.title,
+                song.artist,
+                song.album,
+                yt_search_algo,
+                max_calls=max_calls,
+                stats=track_stats,
+                events=EventBus(),
+            )
+    except Exception as e:
+        entry = {"video_id": None, "step": None, "confidence": 0.0, "error": str(e)}
+    else:
+        step = next(name for name, s in track_stats.steps.items() if s.hits)
+        entry = {
+            "video_id": dst["videoId"],
+            "title": dst.get("title"),
+            "artist": backend._first_artist(dst),
+            "album": backend._album_name(dst),
+            "step": step,
+            "confidence": confidence(step, song, dst),
+            "error": None,
+        }
+    entry["lookup_seconds"] = time.perf_counter() - start
+    with _stats_lock:
+        for name, s in track_stats.steps.items():
+            stats.record(name, bool(s.hits), s.calls)
+        stats.add_track(track_stats.calls)
+    return entry
+
+
+def make_plan(
+    out: TextIO,
+    spotify_playlist_file: str = "playlists.json",
+    spotify_encoding: str = "utf-8",
+    playlists: Optional[List[str]] = None,
+    liked: bool = False,
+    yt_search_algo: int = 0,
+    reverse_playlist: bool = True,
+    lookup_max_calls: int = backend.DEFAULT_LOOKUP_MAX_CALLS,
+    workers: int = 8,
+    *,
+    yt=None,
+    events: Optional[EventBus] = None,
+) -> backend.LookupStats:
+    """Write the plan for copying the Spotify playlists to `out`.
+
+    `playlists` are the IDs or names of the playlists to plan (default: all but the
+    liked songs), `liked` adds the liked songs.  Up to `workers` lookups run at once,
+    and a track that is in several playlists is only looked up once.
+    """
+    if yt is None:
+        yt = backend.get_ytmusic()
+    if events is None:
+        events = bus
+    spotify_pls = backend.load_playlists_json(spotify_playlist_file, spotify_encoding)
+    stats = backend.LookupStats()
+
+    selected = []
+    for src_pl in spotify_pls["playlists"]:
+        is_liked = str(src_pl.get("name")) == "Liked Songs"
+        if is_liked:
+            if liked:
+                selected.append((src_pl, None))
+        elif not playlists or {src_pl.get("id"), src_pl.get("name")} & set(playlists):
+            pl_name = src_pl["name"] or f"Unnamed Spotify Playlist {src_pl['id']}"
+            selected.append((src_pl, pl_name))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        lookups: Dict = {}
+        work = []
+        for src_pl, pl_name in selected:
+            #  Liked songs are not reversed, see `load_liked`
+            songs = list(
+                backend._iter_playlist_tracks(
+                    src_pl, reverse_playlist and pl_name is not None, EventBus()
+                )
+            )
+            for song in songs:
+                if song not in lookups:
+                    lookups[song] = pool.submit(
+                        _resolve, yt, song, yt_search_algo, lookup_max_calls, stats
+                    )
+            work.append((src_pl, pl_name, songs))
+
+        for src_pl, pl_name, songs in work:
+            events.message(f"== Planning: {pl_name or 'Liked Songs'}")
+            for index, song in enumerate(songs):
+                events.emit(TrackStarted(song, index))
+                entry = dict(lookups[song].result())
+                if entry["error"]:
+                    events.emit(TrackError(song, "lookup", entry["error"]))
+                else:
+                    events.emit(
+                        TrackResolved(
+                            song,
+                            entry["video_id"],
+                            entry["title"],
+                            entry["artist"] or "<Unknown>",
+                            entry["album"],
+                            False,
+                            entry["lookup_seconds"],
+                        )
+                    )
+                del entry["lookup_seconds"]
+                out.write(
+                    json.dumps(
+                        {
+                            "playlist": pl_name,
+                            "spotify_playlist_id": src_pl.get("id"),
+                            "index": index,
+                            "track": song._asdict(),
+                            **entry,
+                        },
+                        ensure_ascii=False,
+                    )
+                    + "\n"
+                )
+
+    events.message(stats.summary())
+    return stats
+
+
+def read_plan(f: TextIO) -> Iterator[Dict]:
+    """The entries of a plan file, skipping blank lines."""
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+def _apply_playlist(
+    yt,
+    pl_name: Optional[str],
+    entries: List[Dict],
+    min_confidence: float,
+    batch_size: int,
+    privacy_status: str,
+    dry_run: bool,
+    events: EventBus,
+) -> PlaylistDone:
+    start = time.perf_counter()
+    dst_pl_id = None
+    if pl_name is not None and not dry_run:
+        dst_pl_id = backend.ensure_playlist(yt, pl_name, privacy_status, events)
+    events.message(f"== Applying: {pl_name or 'Liked Songs'}")
+
+    added = set()
+    written = duplicates = errors = skipped = 0
+    batch: List[Dict] = []
+
+    def flush() -> None:
+        nonlocal written, errors
+        if not batch:
+            return
+        write_start = time.perf_counter()
+        if dry_run or backend.write_batch(
+            yt, dst_pl_id, [e["video_id"] for e in batch], events
+        ):
+            written += len(batch)
+            for entry in batch:
+                events.emit(
+                    TrackWritten(
+                        backend.SongInfo(**entry["track"]),
+                        entry["video_id"],
+                        dst_pl_id,
+                        time.perf_counter() - write_start,
+                    )
+                )
+        else:
+            for entry in batch:
+                events.emit(
+                    TrackError(
+                        backend.SongInfo(**entry["track"]),
+                        "write",
+                        f"Could not add {entry['video_id']} after retries",
+                    )
+                )
+            errors += len(batch)
+        batch.clear()
+
+    for entry in entries:
+        video_id = entry.get("video_id")
+        if not video_id:
+            errors += 1
+            continue
+        if entry.get("confidence", 0.0) < min_confidence:
+            skipped += 1
+            continue
+        if video_id in added:
+            duplicates += 1
+            continue
+        added.add(video_id)
+        batch.append(entry)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    if skipped:
+        events.message(f"Skipped {skipped} tracks below confidence {min_confidence}")
+    done = PlaylistDone(
+        dst_pl_id, written, duplicates, errors, time.perf_counter() - start
+    )
+    events.emit(done)
+    return done
+
+
+def apply_plan(
+    entries: Iterator[Dict],
+    min_confidence: float = 0.0,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    privacy_status: str = "PRIVATE",
+    dry_run: bool = False,
+    *,
+    yt=None,
+    events: Optional[EventBus] = None,
+) -> List[PlaylistDone]:
+    """Perform the writes of a plan: create the playlists and add their tracks.
+
+    Entries without a match, or with a confidence below `min_confidence`, are not
+    written.  Consecutive entries for the same playlist are applied together.
+    """
+    if yt is None:
+        yt = backend.get_ytmusic()
+    if events is None:
+        events = bus
+
+    def apply_group(group: List[Dict]) -> PlaylistDone:
+        return _apply_playlist(
+            yt,
+            group[0]["playlist"],
+            group,
+            min_confidence,
+            batch_size,
+            privacy_status,
+            dry_run,
+            events,
+        )
+
+    results = []
+    group: List[Dict] = []
+    for entry in entries:
+        if group and entry["playlist"] != group[0]["playlist"]:
+            results.append(apply_group(group))
+            group = []
+        group.append(entry)
+    if group:
+        results.append(apply_group(group))
+    events.message("All done!")
+    return results
+
+
+@profiled
+def plan():
+    """Look up the Spotify tracks on YTMusic and write a plan file, without writing
+    anything to YTMusic."""
+    parser = ArgumentParser(description="Resolve Spotify playlists into a plan file")
+    parser.add_argument(
+        "plan_file", help="The plan file to write, '-' for standard output"
+    )
+    parser.add_argument(
+        "--spotify-playlist-file",
+        default="playlists.json",
+        help="The Spotify backup to plan from (default: playlists.json)",
+    )
+    parser.add_argument(
+        "--spotify-playlists-encoding",
+        default="utf-8",
+        help="The encoding of the `playlists.json` file.",
+    )
+    parser.add_argument(
+        "--playlist",
+        action="append",
+        help="Only plan the playlist with this ID or name (may be repeated, default: all)",
+    )
+    parser.add_argument(
+        "--liked", action="store_true", help="Also plan the liked songs"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="Number of lookups to run at once (default: 8)",
+    )
+    parser.add_argument(
+        "--algo",
+        type=int,
+        default=0,
+        help="Algorithm to use for search (0 = exact, 1 = extended, 2 = approximate)",
+    )
+    parser.add_argument(
+        "--max-calls",
+        type=int,
+        default=backend.DEFAULT_LOOKUP_MAX_CALLS,
+        help="Maximum number of YTMusic API calls to spend looking up each track "
+        f"(default: {backend.DEFAULT_LOOKUP_MAX_CALLS})",
+    )
+    parser.add_argument(
+        "--no-reverse-playlist",
+        action="store_true",
+        help="Do not reverse playlist on load, regular playlists are reversed normally "
+        "so they end up in the same order as on Spotify.",
+    )
+    reporting.add_arguments(parser)
+    args = parser.parse_args()
+
+    #  A plan written to standard output must not have the progress mixed into it
+    with reporting.use(args, sys.stderr if args.plan_file == "-" else None):
+        kwargs = dict(
+            spotify_playlist_file=args.spotify_playlist_file,
+            spotify_encoding=args.spotify_playlists_encoding,
+            playlists=args.playlist,
+            liked=args.liked,
+            yt_search_algo=args.algo,
+            reverse_playlist=not args.no_reverse_playlist,
+            lookup_max_calls=args.max_calls,
+            workers=args.workers,
+        )
+        if args.plan_file == "-":
+            make_plan(sys.stdout, **kwargs)
+        else:
+            with open(args.plan_file, "w", encoding="utf-8") as f:
+                make_plan(f, **kwargs)
+
+
+@profiled
+def apply():
+    """Create the playlists and add the tracks of a plan file."""
+    parser = ArgumentParser(description="Write the tracks of a plan file to YTMusic")
+    parser.add_argument(
+        "plan_file", help="The plan file written by s2yt_plan, '-' for standard input"
+    )
+    parser.add_argument(
+        "--min-confidence",
+        type=float,
+        default=0.0,
+        help="Skip matches with a lower confidence, between 0 and 1 (default: 0)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"Tracks to add per API call (default: {DEFAULT_BATCH_SIZE})",
+    )
+    parser.add_argument(
+        "--privacy",
+        default="PRIVATE",
+        help="The privacy seting of created playlists (PRIVATE, PUBLIC, UNLISTED, default PRIVATE)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Do not create playlists or add songs (default: False)",
+    )
+    reporting.add_arguments(parser)
+    args = parser.parse_args()
+
+    with reporting.use(args):
+        kwargs = dict(
+            min_confidence=args.min_confidence,
+            batch_size=args.batch_size,
+            privacy_status=args.privacy,
+            dry_run=args.dry_run,
+        )
+        if args.plan_file == "-":
+            apply_plan(read_plan(sys.stdin), **kwargs)
+        else:
+            with open(args.plan_file, "r", encoding="utf-8") as f:
+                apply_plan(read_plan(f), **kwargs)
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+
+"""Profiling hooks for the command line entry points.
+
+Every command decorated with `profiled` accepts these options, anywhere on the
+command line:
+
+    --profile[=FILE]    Run under cProfile, writing the stats to FILE (default
+                        `s2yt_<command>.pstats`) and a per-phase wall clock
+                        breakdown to `FILE.phases.json`.
+    --profile-sampler   Use a sampling profiler instead of cProfile, writing
+                        collapsed stacks (for flamegraph tools) to `FILE.folded`.
+    --profile-memory    Also report the peak memory use with tracemalloc.
+
+The phases (JSON load, lookup, write, sleep) are timed by `phases.phase()` blocks in
+the backend, which cost next to nothing when profiling is not enabled.
+"""
+
+import functools
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, List, Optional
+
+from . import tracing
+
+
+class PhaseTimer:
+    """Exclusive wall clock time per phase.
+
+    Phases nest: while a nested phase runs, the enclosing phase's clock is paused,
+    so a back-off sleep inside a write counts as "sleep" rather than "write".
+    Times are summed over threads.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.seconds: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def phase(self, name: str, detail: Optional[str] = None):
+        """Time the block as phase `name`, `detail` (such as why a sleep is made)
+        only shows in a `tracing` trace."""
+        tracer = tracing.active
+        if tracer is not None:
+            return self._traced_phase(tracer, name, detail)
+        if not self.enabled:
+            return nullcontext()
+        return self._phase(name)
+
+    @contextmanager
+    def _traced_phase(self, tracer, name: str, detail: Optional[str]):
+        with tracer.phase(name, detail), (
+            self._phase(name) if self.enabled else nullcontext()
+        ):
+            yield
+
+    @contextmanager
+    def _phase(self, name: str):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        now = time.perf_counter()
+        if stack:
+            parent, started = stack[-1]
+            self._add(parent, now - started)
+        stack.append([name, now])
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            _, started = stack.pop()
+            self._add(name, now - started)
+            if stack:
+                stack[-1][1] = now
+
+    def report(self, total: float) -> Dict:
+        other = max(0.0, total - sum(self.seconds.values()))
+        return {
+            "total_seconds": total,
+            "phases": {
+                name: {"seconds": seconds, "count": self.counts.get(name, 0)}
+                for name, seconds in sorted(self.seconds.items())
+            },
+            "other_seconds": other,
+        }
+
+
+#  Process-wide phase timer
+phases = PhaseTimer()
+
+
+class SamplingProfiler:
+    """A minimal stack sampling profiler for all threads, using only the stdlib."""
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack: List[str] = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def write(self, filename: str) -> None:
+        with open(filename, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _pop_profile_options(argv: List[str]) -> Optional[Dict]:
+    """Remove the profiling options from `argv`, returning them (None if not profiling)."""
+    options: Dict = {}
+    remaining = [argv[0]]
+    for arg in argv[1:]:
+        if arg == "--profile":
+            options["file"] = None
+        elif arg.startswith("--profile="):
+            options["file"] = arg.split("=", 1)[1]
+        elif arg == "--profile-sampler":
+            options["sampler"] = True
+        elif arg == "--profile-memory":
+            options["memory"] = True
+        else:
+            remaining.append(arg)
+    argv[:] = remaining
+    if not options:
+        return None
+    options.setdefault("file", None)
+    return options
+
+
+def run_profiled(func: Callable, name: str, options: Dict):
+    """Run `func()` under the profiler, writing the reports described in the module docstring."""
+    #  Imported here to keep them out of the startup time of every command
+    import cProfile
+    import tracemalloc
+
+    filename = options.get("file") or f"s2yt_{name}.pstats"
+    sampler = SamplingProfiler() if options.get("sampler") else None
+    profiler = None if sampler else cProfile.Profile()
+    if options.get("memory"):
+        tracemalloc.start()
+
+    phases.enabled = True
+    start = time.perf_counter()
+    if sampler:
+        sampler.start()
+    else:
+        profiler.enable()
+    try:
+        return func()
+    finally:
+        if sampler:
+            sampler.stop()
+        else:
+            profiler.disable()
+        total = time.perf_counter() - start
+        phases.enabled = False
+
+        report = phases.report(total)
+        if sampler:
+            sampler.write(f"{filename}.folded")
+            print(f"Profile samples written to {filename}.folded", file=sys.stderr)
+        else:
+            profiler.dump_stats(filename)
+            print(f"Profile stats written to {filename}", file=sys.stderr)
+        if options.get("memory"):
+            current, peak = tracemalloc.get_traced_memory()
+            report["memory"] = {
+                "peak_bytes": peak,
+                "current_bytes": current,
+                "top": [
+                    str(stat)
+                    for stat in tracemalloc.take_snapshot().statistics("lineno")[:10]
+                ],
+            }
+            tracemalloc.stop()
+        with open(f"{filename}.phases.json", "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+        print(f"Wall clock: {total:.2f}s", file=sys.stderr)
+        for phase, data in report["phases"].items():
+            print(
+                f"  {phase:12} {data['seconds']:10.2f}s ({data['count']} times)",
+                file=sys.stderr,
+            )
+        print(f"  {'other':12} {report['other_seconds']:10.2f}s", file=sys.stderr)
+        if "memory" in report:
+            print(
+                f"Peak memory: {report['memory']['peak_bytes'] / 2**20:.1f} MiB",
+                file=sys.stderr,
+            )
+
+
+def profiled(func: Callable) -> Callable:
+    """Decorate a command line entry point to accept the profiling options."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        options = _pop_profile_options(sys.argv)
+        if options is None:
+            return func(*args, **kwargs)
+        return run_profiled(lambda: func(*args, **kwargs), func.__name__, options)
+
+    return wrapper
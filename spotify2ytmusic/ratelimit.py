@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+"""Client side rate limiting of YTMusic API calls."""
+
+import multiprocessing
+import threading
+import time
+
+from .metrics import metrics
+
+
+class RateLimiter:
+    """A thread-safe token bucket: `rate` calls per second, in bursts of up to `burst`.
+
+    Callers reserve a token and then sleep until it is due, so concurrent callers are
+    spaced out rather than all waking up at once.  A `rate` of 0 disables the limit.
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token, returning how many seconds to wait before using it."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._last) * self.rate
+            )
+            self._last = now
+            self._tokens -= 1
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def acquire(self) -> None:
+        metrics.sleep("rate_limit", self.reserve())
+
+
+class SharedRateLimiter(RateLimiter):
+    """A `RateLimiter` shared by processes, pass it to them when they are created."""
+
+    def __init__(self, rate: float, burst: int = 1, context=None) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        #  tokens, last refill time; the clock is system wide
+        self._state = (context or multiprocessing).Array(
+            "d", [float(self.burst), time.monotonic()]
+        )
+
+    def reserve(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._state.get_lock():
+            now = time.monotonic()
+            tokens = min(
+                self.burst, self._state[0] + (now - self._state[1]) * self.rate
+            )
+            tokens -= 1
+            self._state[0], self._state[1] = tokens, now
+            return -tokens / self.rate if tokens < 0 else 0.0
+
+
+class RateLimitedYTMusic:
+    """Wraps a YTMusic client, taking a token from `limiter` before every API call."""
+
+    def __init__(self, yt, limiter: RateLimiter) -> None:
+        self._yt = yt
+        self._limiter = limiter
+
+    def __getattr__(self, name: str):
+        method = getattr(self._yt, name)
+        if name.startswith("_") or not callable(method):
+            return method
+
+        def limited(*args, **kwargs):
+            self._limiter.acquire()
+            return method(*args, **kwargs)
+
+        return limited
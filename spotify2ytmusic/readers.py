@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+"""Streaming readers of track lists, for `copier`.
+
+Besides the `playlists.json` backup, tracks can be read from:
+
+- tsv: the text format `spotify_backup` writes when not writing JSON, a playlist
+  name line followed by "name, artists, album, uri, release date" lines, and a
+  blank line after each playlist.
+- csv: an Exportify playlist export, with "Track Name", "Artist Name(s)" and
+  "Album Name" columns.
+- jsonl: one JSON object per line, with "title", "artist" and "album" keys, or a
+  Spotify playlist item ({"track": {...}}) as in `playlists.json`.
+
+The files are read a line at a time, so a list of any size is copied in constant
+memory.  "-" reads from standard input.  Files and standard input may be gzip or
+zstd compressed (see `compression`), the format is then detected from the name
+without the `.gz` or `.zst` extension.
+"""
+
+import csv
+import io
+import itertools
+import json
+import re
+import sys
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional, TextIO
+
+from . import compression
+from .backend import SongInfo
+from .events import EventBus, bus
+
+FORMATS = ("tsv", "csv", "jsonl")
+
+_EXTENSIONS = {
+    ".tsv": "tsv",
+    ".txt": "tsv",
+    ".csv": "csv",
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+}
+
+
+#  Artist names with ", " in them, which the text backup can't tell apart from
+#  several artists.  Any other ", " separates two artists.
+COMMA_NAMES = (
+    "Tyler, The Creator",
+    "Earth, Wind & Fire",
+    "Crosby, Stills, Nash & Young",
+    "Crosby, Stills & Nash",
+    "Emerson, Lake & Palmer",
+    "Emerson, Lake & Powell",
+    "Blood, Sweat & Tears",
+    "Peter, Paul and Mary",
+)
+_COMMA_NAMES = {name.casefold(): name for name in COMMA_NAMES}
+
+#  Exportify joins artists with ",", names such as "Tyler, The Creator" have ", "
+_EXPORTIFY_SEPARATOR = re.compile(r",(?! )")
+
+
+def _first_tsv_artist(artists: str) -> str:
+    """The first of the artists `spotify_backup` joined with ", ".
+
+    A name with ", " in it can't be told apart from two artists, so only the names
+    in `COMMA_NAMES` are kept whole, as `artists[0]["name"]` of the JSON backup
+    would have them.
+    """
+    parts = artists.split(", ")
+    for n in range(len(parts), 1, -1):
+        name = _COMMA_NAMES.get(", ".join(parts[:n]).strip().casefold())
+        if name is not None:
+            return name
+    return parts[0].strip() or artists.strip()
+
+
+def _first_csv_artist(artists: str) -> str:
+    return _EXPORTIFY_SEPARATOR.split(artists)[0].strip()
+
+
+def iter_tsv(
+    lines: Iterable[str],
+    playlist: Optional[str] = None,
+    events: Optional[EventBus] = None,
+) -> Iterator[SongInfo]:
+    """Songs from the `spotify_backup` text format, of all playlists or only `playlist`."""
+    if events is None:
+        events = bus
+    name = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line:
+            name = None
+            continue
+        if name is None:
+            name = line
+            if playlist is None or name == playlist:
+                events.message(f"== Spotify Playlist: {name}")
+            continue
+        if playlist is not None and name != playlist:
+            continue
+        fields = line.split("\t")
+        if len(fields) < 3:
+            events.message(
+                f"WARNING: Malformed track line, skipping: {line!r}", "warning"
+            )
+            continue
+        yield SongInfo(fields[0], _first_tsv_artist(fields[1]), fields[2])
+
+
+def iter_exportify_csv(
+    lines: Iterable[str], events: Optional[EventBus] = None
+) -> Iterator[SongInfo]:
+    """Songs from an Exportify CSV export."""
+    if events is None:
+        events = bus
+    for row in csv.DictReader(lines):
+        title = row.get("Track Name")
+        artists = row.get("Artist Name(s)", row.get("Artist Name"))
+        if not title or artists is None:
+            events.message(f"WARNING: Malformed CSV row, skipping: {row!r}", "warning")
+            continue
+        yield SongInfo(title, _first_csv_artist(artists), row.get("Album Name") or "")
+
+
+def _jsonl_song(record: Dict) -> SongInfo:
+    track = record.get("track", record)
+    if "name" in track:
+        #  A Spotify track, as in `playlists.json`
+        return SongInfo(
+            track["name"], track["artists"][0]["name"], track["album"]["name"]
+        )
+    return SongInfo(track["title"], track["artist"], track.get("album") or "")
+
+
+def iter_jsonl(
+    lines: Iterable[str], events: Optional[EventBus] = None
+) -> Iterator[SongInfo]:
+    """Songs from a JSONL file, one track per line."""
+    if events is None:
+        events = bus
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield _jsonl_song(json.loads(line))
+        except (ValueError, KeyError, TypeError, IndexError) as e:
+            events.message(
+                f"WARNING: Malformed JSONL line ({e}), skipping: {line!r}", "warning"
+            )
+
+
+def detect_format(filename: str, first_line: str) -> str:
+    """The format of `filename` by its extension, or else by its first line."""
+    filename = compression.strip_extension(filename)
+    for extension, format in _EXTENSIONS.items():
+        if filename.lower().endswith(extension):
+            return format
+    if first_line.lstrip().startswith("{"):
+        return "jsonl"
+    if "Track Name" in first_line:
+        return "csv"
+    return "tsv"
+
+
+@contextmanager
+def _open(filename: str, encoding: str) -> Iterator[TextIO]:
+    if filename == "-":
+        stdin = compression.wrap_reader(sys.stdin.buffer)
+        yield io.TextIOWrapper(stdin, encoding=encoding, newline="")
+        return
+    with compression.open_file(filename, "rt", encoding=encoding, newline="") as f:
+        yield f
+
+
+def iter_tracks(
+    filename: str,
+    format: Optional[str] = None,
+    encoding: str = "utf-8",
+    playlist: Optional[str] = None,
+    events: Optional[EventBus] = None,
+) -> Iterator[SongInfo]:
+    """Songs from `filename` ("-" for standard input) in `format` (detected if None).
+
+    `playlist` selects one playlist of a tsv file.
+    """
+    with _open(filename, encoding) as f:
+        first = f.readline()
+        lines = itertools.chain([first], f)
+        if format is None:
+            format = detect_format(filename, first)
+        if format == "tsv":
+            yield from iter_tsv(lines, playlist, events)
+        elif format == "csv":
+            yield from iter_exportify_csv(lines, events)
+        elif format == "jsonl":
+            yield from iter_jsonl(lines, events)
+        else:
+            raise ValueError(f"Unknown track list format: {format}")
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+"""The reporting options shared by the commands that look up or copy tracks.
+
+`--output`, `--stats`, `--stats-json`, `--stats-prometheus`, `--no-cache`, and the
+`cassette` and `tracing` options: `add_arguments()` adds them to a command's parser,
+`use()` applies them while the command runs.
+"""
+
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from typing import Optional, TextIO
+
+from . import cassette, events, response_cache, tracing
+from .metrics import metrics
+
+
+def add_arguments(parser: ArgumentParser) -> None:
+    """Add the progress output, statistics, cache, cassette and trace options of the
+    commands that look up or copy tracks, see `use()`."""
+    parser.add_argument(
+        "--output",
+        choices=events.OUTPUT_MODES,
+        default="text",
+        help="How to report progress: human readable text, one JSON object per line "
+        "(jsonl), or not at all (quiet) (default: text)",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print per-endpoint API call statistics when done",
+    )
+    parser.add_argument(
+        "--stats-json",
+        metavar="FILE",
+        help="Write per-endpoint API call statistics to FILE as JSON",
+    )
+    parser.add_argument(
+        "--stats-prometheus",
+        metavar="FILE",
+        help="Write per-endpoint API call statistics to FILE in the Prometheus textfile format",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not use or update the cache of YTMusic search, album and library "
+        f"playlist responses ({response_cache.CACHE_FILE})",
+    )
+    cassette.add_arguments(parser)
+    tracing.add_arguments(parser)
+
+
+@contextmanager
+def use(args, stream: Optional[TextIO] = None):
+    """Set up the progress output, and report the API call statistics requested on
+    the command line, even on failure.  Records or replays the API calls with the
+    cassette given by `--record` or `--replay`, and traces them with `--trace`.
+
+    Progress and statistics are printed to `stream` (default: standard output), for
+    commands that write their results to standard output.
+    """
+    events.set_output(args.output, stream)
+    if args.no_cache:
+        response_cache.disable()
+    try:
+        with cassette.use(cassette.from_args(args)), tracing.use(
+            tracing.from_args(args)
+        ):
+            yield
+    finally:
+        if args.stats:
+            print(file=stream)
+            print(metrics.summary(), file=stream)
+        if args.stats_json:
+            metrics.write_json(args.stats_json)
+        if args.stats_prometheus:
+            metrics.write_prometheus(args.stats_prometheus)
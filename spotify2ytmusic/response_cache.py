@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+"""A disk cache of YTMusic responses, shared by every command run in a directory.
+
+`search`, `get_album` and `get_library_playlists` responses are kept in a SQLite
+file for a time that depends on the endpoint (see `TTLS`), so re-running a lookup,
+for instance with a different `--algo`, reuses the results already downloaded.
+Creating or deleting a playlist drops the cached library playlists.  Responses are
+cached per account, since the same directory (and file) may serve several.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from . import tracing
+from .metrics import endpoint_name, metrics
+
+CACHE_FILE = "s2yt_cache.sqlite"
+
+#  Seconds a response stays cached, per YTMusic method
+TTLS: Dict[str, float] = {
+    "search": 24 * 3600,
+    "get_album": 7 * 24 * 3600,
+    "get_library_playlists": 10 * 60,
+}
+
+#  Methods that change what a cached method returns
+INVALIDATES: Dict[str, str] = {
+    "create_playlist": "get_library_playlists",
+    "delete_playlist": "get_library_playlists",
+}
+
+#  Whether `backend.get_ytmusic()` caches responses, see `disable()`
+enabled = True
+
+_shared: Dict[str, "ResponseCache"] = {}
+_shared_lock = threading.Lock()
+
+
+class ResponseCache:
+    """Responses of YTMusic methods, by method and arguments, in SQLite file `filename`.
+
+    Safe to use from several threads, and from several processes at once.
+    """
+
+    def __init__(
+        self, filename: str = CACHE_FILE, ttls: Optional[Dict[str, float]] = None
+    ) -> None:
+        self.filename = filename
+        self.ttls = TTLS if ttls is None else ttls
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        #  Opened on first use, so clients that make no cached call create no file
+        if self._connection is None:
+            db = sqlite3.connect(self.filename, timeout=30, check_same_thread=False)
+            with db:
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    " method TEXT, key TEXT, expires REAL, value TEXT,"
+                    " PRIMARY KEY (method, key))"
+                )
+                db.execute("DELETE FROM responses WHERE expires < ?", (time.time(),))
+            self._connection = db
+        return self._connection
+
+    @staticmethod
+    def key(args: tuple, kwargs: Dict, account: str = "") -> str:
+        return json.dumps(
+            [account, list(args), kwargs], sort_keys=True, ensure_ascii=False
+        )
+
+    def get(self, method: str, key: str):
+        """The cached response, or None if there is none or it has expired."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM responses WHERE method = ? AND key = ? AND expires >= ?",
+                (method, key, time.time()),
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, method: str, key: str, value) -> None:
+        expires = time.time() + self.ttls[method]
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (method, key, expires, json.dumps(value, ensure_ascii=False)),
+            )
+
+    def invalidate(self, method: str) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM responses WHERE method = ?", (method,))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+class CachedYTMusic:
+    """Wraps a YTMusic client, answering the methods in `cache.ttls` from `cache`.
+
+    `account` (such as the absolute path of the credentials file) keeps the
+    responses of each account apart: one account's library is never returned to
+    another.
+    """
+
+    def __init__(self, yt, cache: ResponseCache, account: str = "") -> None:
+        self._yt = yt
+        self._cache = cache
+        self._account = account
+
+    def __getattr__(self, name: str):
+        method = getattr(self._yt, name)
+        if name in INVALIDATES:
+
+            def invalidating(*args, **kwargs):
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    self._cache.invalidate(INVALIDATES[name])
+
+            return invalidating
+        if name not in self._cache.ttls:
+            return method
+
+        def cached(*args, **kwargs):
+            key = self._cache.key(args, kwargs, self._account)
+            response = self._cache.get(name, key)
+            if response is not None:
+                metrics.cache_hit("ytmusic", endpoint_name(name, args, kwargs))
+                return response
+            with tracing.cache_status("miss"):
+                response = method(*args, **kwargs)
+            self._cache.put(name, key, response)
+            return response
+
+        return cached
+
+
+def shared(filename: str = CACHE_FILE) -> ResponseCache:
+    """The process' `ResponseCache` for `filename`, opened on first use."""
+    path = os.path.abspath(filename)
+    with _shared_lock:
+        cache = _shared.get(path)
+        if cache is None:
+            cache = _shared[path] = ResponseCache(filename)
+        return cache
+
+
+def disable() -> None:
+    """Stop caching the responses of the YTMusic clients created from now on."""
+    global enabled
+    enabled = False
+
+
+if hasattr(os, "register_at_fork"):
+    #  A SQLite connection must not be used across a fork
+    os.register_at_fork(after_in_child=_shared.clear)
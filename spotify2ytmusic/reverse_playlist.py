@@ -1,52 +1,313 @@
 #!/usr/bin/env python3
 
+"""Reverse the track order of the playlists in a backup file.
+
+The backup is transformed as a stream, one playlist at a time, so peak memory is
+about the size of the largest playlist rather than of the whole library.  The result
+is written to a temporary file next to the output and renamed into place, so an
+interrupted run never leaves a half written backup behind.
+
+Both formats written by `spotify_backup` are supported: JSON and the tab separated
+text format, either of them plain or gzip or zstd compressed (see `compression`).
+The output is compressed the same way as the input file, or as the extension of
+`--output` asks.
+"""
+
 import json
 import os
 import shutil
+import sys
+import tempfile
 from argparse import ArgumentParser
+from typing import Callable, Collection, Dict, Iterator, Optional, TextIO, Tuple
+
+if __package__:
+    from . import compression, jsoncodec
+    from .profiling import profiled
+else:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from spotify2ytmusic import compression, jsoncodec
+    from spotify2ytmusic.profiling import profiled
+
+#  Size of the reads from the input file
+CHUNK_SIZE = 1024 * 1024
+
+
+class _JsonStream:
+    """Reads the JSON values of a file one at a time, with a bounded buffer."""
+
+    def __init__(self, f: TextIO, chunk_size: int = CHUNK_SIZE) -> None:
+        self._f = f
+        self._chunk_size = chunk_size
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self, size: int) -> bool:
+        """Read at least `size` more characters, returns False at end of file."""
+        if self._eof:
+            return False
+        data = self._f.read(max(size, self._chunk_size))
+        if not data:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos :] + data
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """The next non-whitespace character, "" at end of file."""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill(self._chunk_size):
+                return ""
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in JSON input, found {found!r}")
+        self._pos += 1
+
+    def value(self):
+        """Decode the next value, reading more of the file until it is complete."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                #  Doubling the read keeps re-decoding a large value linear overall
+                if not self._fill(len(self._buf) - self._pos):
+                    raise
+                continue
+            #  A number may continue past the end of the buffer
+            if end == len(self._buf) and self._fill(self._chunk_size):
+                continue
+            self._pos = end
+            return value
+
+    def items(self) -> Iterator[Tuple[str, "_JsonStream"]]:
+        """Iterate over the keys of an object, leaving the stream at each value."""
+        self.expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key, self
+            if self.peek() == ",":
+                self._pos += 1
+                continue
+            self.expect("}")
+            return
+
+    def elements(self) -> Iterator:
+        """Iterate over the elements of an array."""
+        self.expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ",":
+                self._pos += 1
+                continue
+            self.expect("]")
+            return
+
+
+def _dump(value, out: TextIO) -> None:
+    out.write(jsoncodec.dump_text(value))
+
+
+def _reverse_json(
+    src: TextIO, out: TextIO, selected: Callable[[Dict], bool]
+) -> Tuple[int, int]:
+    """Stream a JSON backup from `src` to `out`, reversing the selected playlists."""
+    stream = _JsonStream(src)
+    reversed_count = total = 0
+    out.write("{")
+    for i, (key, _) in enumerate(stream.items()):
+        if i:
+            out.write(", ")
+        _dump(key, out)
+        out.write(": ")
+        if stream.peek() != "[":
+            _dump(stream.value(), out)
+            continue
+        out.write("[")
+        for j, element in enumerate(stream.elements()):
+            if j:
+                out.write(", ")
+            if key == "playlists":
+                total += 1
+                if selected(element):
+                    element["tracks"] = element["tracks"][::-1]
+                    reversed_count += 1
+            _dump(element, out)
+        out.write("]")
+    out.write("}")
+    return reversed_count, total
+
+
+def _iter_tsv_playlists(src: TextIO) -> Iterator[Tuple[str, list]]:
+    """Yield (name, track lines) for each playlist of a tab separated backup."""
+    name = None
+    tracks: list = []
+    for line in src:
+        line = line.rstrip("\r\n")
+        if name is None:
+            if line:
+                name = line
+            continue
+        if line:
+            tracks.append(line)
+            continue
+        yield name, tracks
+        name, tracks = None, []
+    if name is not None:
+        yield name, tracks
+
+
+def _reverse_tsv(
+    src: TextIO, out: TextIO, selected: Callable[[Dict], bool]
+) -> Tuple[int, int]:
+    """Stream a tab separated backup from `src` to `out`, reversing the selected playlists."""
+    reversed_count = total = 0
+    for name, tracks in _iter_tsv_playlists(src):
+        total += 1
+        if selected({"name": name}):
+            tracks.reverse()
+            reversed_count += 1
+        out.write(name + "\r\n")
+        for track in tracks:
+            out.write(track + "\r\n")
+        out.write("\r\n")
+    return reversed_count, total
+
 
+def _fsync(filename: str) -> None:
+    fd = os.open(filename, os.O_RDWR)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
 
-def reverse_playlist(input_file="playlists.json", verbose=True, replace=False) -> int:
-    if os.path.exists(input_file) and not replace:
+
+def detect_format(input_file: str) -> str:
+    """ "json" or "tsv", from the first non-blank character of the file."""
+    with compression.open_file(input_file, "rt", encoding="utf-8") as f:
+        while True:
+            chunk = f.read(4096)
+            if not chunk:
+                return "json"
+            stripped = chunk.lstrip()
+            if stripped:
+                return "json" if stripped[0] == "{" else "tsv"
+
+
+def reverse_playlist(
+    input_file="playlists.json",
+    verbose=True,
+    replace=False,
+    *,
+    output_file: Optional[str] = None,
+    playlists: Optional[Collection[str]] = None,
+    backup: bool = True,
+) -> int:
+    """Reverse the tracks of the playlists in `input_file`.
+
+    The result replaces `input_file`, after hard linking (or copying) the original to
+    `<name>_backup<ext>`, unless `output_file` is given.  `replace` allows overwriting
+    an existing backup or output file.  `playlists` limits the reversal to the
+    playlists with these IDs or names.
+    """
+    if not os.path.exists(input_file):
         if verbose:
-            print(
-                "Output file already exists and no replace argument detected, exiting..."
-            )
+            print(f"Input file {input_file} does not exist, exiting...")
         return 1
 
-    print("Backing up file...")
-    shutil.copyfile(input_file, input_file.split(".")[0] + "_backup.json")
-    # Load the JSON file
-    with open(input_file, "r") as file:
-        if verbose:
-            print("Loading initial JSON file...")
-        data = json.load(file)
+    #  "playlists.json.gz" is backed up to "playlists_backup.json.gz"
+    stem = compression.strip_extension(input_file)
+    root, ext = os.path.splitext(stem)
+    ext += input_file[len(stem) :]
+    backup_file = f"{root}_backup{ext}" if backup and output_file is None else None
+    target = output_file or input_file
+    for existing in (backup_file, output_file):
+        if existing and os.path.exists(existing) and not replace:
+            if verbose:
+                print(
+                    f"Output file {existing} already exists and no replace argument detected, exiting..."
+                )
+            return 1
 
-    # Copy the data to a new dictionary
-    data2 = data.copy()
+    wanted = set(playlists) if playlists else None
 
-    if verbose:
-        print("Reversing playlists...")
-    # Reverse the order of items in the "tracks" list
-    for i in range(len(data2["playlists"])):
-        # Reverse the tracks in the playlist
-        data2["playlists"][i]["tracks"] = data2["playlists"][i]["tracks"][::-1]
+    def selected(playlist: Dict) -> bool:
+        return wanted is None or bool(
+            {playlist.get("id"), playlist.get("name")} & wanted
+        )
 
+    fmt = detect_format(input_file)
+    input_codec = compression.detect(input_file)
+    output_codec = (
+        compression.codec_for(output_file) if output_file is not None else input_codec
+    )
     if verbose:
-        print("Writing to file... (this can take a while)")
-    # Write the modified JSON back to the file
-    with open(input_file, "w") as file:
-        json.dump(data2, file)
+        print(f"Reversing playlists ({fmt})...")
+
+    fd, tmp = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(target)),
+        prefix=os.path.basename(target) + ".",
+        suffix=".tmp",
+    )
+    os.close(fd)
+    try:
+        with compression.open_file(
+            input_file, "rt", encoding="utf-8", newline="", codec=input_codec
+        ) as src, compression.open_file(
+            tmp, "wt", encoding="utf-8", newline="", codec=output_codec
+        ) as out:
+            transform = _reverse_json if fmt == "json" else _reverse_tsv
+            reversed_count, total = transform(src, out, selected)
+        #  After closing, which writes the end of a compressed file
+        _fsync(tmp)
+        shutil.copymode(input_file, tmp)
+
+        if backup_file:
+            if os.path.exists(backup_file):
+                os.remove(backup_file)
+            try:
+                os.link(input_file, backup_file)
+            except OSError:
+                shutil.copyfile(input_file, backup_file)
+        os.replace(tmp, target)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
 
     if verbose:
+        print(f"Reversed {reversed_count} of {total} playlists")
+        if wanted and reversed_count < len(wanted):
+            print("WARNING: Some of the requested playlists were not found")
+        if backup_file:
+            print(f"The original was saved as {backup_file}")
         print("Done!")
-        print(f"File can be found at {input_file}")
+        print(f"File can be found at {target}")
 
     return 0
 
 
-if __name__ == "__main__":
-    parser = ArgumentParser()
+@profiled
+def main():
+    parser = ArgumentParser(
+        description="Reverse the track order of backed up playlists"
+    )
     parser.add_argument("input_file", type=str, help="Path to the input file")
     parser.add_argument(
         "-v", "--verbose", action="store_false", help="Enable verbose mode"
@@ -57,7 +318,37 @@ if __name__ == "__main__":
         action="store_true",
         help="Replace the output file if already existing",
     )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="Write the result to this file instead of replacing the input file",
+    )
+    parser.add_argument(
+        "-p",
+        "--playlist",
+        action="append",
+        help="Only reverse the playlist with this ID or name (may be repeated)",
+    )
+    parser.add_argument(
+        "--no-backup",
+        action="store_true",
+        help="Don't keep a copy of the original file when replacing it",
+    )
 
     args = parser.parse_args()
 
-    reverse_playlist(args.input_file, args.verbose, args.replace)
+    sys.exit(
+        reverse_playlist(
+            args.input_file,
+            args.verbose,
+            args.replace,
+            output_file=args.output,
+            playlists=args.playlist,
+            backup=not args.no_backup,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+
+"""A job runner for migrating many accounts from one machine.
+
+Jobs are submitted over a local HTTP API.  Each job names an operation, the Spotify
+backup file to read and the YTMusic credentials file of the account to write to:
+
+    POST /jobs      {"operation": "copy_all_playlists",
+                     "backup_file": "alice/playlists.json",
+                     "credentials_file": "alice/oauth.json",
+                     "params": {"yt_search_algo": 1}}
+    GET  /jobs      All jobs, oldest first
+    GET  /jobs/ID   One job, with its status and progress
+    GET  /accounts  Running and queued jobs per account
+    POST /jobs/ID/pause, /jobs/ID/resume, /jobs/ID/cancel
+
+A running job is paused or cancelled at its next track or playlist; a cancelled job
+still writes the tracks it has looked up, so a low priority job can make way for
+another without losing what it did.
+
+A pool of worker threads runs the jobs.  Jobs of the same account (credentials
+file) run at most `account_concurrency` at a time, and share a rate limit on their
+YTMusic API calls, so many accounts can be driven at once without any one of them
+being throttled.
+"""
+
+import itertools
+import json
+import os
+import threading
+import time
+import http.server
+from argparse import ArgumentParser
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional
+
+from . import backend
+from .cancel import CancelToken
+from .events import (
+    Event,
+    EventBus,
+    Message,
+    PlaylistDone,
+    TrackError,
+    TrackResolved,
+    TrackStarted,
+    TrackWritten,
+)
+from .likes import DEFAULT_LIKE_WORKERS, LikeWriter
+from .profiling import profiled
+from .ratelimit import RateLimitedYTMusic, RateLimiter
+
+#  Parameters common to all operations, and their defaults in the runner.  There is
+#  no per-track sleep by default, the per-account rate limit paces the API calls.
+COMMON_PARAMS = {
+    "dry_run": False,
+    "track_sleep": 0.0,
+    "yt_search_algo": 0,
+    "lookup_max_calls": backend.DEFAULT_LOOKUP_MAX_CALLS,
+    "spotify_playlists_encoding": "utf-8",
+}
+
+#  operation: (required parameters, optional parameters with their defaults)
+OPERATIONS: Dict[str, tuple] = {
+    "copy_playlist": (
+        ("spotify_playlist_id", "ytmusic_playlist_id"),
+        dict(COMMON_PARAMS, reverse_playlist=True, privacy_status="PRIVATE"),
+    ),
+    "copy_all_playlists": (
+        (),
+        dict(
+            COMMON_PARAMS,
+            reverse_playlist=True,
+            privacy_status="PRIVATE",
+            journal_file=None,
+        ),
+    ),
+    "load_liked": (
+        (),
+        dict(COMMON_PARAMS, reverse_playlist=False, like_workers=DEFAULT_LIKE_WORKERS),
+    ),
+}
+
+
+@dataclass
+class Job:
+    id: str
+    operation: str
+    backup_file: str
+    credentials_file: str
+    params: Dict
+    status: str = field(default="queued")  # queued, running, done, failed or cancelled
+    error: Optional[str] = field(default=None)
+    submitted: float = field(default_factory=time.time)
+    started: Optional[float] = field(default=None)
+    finished: Optional[float] = field(default=None)
+    tracks: int = field(default=0)
+    added: int = field(default=0)
+    duplicates: int = field(default=0)
+    errors: int = field(default=0)
+    playlists_done: int = field(default=0)
+    messages: Deque[str] = field(default_factory=lambda: deque(maxlen=20))
+    _done: threading.Event = field(
+        default_factory=threading.Event, init=False, repr=False
+    )
+    _cancel: CancelToken = field(default_factory=CancelToken, init=False, repr=False)
+
+    @property
+    def account(self) -> str:
+        return os.path.realpath(self.credentials_file)
+
+    def on_event(self, event: Event) -> None:
+        """Update the progress counters from the job's events."""
+        if isinstance(event, TrackStarted):
+            self.tracks += 1
+        elif isinstance(event, TrackResolved):
+            self.duplicates += int(event.duplicate)
+        elif isinstance(event, TrackWritten):
+            self.added += 1
+        elif isinstance(event, TrackError):
+            self.errors += 1
+        elif isinstance(event, PlaylistDone):
+            self.playlists_done += 1
+        elif isinstance(event, Message) and event.text.strip():
+            self.messages.append(event.text.strip())
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "operation": self.operation,
+            "backup_file": self.backup_file,
+            "credentials_file": self.credentials_file,
+            "params": self.params,
+            "status": self.status,
+            "paused": self._cancel.paused,
+            "error": self.error,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+            "progress": {
+                "tracks": self.tracks,
+                "added": self.added,
+                "duplicates": self.duplicates,
+                "errors": self.errors,
+                "playlists_done": self.playlists_done,
+            },
+            "messages": list(self.messages),
+        }
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the job to finish, returns False on timeout."""
+        return self._done.wait(timeout)
+
+
+def validate(operation: str, params: Dict) -> Dict:
+    """Check the parameters of `operation`, returning them with the defaults filled in."""
+    if operation not in OPERATIONS:
+        raise ValueError(
+            f"Unknown operation {operation!r}, expected one of {', '.join(OPERATIONS)}"
+        )
+    required, optional = OPERATIONS[operation]
+    unknown = set(params) - set(required) - set(optional)
+    if unknown:
+        raise ValueError(
+            f"Unknown parameters for {operation}: {', '.join(sorted(unknown))}"
+        )
+    missing = [name for name in required if name not in params]
+    if missing:
+        raise ValueError(f"Missing parameters for {operation}: {', '.join(missing)}")
+    return dict(optional, **params)
+
+
+def run_operation(job: Job, yt, events: EventBus) -> None:
+    """Run the backend function for `job`, with the YTMusic client `yt`."""
+    p = dict(job.params)
+    common = dict(
+        dry_run=p.pop("dry_run"),
+        track_sleep=p.pop("track_sleep"),
+        yt_search_algo=p.pop("yt_search_algo"),
+        lookup_max_calls=p.pop("lookup_max_calls"),
+        yt=yt,
+        events=events,
+        cancel=job._cancel,
+    )
+    encoding = p.pop("spotify_playlists_encoding")
+    if job.operation == "copy_playlist":
+        backend.copy_playlist(
+            spotify_playlist_file=job.backup_file,
+            spotify_playlists_encoding=encoding,
+            **p,
+            **common,
+        )
+    elif job.operation == "copy_all_playlists":
+        backend.copy_all_playlists(
+            spotify_playlist_file=job.backup_file,
+            spotify_playlists_encoding=encoding,
+            **p,
+            **common,
+        )
+    else:
+        reverse_playlist = p.pop("reverse_playlist")
+        common["src_tracks"] = backend.iter_spotify_playlist(
+            None,
+            spotify_playlist_file=job.backup_file,
+            spotify_encoding=encoding,
+            reverse_playlist=reverse_playlist,
+            events=events,
+        )
+        #  `yt` is already rate limited per account
+        like_writer = LikeWriter(
+            yt,
+            p.pop("like_workers"),
+            0,
+            preserve_order=reverse_playlist,
+            events=events,
+            cancel=job._cancel,
+        )
+        try:
+            backend.copier(dst_pl_id=None, like_writer=like_writer, **common)
+        finally:
+            like_writer.close()
+
+
+@dataclass
+class _Account:
+    limiter: RateLimiter
+    running: int = field(default=0)
+
+
+class Runner:
+    """Runs jobs on `workers` threads, with per-account concurrency and rate limits.
+
+    `rate` is the sustained number of YTMusic API calls per second allowed for each
+    account, with bursts of up to `burst` calls.  `client_factory(credentials_file)`
+    returns the YTMusic client for an account (default: `backend.get_ytmusic`).
+    """
+
+    def __init__(
+        self,
+        workers: int = 16,
+        account_concurrency: int = 1,
+        rate: float = 2.0,
+        burst: int = 5,
+        client_factory: Optional[Callable] = None,
+    ) -> None:
+        self.workers = workers
+        self.account_concurrency = account_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.client_factory = client_factory or backend.get_ytmusic
+        self.jobs: Dict[str, Job] = {}
+        self._pending: List[Job] = []
+        self._accounts: Dict[str, _Account] = {}
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"runner-{n}", daemon=True)
+            for n in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _account(self, key: str) -> _Account:
+        account = self._accounts.get(key)
+        if account is None:
+            account = self._accounts[key] = _Account(RateLimiter(self.rate, self.burst))
+        return account
+
+    def submit(
+        self,
+        operation: str,
+        backup_file: str,
+        credentials_file: str,
+        params: Optional[Dict] = None,
+    ) -> Job:
+        """Queue a job, raising ValueError if it is invalid."""
+        params = validate(operation, params or {})
+        for name, filename in (
+            ("backup_file", backup_file),
+            ("credentials_file", credentials_file),
+        ):
+            if not isinstance(filename, str) or not filename:
+                raise ValueError(f"Missing {name}")
+            if not os.path.exists(filename):
+                raise ValueError(f"{name} {filename!r} does not exist")
+        with self._cond:
+            job = Job(
+                str(next(self._ids)), operation, backup_file, credentials_file, params
+            )
+            self.jobs[job.id] = job
+            self._pending.append(job)
+            self._cond.notify()
+        return job
+
+    def _next_job(self) -> Optional[Job]:
+        """The oldest queued job whose account has a free slot (lock held)."""
+        for i, job in enumerate(self._pending):
+            if self._account(job.account).running < self.account_concurrency:
+                return self._pending.pop(i)
+        return None
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                job = None
+                while not self._stopping:
+                    job = self._next_job()
+                    if job is not None:
+                        break
+                    self._cond.wait()
+                if job is None:
+                    return
+                account = self._account(job.account)
+                account.running += 1
+                job.status = "running"
+                job.started = time.time()
+            try:
+                self._run(job, account)
+            finally:
+                with self._cond:
+                    account.running -= 1
+                    self._cond.notify_all()
+                job._done.set()
+
+    def _run(self, job: Job, account: _Account) -> None:
+        events = EventBus()
+        events.subscribe(job.on_event)
+        try:
+            yt = RateLimitedYTMusic(
+                self.client_factory(job.credentials_file), account.limiter
+            )
+            run_operation(job, yt, events)
+            job.status = "cancelled" if job._cancel.cancelled else "done"
+        except SystemExit as e:
+            job.status = "failed"
+            job.error = f"Exited with status {e.code}, see the runner output"
+        except Exception as e:
+            job.status = "failed"
+            job.error = f"{type(e).__name__}: {e}"
+        job.finished = time.time()
+
+    def cancel(self, job_id: str) -> Job:
+        """Cancel a job: a queued job is dropped, a running one stops at its next track.
+
+        Raises KeyError if there is no such job.
+        """
+        with self._cond:
+            job = self.jobs[job_id]
+            job._cancel.cancel()
+            if job in self._pending:
+                self._pending.remove(job)
+                job.status = "cancelled"
+                job.finished = time.time()
+                job._done.set()
+        return job
+
+    def pause(self, job_id: str) -> Job:
+        """Hold a job at its next track until `resume()`."""
+        job = self.jobs[job_id]
+        job._cancel.pause()
+        return job
+
+    def resume(self, job_id: str) -> Job:
+        job = self.jobs[job_id]
+        job._cancel.resume()
+        return job
+
+    def accounts(self) -> Dict:
+        with self._cond:
+            queued: Dict[str, int] = {}
+            for job in self._pending:
+                queued[job.account] = queued.get(job.account, 0) + 1
+            return {
+                key: {
+                    "running": account.running,
+                    "queued": queued.get(key, 0),
+                    "rate": account.limiter.rate,
+                    "burst": account.limiter.burst,
+                }
+                for key, account in self._accounts.items()
+            }
+
+    def stop(self) -> None:
+        """Stop the workers once their current jobs finish, queued jobs are not run."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+
+class _RunnerHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, status: int, body: Dict) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        runner: Runner = self.server.runner
+        parts = self.path.strip("/").split("/")
+        if parts == ["jobs"]:
+            self._reply(
+                200, {"jobs": [job.to_dict() for job in list(runner.jobs.values())]}
+            )
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = runner.jobs.get(parts[1])
+            if job is None:
+                self._reply(404, {"error": f"No job {parts[1]}"})
+            else:
+                self._reply(200, job.to_dict())
+        elif parts == ["accounts"]:
+            self._reply(200, {"accounts": runner.accounts()})
+        else:
+            self._reply(404, {"error": "Not found"})
+
+    def do_POST(self):
+        runner: Runner = self.server.runner
+        parts = self.path.strip("/").split("/")
+        length = int(self.headers.get("Content-Length", 0))
+        data = self.rfile.read(length)
+        if (
+            len(parts) == 3
+            and parts[0] == "jobs"
+            and parts[2] in ("pause", "resume", "cancel")
+        ):
+            try:
+                job = getattr(runner, parts[2])(parts[1])
+            except KeyError:
+                self._reply(404, {"error": f"No job {parts[1]}"})
+                return
+            self._reply(200, job.to_dict())
+            return
+        if parts != ["jobs"]:
+            self._reply(404, {"error": "Not found"})
+            return
+        try:
+            body = json.loads(data or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError("Expected a JSON object")
+            job = runner.submit(
+                body.get("operation"),
+                body.get("backup_file"),
+                body.get("credentials_file"),
+                body.get("params"),
+            )
+        except ValueError as e:
+            self._reply(400, {"error": str(e)})
+            return
+        self._reply(201, job.to_dict())
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(
+    runner: Runner, host: str = "127.0.0.1", port: int = 8765
+) -> http.server.ThreadingHTTPServer:
+    """Serve the job API of `runner` on a background thread, returning the server.
+
+    Use `port=0` to pick a free port, see `server.server_address`.  Call
+    `server.shutdown()` when done.
+    """
+    server = http.server.ThreadingHTTPServer((host, port), _RunnerHandler)
+    server.daemon_threads = True
+    server.runner = runner
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@profiled
+def main():
+    """Run the job runner and its HTTP API until interrupted."""
+    parser = ArgumentParser(description="Run migration jobs for many accounts")
+    parser.add_argument(
+        "--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)"
+    )
+    parser.add_argument(
+        "--port", type=int, default=8765, help="Port to listen on (default: 8765)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=16,
+        help="Number of jobs to run at once, over all accounts (default: 16)",
+    )
+    parser.add_argument(
+        "--account-concurrency",
+        type=int,
+        default=1,
+        help="Number of jobs to run at once for each account (default: 1)",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=2.0,
+        help="YTMusic API calls per second allowed for each account, 0 for no limit "
+        "(default: 2)",
+    )
+    parser.add_argument(
+        "--burst",
+        type=int,
+        default=5,
+        help="Number of YTMusic API calls each account may make in a burst (default: 5)",
+    )
+    args = parser.parse_args()
+
+    runner = Runner(args.workers, args.account_concurrency, args.rate, args.burst)
+    server = serve(runner, args.host, args.port)
+    print("Job API listening on http://%s:%d/jobs" % server.server_address[:2])
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("Stopping, waiting for running jobs to finish...")
+        server.shutdown()
+        runner.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+"""`copy_all_playlists` over a pool of worker processes.
+
+The playlists are handed out largest first, which keeps the workers evenly loaded
+until the end.  Each worker keeps one YTMusic session for all its playlists.  The
+workers share a rate limit on their YTMusic calls, and append each finished
+playlist to a journal file, so an interrupted run can be resumed without copying
+the finished playlists again.  Their API call statistics are merged into the
+parent's `metrics`.
+"""
+
+import json
+import multiprocessing
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from . import backend, cassette, tracing
+from . import events as events_module
+from .events import EventBus, PlaylistDone, bus
+from .metrics import metrics
+from .ratelimit import RateLimitedYTMusic, SharedRateLimiter
+
+#  State of a worker process, set up by `_init_worker`
+_worker: Dict = {}
+
+
+def read_journal(journal_file: str) -> Dict[str, Dict]:
+    """The journal records of the playlists that were copied in full without errors, by ID."""
+    done = {}
+    if os.path.exists(journal_file):
+        with open(journal_file, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if not (
+                    record.get("error")
+                    or record.get("errors")
+                    or record.get("cancelled")
+                ):
+                    done[record["spotify_playlist_id"]] = record
+    return done
+
+
+def journal_record(spotify_playlist_id: str, name: str, done: PlaylistDone) -> Dict:
+    """The journal record of a playlist copied by `backend.copier`."""
+    return {
+        "spotify_playlist_id": spotify_playlist_id,
+        "name": name,
+        "pid": os.getpid(),
+        "ytmusic_playlist_id": done.playlist_id,
+        "added": done.added,
+        "duplicates": done.duplicates,
+        "errors": done.errors,
+        "seconds": done.seconds,
+        "lookup_summary": done.lookup_summary,
+        "cancelled": done.cancelled,
+    }
+
+
+def append_journal(journal_file: str, record: Dict) -> None:
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with open(journal_file, "a", encoding="utf-8") as f:
+        f.write(line)
+
+
+def _init_worker(
+    client_factory: Callable,
+    credentials_file: str,
+    limiter: SharedRateLimiter,
+    journal_file: Optional[str],
+    journal_lock,
+    output: str,
+    options: Dict,
+) -> None:
+    events_module.set_output(output)
+    metrics.reset()
+    #  A forked worker inherits the parent's open trace and cassette files, and
+    #  writing to them would mix (or repeat) its buffered output with the parent's
+    tracing.active = None
+    if cassette.active is not None and not cassette.active.replaying:
+        cassette.active = None
+    _worker.update(
+        yt=RateLimitedYTMusic(client_factory(credentials_file), limiter),
+        journal_file=journal_file,
+        journal_lock=journal_lock,
+        options=options,
+    )
+
+
+def _journal(record: Dict) -> None:
+    if _worker["journal_file"] is None:
+        return
+    with _worker["journal_lock"]:
+        append_journal(_worker["journal_file"], record)
+
+
+def _copy_task(task: Tuple[str, List[Dict]]) -> Tuple[List[Dict], Dict]:
+    """Copy the Spotify playlists named `pl_name` (in a worker process).
+
+    Returns a record of each playlist, and the API call statistics of the task.
+    """
+    pl_name, src_pls = task
+    yt = _worker["yt"]
+    options = _worker["options"]
+    metrics.reset()
+    records = []
+    for src_pl in src_pls:
+        start = time.perf_counter()
+        try:
+            dst_pl_id = backend.get_playlist_id_by_name(yt, pl_name)
+            done = backend.copier(
+                backend._iter_playlist_tracks(src_pl, options["reverse_playlist"], bus),
+                dst_pl_id,
+                options["dry_run"],
+                options["track_sleep"],
+                options["yt_search_algo"],
+                yt=yt,
+                lookup_max_calls=options["lookup_max_calls"],
+                new_playlist=backend.NewPlaylist(
+                    pl_name, pl_name, options["privacy_status"]
+                ),
+            )
+            record = journal_record(src_pl["id"], pl_name, done)
+        except (Exception, SystemExit) as e:
+            #  A SystemExit would take down the pool's worker and lose the task
+            record = dict(
+                spotify_playlist_id=src_pl["id"],
+                name=pl_name,
+                pid=os.getpid(),
+                ytmusic_playlist_id=None,
+                added=0,
+                duplicates=0,
+                errors=1,
+                seconds=time.perf_counter() - start,
+                lookup_summary="",
+                error=f"{type(e).__name__}: {e}",
+            )
+        _journal(record)
+        records.append(record)
+    return records, metrics.to_dict()
+
+
+def copy_all_playlists_sharded(
+    processes: int,
+    track_sleep: float = 0.1,
+    dry_run: bool = False,
+    spotify_playlists_encoding: str = "utf-8",
+    yt_search_algo: int = 0,
+    reverse_playlist: bool = True,
+    privacy_status: str = "PRIVATE",
+    lookup_max_calls: int = backend.DEFAULT_LOOKUP_MAX_CALLS,
+    *,
+    spotify_playlist_file: str = "playlists.json",
+    credentials_file: str = "oauth.json",
+    rate: float = 0.0,
+    journal_file: Optional[str] = None,
+    output: str = "text",
+    client_factory: Optional[Callable] = None,
+    events: Optional[EventBus] = None,
+) -> List[PlaylistDone]:
+    """Copy all Spotify playlists (except Liked Songs) using `processes` worker processes.
+
+    The workers make at most `rate` YTMusic calls per second between them (0 for no
+    limit).  Playlists recorded without errors in `journal_file` are skipped.
+    `client_factory(credentials_file)` creates each worker's YTMusic client
+    (default: `backend.get_ytmusic`), `output` is the workers' `events.set_output()`
+    mode.  Returns the `PlaylistDone` of each playlist copied.
+    """
+    if events is None:
+        events = bus
+    spotify_pls = backend.load_playlists_json(
+        spotify_playlist_file, spotify_playlists_encoding
+    )
+    finished = read_journal(journal_file) if journal_file else {}
+
+    #  Playlists with the same name go to the same YTMusic playlist, so they are
+    #  copied by the same worker, one after the other
+    tasks: Dict[str, List[Dict]] = {}
+    for src_pl in spotify_pls["playlists"]:
+        if str(src_pl.get("name")) == "Liked Songs":
+            continue
+        if src_pl["id"] in finished:
+            continue
+        pl_name = src_pl["name"] or f"Unnamed Spotify Playlist {src_pl['id']}"
+        tasks.setdefault(pl_name, []).append(src_pl)
+    if finished:
+        events.message(
+            f"Skipping {len(finished)} playlists already done in {journal_file}"
+        )
+    ordered = sorted(
+        tasks.items(),
+        key=lambda task: sum(len(src_pl["tracks"]) for src_pl in task[1]),
+        reverse=True,
+    )
+
+    context = multiprocessing.get_context()
+    limiter = SharedRateLimiter(rate, max(1, processes), context)
+    options = dict(
+        track_sleep=track_sleep,
+        dry_run=dry_run,
+        yt_search_algo=yt_search_algo,
+        reverse_playlist=reverse_playlist,
+        privacy_status=privacy_status,
+        lookup_max_calls=lookup_max_calls,
+    )
+    results = []
+    start = time.perf_counter()
+    with context.Pool(
+        processes,
+        _init_worker,
+        (
+            client_factory or backend.get_ytmusic,
+            credentials_file,
+            limiter,
+            journal_file,
+            context.Lock(),
+            output,
+            options,
+        ),
+    ) as pool:
+        for records, worker_metrics in pool.imap_unordered(_copy_task, ordered):
+            metrics.merge(worker_metrics)
+            for record in records:
+                if record.get("error"):
+                    events.message(
+                        f"ERROR: Playlist '{record['name']}' failed: {record['error']}",
+                        "error",
+                    )
+                results.append(
+                    PlaylistDone(
+                        record["ytmusic_playlist_id"],
+                        record["added"],
+                        record["duplicates"],
+                        record["errors"],
+                        record["seconds"],
+                        record["lookup_summary"],
+                    )
+                )
+
+    events.message(
+        f"All done! {len(results)} playlists in {processes} processes, "
+        f"{time.perf_counter() - start:.1f}s: added {sum(r.added for r in results)} tracks, "
+        f"{sum(r.duplicates for r in results)} duplicates, "
+        f"{sum(r.errors for r in results)} errors"
+    )
+    return results
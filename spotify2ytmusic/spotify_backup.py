@@ -4,47 +4,146 @@
 #  This file originates from https://github.com/caseychu/spotify-backup
 
 import base64
-import codecs
 import hashlib
 import http.client
 import http.server
 import json
 import os
 import re
+import shutil
 import sys
+import tempfile
+import threading
 import time
 import urllib.error
 import urllib.parse
 import urllib.request
 import webbrowser
+from concurrent.futures import ThreadPoolExecutor
+
+if __package__:
+    from . import cassette, compression, jsoncodec
+    from .cancel import Cancelled
+    from .events import bus
+    from .metrics import metrics
+else:
+    #  Run as a script rather than as part of the package
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from spotify2ytmusic import cassette, compression, jsoncodec
+    from spotify2ytmusic.cancel import Cancelled
+    from spotify2ytmusic.events import bus
+    from spotify2ytmusic.metrics import metrics
+
+#  Tracks per page of /albums/{id}/tracks, the largest the API allows
+ALBUM_TRACKS_PAGE_SIZE = 50
+
+#  Concurrent requests for the album track pages
+FETCH_WORKERS = 8
 
 
 class SpotifyAPI:
     """Class to interact with the Spotify API using an OAuth token."""
 
     BASE_URL = "https://api.spotify.com/v1/"
+    TOKEN_URL = "https://accounts.spotify.com/api/token"
+
+    #  Refresh the access token this many seconds before it expires
+    REFRESH_MARGIN = 60
 
-    def __init__(self, auth):
+    def __init__(self, auth, refresh_token=None, client_id=None, expires_in=None):
         self._auth = auth
+        #  With a refresh token, an expired access token (they last an hour) is
+        #  replaced, so a long running process such as `s2yt_daemon` keeps working
+        self._refresh_token = refresh_token
+        self._client_id = client_id
+        self._expires_at = (
+            time.monotonic() + expires_in if expires_in is not None else None
+        )
+        self._token_lock = threading.Lock()
 
     def get(self, url, params={}, tries=3):
         """Fetch a resource from Spotify API."""
         url = self._construct_url(url, params)
-        for _ in range(tries):
+        endpoint = self._endpoint_name(url)
+        for attempt in range(tries):
+            if attempt:
+                metrics.retry("spotify", endpoint)
+            if self._expired():
+                self.refresh()
+            start = time.perf_counter()
             try:
                 req = self._create_request(url)
-                return self._read_response(req)
+                response = self._read_response(req)
+                metrics.observe("spotify", endpoint, time.perf_counter() - start)
+                return response
             except Exception as err:
+                metrics.observe("spotify", endpoint, time.perf_counter() - start, True)
                 print(f"Error fetching URL {url}: {err}")
-                time.sleep(2)
+                if (
+                    isinstance(err, urllib.error.HTTPError)
+                    and err.code == 401
+                    and self._refresh_token
+                ):
+                    self.refresh(req.get_header("Authorization"))
+                    continue
+                metrics.sleep("spotify_backoff", 2)
         sys.exit("Failed to fetch data from Spotify API after retries.")
 
-    def list(self, url, params={}):
-        """Fetch paginated resources and return as a combined list."""
+    def _expired(self):
+        return (
+            self._refresh_token is not None
+            and self._expires_at is not None
+            and time.monotonic() >= self._expires_at - self.REFRESH_MARGIN
+        )
+
+    def refresh(self, rejected=None):
+        """Replace the access token using the refresh token.
+
+        `rejected` is the Authorization header of a request that was refused: if
+        another thread already replaced that token, it isn't refreshed again.
+        """
+        with self._token_lock:
+            if rejected is not None and rejected != f"Bearer {self._auth}":
+                return
+            if rejected is None and not self._expired():
+                return
+            data = {
+                "grant_type": "refresh_token",
+                "refresh_token": self._refresh_token,
+                "client_id": self._client_id,
+            }
+            req = urllib.request.Request(
+                self.TOKEN_URL,
+                data=urllib.parse.urlencode(data).encode("utf-8"),
+                method="POST",
+            )
+            try:
+                with urllib.request.urlopen(req) as response:
+                    token = json.loads(response.read().decode("utf-8"))
+            except urllib.error.HTTPError as e:
+                sys.exit(
+                    f"ERROR: Refreshing the Spotify token failed, authorize again: "
+                    f"{e.read().decode('utf-8')}"
+                )
+            self._auth = token["access_token"]
+            #  Spotify may hand out a new refresh token, replacing the old one
+            self._refresh_token = token.get("refresh_token", self._refresh_token)
+            if "expires_in" in token:
+                self._expires_at = time.monotonic() + token["expires_in"]
+
+    def list(self, url, params={}, cancel=None):
+        """Fetch paginated resources and return as a combined list.
+
+        `cancel` (a `cancel.CancelToken`) is checked before each page.
+        """
+        if cancel is not None:
+            cancel.check()
         response = self.get(url, params)
         items = response["items"]
 
         while response["next"]:
+            if cancel is not None:
+                cancel.check()
             response = self.get(response["next"])
             items += response["items"]
         return items
@@ -53,35 +152,44 @@ class SpotifyAPI:
     def authorize(client_id, scope):
         """Open a browser for user authorization and return SpotifyAPI instance."""
         redirect_uri = f"http://127.0.0.1:{SpotifyAPI._SERVER_PORT}/redirect"
-        
+
         # Generate PKCE parameters
         code_verifier = SpotifyAPI._generate_code_verifier()
         code_challenge = SpotifyAPI._generate_code_challenge(code_verifier)
-        
-        url = SpotifyAPI._construct_auth_url(client_id, scope, redirect_uri, code_challenge)
+
+        url = SpotifyAPI._construct_auth_url(
+            client_id, scope, redirect_uri, code_challenge
+        )
         print(f"Open this link if the browser doesn't open automatically: {url}")
         webbrowser.open(url)
 
-        server = SpotifyAPI._AuthorizationServer("127.0.0.1", SpotifyAPI._SERVER_PORT, client_id, code_verifier, redirect_uri)
+        server = SpotifyAPI._AuthorizationServer(
+            "127.0.0.1", SpotifyAPI._SERVER_PORT, client_id, code_verifier, redirect_uri
+        )
         try:
             while True:
                 server.handle_request()
         except SpotifyAPI._Authorization as auth:
-            if auth.access_token is None:
+            if auth.token is None:
                 print(f"ERROR: Authorization failed - {auth.error}")
                 sys.exit(1)
-            return SpotifyAPI(auth.access_token)
+            return SpotifyAPI(
+                auth.token["access_token"],
+                refresh_token=auth.token.get("refresh_token"),
+                client_id=client_id,
+                expires_in=auth.token.get("expires_in"),
+            )
 
     @staticmethod
     def _generate_code_verifier():
         """Generate a code verifier for PKCE."""
-        return base64.urlsafe_b64encode(os.urandom(32)).decode('utf-8').rstrip('=')
-    
+        return base64.urlsafe_b64encode(os.urandom(32)).decode("utf-8").rstrip("=")
+
     @staticmethod
     def _generate_code_challenge(code_verifier):
         """Generate a code challenge from the verifier."""
-        digest = hashlib.sha256(code_verifier.encode('utf-8')).digest()
-        return base64.urlsafe_b64encode(digest).decode('utf-8').rstrip('=')
+        digest = hashlib.sha256(code_verifier.encode("utf-8")).digest()
+        return base64.urlsafe_b64encode(digest).decode("utf-8").rstrip("=")
 
     @staticmethod
     def _construct_auth_url(client_id, scope, redirect_uri, code_challenge):
@@ -110,11 +218,25 @@ class SpotifyAPI:
         req.add_header("Authorization", f"Bearer {self._auth}")
         return req
 
+    def _endpoint_name(self, url):
+        """The API path of `url`, with IDs replaced by "{id}", for metrics."""
+        path = urllib.parse.urlparse(url).path
+        path = path[len(urllib.parse.urlparse(self.BASE_URL).path) :]
+        return re.sub(r"(?<=/)[0-9A-Za-z]{22}(?=/|$)", "{id}", path)
+
     def _read_response(self, req):
-        """Read and parse the response."""
+        """Read and parse the response, or record or replay it with the active cassette."""
+        if cassette.active is not None:
+            return cassette.active.call(
+                "spotify", req.full_url, (), {}, lambda: self._fetch(req)
+            )
+        return self._fetch(req)
+
+    def _fetch(self, req):
         with urllib.request.urlopen(req) as res:
-            reader = codecs.getreader("utf-8")
-            return json.load(reader(res))
+            body = res.read()
+        metrics.add_bytes("spotify", self._endpoint_name(req.full_url), len(body))
+        return json.loads(body.decode("utf-8"))
 
     _SERVER_PORT = 43019
 
@@ -139,24 +261,28 @@ class SpotifyAPI:
             # Parse the authorization code from the query parameters
             query = urllib.parse.urlparse(self.path).query
             params = urllib.parse.parse_qs(query)
-            
-            if 'error' in params:
+
+            if "error" in params:
                 self.send_response(400)
                 self.send_header("Content-Type", "text/html")
                 self.end_headers()
-                error = params['error'][0]
-                self.wfile.write(f"<script>window.close()</script>Error: {error}".encode())
+                error = params["error"][0]
+                self.wfile.write(
+                    f"<script>window.close()</script>Error: {error}".encode()
+                )
                 raise SpotifyAPI._Authorization(None, error=error)
-            
-            if 'code' not in params:
+
+            if "code" not in params:
                 self.send_response(400)
                 self.send_header("Content-Type", "text/html")
                 self.end_headers()
-                self.wfile.write(b"<script>window.close()</script>No authorization code received.")
+                self.wfile.write(
+                    b"<script>window.close()</script>No authorization code received."
+                )
                 raise SpotifyAPI._Authorization(None, error="No code")
-            
-            auth_code = params['code'][0]
-            
+
+            auth_code = params["code"][0]
+
             # Send response to close the window
             self.send_response(200)
             self.send_header("Content-Type", "text/html")
@@ -164,15 +290,15 @@ class SpotifyAPI:
             self.wfile.write(
                 b"<script>window.close()</script>Thanks! You may now close this window."
             )
-            
+
             # Exchange the code for an access token
-            access_token = self._exchange_code_for_token(auth_code)
-            raise SpotifyAPI._Authorization(access_token)
-        
+            token = self._exchange_code_for_token(auth_code)
+            raise SpotifyAPI._Authorization(token)
+
         def _exchange_code_for_token(self, auth_code):
-            """Exchange the authorization code for an access token."""
-            token_url = "https://accounts.spotify.com/api/token"
-            
+            """Exchange the authorization code for the access and refresh tokens."""
+            token_url = SpotifyAPI.TOKEN_URL
+
             data = {
                 "grant_type": "authorization_code",
                 "code": auth_code,
@@ -180,17 +306,19 @@ class SpotifyAPI:
                 "client_id": self.server.client_id,
                 "code_verifier": self.server.code_verifier,
             }
-            
+
             req = urllib.request.Request(
                 token_url,
-                data=urllib.parse.urlencode(data).encode('utf-8'),
-                method='POST'
+                data=urllib.parse.urlencode(data).encode("utf-8"),
+                method="POST",
             )
-            
+
             try:
                 with urllib.request.urlopen(req) as response:
-                    response_data = json.loads(response.read().decode('utf-8'))
-                    return response_data.get('access_token')
+                    response_data = json.loads(response.read().decode("utf-8"))
+                    if not response_data.get("access_token"):
+                        return None
+                    return response_data
             except urllib.error.HTTPError as e:
                 print(f"Error exchanging code for token: {e.read().decode('utf-8')}")
                 raise
@@ -199,59 +327,171 @@ class SpotifyAPI:
             pass
 
     class _Authorization(Exception):
-        def __init__(self, access_token, error=None):
-            self.access_token = access_token
+        def __init__(self, token, error=None):
+            #  The token response: access_token, refresh_token and expires_in
+            self.token = token
             self.error = error
 
 
-def fetch_user_data(spotify, dump):
-    """Fetch playlists and liked songs based on the dump parameter."""
+def fetch_album_tracks(spotify, liked_albums, workers=FETCH_WORKERS, cancel=None):
+    """Complete the tracks of `liked_albums` past the first page, in place.
+
+    The me/albums response only has the first page of each album's tracks.  The
+    offsets of the other pages follow from the album's track total, so they are
+    all fetched at once, on `workers` threads, rather than by following "next"
+    one page at a time.  Returns the number of pages fetched.
+    """
+    pages = []
+    for liked in liked_albums:
+        album = liked["album"]
+        tracks = album["tracks"]
+        if not tracks.get("next"):
+            continue
+        for offset in range(
+            len(tracks["items"]), tracks["total"], ALBUM_TRACKS_PAGE_SIZE
+        ):
+            pages.append((album["id"], offset))
+    if not pages:
+        return 0
+
+    def fetch(page):
+        album_id, offset = page
+        if cancel is not None:
+            cancel.check()
+        return spotify.get(
+            f"albums/{album_id}/tracks",
+            {"offset": offset, "limit": ALBUM_TRACKS_PAGE_SIZE},
+        )
+
+    with ThreadPoolExecutor(min(workers, len(pages))) as pool:
+        responses = dict(zip(pages, pool.map(fetch, pages)))
+    for liked in liked_albums:
+        tracks = liked["album"]["tracks"]
+        if not tracks.get("next"):
+            continue
+        for offset in range(
+            len(tracks["items"]), tracks["total"], ALBUM_TRACKS_PAGE_SIZE
+        ):
+            tracks["items"].extend(responses[liked["album"]["id"], offset]["items"])
+        tracks["next"] = None
+    return len(pages)
+
+
+def fetch_user_data(spotify, dump, cancel=None):
+    """Fetch playlists and liked songs based on the dump parameter.
+
+    `cancel` (a `cancel.CancelToken`) is checked before each page.  Once it is
+    cancelled, the playlists fetched in full so far are returned.
+    """
     playlists = []
     liked_albums = []
 
     try:
         if "liked" in dump:
-            print("Loading liked albums and songs...")
-            liked_tracks = spotify.list("me/tracks", {"limit": 50})
-            liked_albums = spotify.list("me/albums", {"limit": 50})
-            print(f"  - Loaded {len(liked_tracks)} liked tracks")
-            print(f"  - Loaded {len(liked_albums)} liked albums")
+            bus.message("Loading liked albums and songs...")
+            liked_tracks = spotify.list("me/tracks", {"limit": 50}, cancel)
+            liked_albums = spotify.list("me/albums", {"limit": 50}, cancel)
+            bus.message(f"  - Loaded {len(liked_tracks)} liked tracks")
+            bus.message(f"  - Loaded {len(liked_albums)} liked albums")
             playlists.append({"name": "Liked Songs", "tracks": liked_tracks})
+            pages = fetch_album_tracks(spotify, liked_albums, cancel=cancel)
+            if pages:
+                bus.message(f"  - Loaded {pages} more pages of liked album tracks")
 
         if "playlists" in dump:
-            print("Loading playlists...")
-            playlist_data = spotify.list("me/playlists", {"limit": 50})
-            print(f"  - Found {len(playlist_data)} playlists")
-            for playlist in playlist_data:
+            bus.message("Loading playlists...")
+            playlist_data = spotify.list("me/playlists", {"limit": 50}, cancel)
+            bus.message(f"  - Found {len(playlist_data)} playlists")
+            for n, playlist in enumerate(playlist_data):
                 try:
-                    print(f"Loading playlist: {playlist['name']}", flush=True)
+                    bus.message(f"Loading playlist: {playlist['name']}")
                 except Exception as e:
-                    print(f"Loading playlist: [name with special chars]", flush=True)
+                    bus.message("Loading playlist: [name with special chars]")
                 try:
-                    tracks = spotify.list(playlist["tracks"]["href"], {"limit": 100})
+                    tracks = spotify.list(
+                        playlist["tracks"]["href"], {"limit": 100}, cancel
+                    )
                     playlist["tracks"] = tracks
-                    print(f"  - Loaded {len(tracks)} tracks")
+                    bus.message(f"  - Loaded {len(tracks)} tracks")
+                except Cancelled:
+                    #  Only the playlists whose tracks were all fetched are kept
+                    playlists.extend(playlist_data[:n])
+                    raise
                 except Exception as e:
-                    print(f"  - Error loading tracks: {e}")
+                    bus.message(f"  - Error loading tracks: {e}", "error")
                     playlist["tracks"] = []
             playlists.extend(playlist_data)
 
+        return playlists, liked_albums
+    except Cancelled:
+        bus.message(
+            f"Cancelled, keeping the {len(playlists)} playlists fetched so far",
+            "warning",
+        )
         return playlists, liked_albums
     except Exception as e:
-        print(f"ERROR fetching user data: {e}")
+        bus.message(f"ERROR fetching user data: {e}", "error")
         raise
 
 
-def write_to_file(file, format, playlists, liked_albums):
-    """Write fetched data to a file in the specified format."""
-    print(f"Writing to {file}...")
-    print(f"Total playlists: {len(playlists)}")
-    print(f"Total liked albums: {len(liked_albums)}")
-    
-    with open(file, "w", encoding="utf-8") as f:
-        if format == "json":
-            json.dump({"playlists": playlists, "albums": liked_albums}, f, indent=2, ensure_ascii=False)
+def partial_file(file):
+    """Where a cancelled backup to `file` is written: "playlists.partial.json"."""
+    stem = compression.strip_extension(file)
+    root, ext = os.path.splitext(stem)
+    return f"{root}.partial{ext}{file[len(stem):]}"
+
+
+def write_to_file(file, format, playlists, liked_albums, compact=False):
+    """Write fetched data to a file in the specified format.
+
+    JSON is indented, unless `compact`.  A `file` ending in `.gz` or `.zst` is
+    compressed as it is written.  The data is written to a temporary file that then
+    replaces `file`, so readers of `file` never see it half written.
+    """
+    bus.message(f"Writing to {file}...")
+    bus.message(f"Total playlists: {len(playlists)}")
+    bus.message(f"Total liked albums: {len(liked_albums)}")
+
+    fd, tmp = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(file)),
+        prefix=os.path.basename(file) + ".",
+        suffix=".tmp",
+    )
+    os.close(fd)
+    try:
+        _write(
+            tmp, compression.codec_for(file), format, playlists, liked_albums, compact
+        )
+        fd = os.open(tmp, os.O_RDWR)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        #  mkstemp() makes the file private, keep the mode of the backup replaced
+        if os.path.exists(file):
+            shutil.copymode(file, tmp)
         else:
+            os.chmod(tmp, 0o644)
+        os.replace(tmp, file)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    # Verify file was written
+    if os.path.exists(file):
+        file_size = os.path.getsize(file)
+        bus.message(f"✓ File written successfully ({file_size} bytes)")
+
+
+def _write(file, codec, format, playlists, liked_albums, compact):
+    if format == "json":
+        with compression.open_file(file, "wb", codec=codec) as f:
+            jsoncodec.dump_file(
+                {"playlists": playlists, "albums": liked_albums}, f, compact
+            )
+    else:
+        with compression.open_file(file, "wt", encoding="utf-8", codec=codec) as f:
             for playlist in playlists:
                 f.write(playlist["name"] + "\r\n")
                 for track in playlist["tracks"]:
@@ -271,14 +511,16 @@ def write_to_file(file, format, playlists, liked_albums):
                             )
                         )
                 f.write("\r\n")
-    
-    # Verify file was written
-    if os.path.exists(file):
-        file_size = os.path.getsize(file)
-        print(f"✓ File written successfully ({file_size} bytes)")
 
 
-def main(dump="playlists,liked", format="json", file="playlists.json", token=""):
+def main(
+    dump="playlists,liked",
+    format="json",
+    file="playlists.json",
+    token="",
+    compact=False,
+    cancel=None,
+):
     print("Starting backup...")
     spotify = (
         SpotifyAPI(token)
@@ -289,9 +531,15 @@ def main(dump="playlists,liked", format="json", file="playlists.json", token="")
         )
     )
 
-    playlists, liked_albums = fetch_user_data(spotify, dump)
-    write_to_file(file, format, playlists, liked_albums)
-    print(f"Backup completed! Data written to {file}")
+    playlists, liked_albums = fetch_user_data(spotify, dump, cancel)
+    if cancel is not None and cancel.cancelled:
+        #  A partial backup must not replace a complete one
+        file = partial_file(file)
+        write_to_file(file, format, playlists, liked_albums, compact)
+        print(f"Backup cancelled! The playlists fetched so far were written to {file}")
+    else:
+        write_to_file(file, format, playlists, liked_albums, compact)
+        print(f"Backup completed! Data written to {file}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+
+"""Generate synthetic Spotify backups, for benchmarks at sizes nobody has at hand.
+
+The backups have the shape of a real `playlists.json` (see
+`tests/playliststest.json`): a "Liked Songs" playlist, regular playlists of varied
+sizes, and liked albums, with the full Spotify track objects.  Tracks come from
+albums picked with a Zipf distribution, so a few albums are in many playlists and
+most are in one or two, and a share of the playlist entries repeat a track that is
+already in the library.
+
+The backup is written to the file as it is generated, so even a backup of a million
+tracks (about 2 GB) takes little memory to create.  The same arguments and seed
+always give the same backup.
+"""
+
+import json
+import random
+import string
+from argparse import ArgumentParser
+from array import array
+from bisect import bisect
+from functools import lru_cache
+from itertools import accumulate
+from typing import Dict, Iterator, List, Optional, TextIO
+
+from . import compression
+from .profiling import profiled
+
+_WORDS = (
+    "night day love heart fire rain blue gold city river dream light shadow road "
+    "home wild star echo storm glass ocean paper silver summer winter ghost neon "
+    "velvet broken golden electric midnight radio satellite garden hollow crystal"
+).split()
+
+_BASE62 = string.digits + string.ascii_letters
+
+#  Tracks per album are drawn from this range
+ALBUM_SIZES = (6, 18)
+
+
+def _spotify_id(rnd: random.Random) -> str:
+    return "".join(rnd.choices(_BASE62, k=22))
+
+
+def _title(rnd: random.Random, words: int) -> str:
+    return " ".join(rnd.sample(_WORDS, words)).title()
+
+
+def _artist(artist_id: str, name: str) -> Dict:
+    return {
+        "external_urls": {"spotify": f"https://open.spotify.com/artist/{artist_id}"},
+        "href": f"https://api.spotify.com/v1/artists/{artist_id}",
+        "id": artist_id,
+        "name": name,
+        "type": "artist",
+        "uri": f"spotify:artist:{artist_id}",
+    }
+
+
+class SyntheticLibrary:
+    """The albums and tracks of a synthetic Spotify library.
+
+    Albums are generated on demand from their index, so the library takes no memory
+    beyond a counter per album.  `album_skew` is the exponent of the Zipf
+    distribution of album popularity: 0 picks albums uniformly, higher values
+    concentrate the tracks on fewer albums.
+    """
+
+    def __init__(self, n_tracks: int, album_skew: float = 1.0, seed: int = 0) -> None:
+        self.seed = seed
+        mean_size = sum(ALBUM_SIZES) / 2
+        #  Twice as many album tracks as library tracks, so popular albums can fill up
+        self.n_albums = max(1, int(2 * n_tracks / mean_size))
+        self.n_artists = max(1, self.n_albums // 3)
+        self._cum_weights = list(
+            accumulate(1 / (rank + 1) ** album_skew for rank in range(self.n_albums))
+        )
+        self._rnd = random.Random(seed)
+        self._sizes = array(
+            "B", (self._rnd.randint(*ALBUM_SIZES) for _ in range(self.n_albums))
+        )
+        self._used = array("B", bytes(self.n_albums))
+        self._next_free = 0
+        self._album = lru_cache(maxsize=16384)(self._make_album)
+
+    def _make_album(self, index: int) -> Dict:
+        rnd = random.Random(f"{self.seed}:album:{index}")
+        artist_index = rnd.randrange(self.n_artists)
+        artist_rnd = random.Random(f"{self.seed}:artist:{artist_index}")
+        artist = _artist(
+            _spotify_id(artist_rnd), f"{_title(artist_rnd, 2)} {artist_index}"
+        )
+        album_id = _spotify_id(rnd)
+        size = self._sizes[index]
+        return {
+            "album_type": "album",
+            "artists": [artist],
+            "available_markets": ["US"],
+            "external_urls": {"spotify": f"https://open.spotify.com/album/{album_id}"},
+            "href": f"https://api.spotify.com/v1/albums/{album_id}",
+            "id": album_id,
+            "images": [
+                {
+                    "height": 640,
+                    "url": f"https://i.scdn.co/image/{album_id}640",
+                    "width": 640,
+                }
+            ],
+            "name": f"{_title(rnd, 2)} {index}",
+            "release_date": f"{rnd.randint(1960, 2024)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+            "release_date_precision": "day",
+            "total_tracks": size,
+            "type": "album",
+            "uri": f"spotify:album:{album_id}",
+        }
+
+    def album(self, index: int) -> Dict:
+        return self._album(index)
+
+    def track(self, album_index: int, number: int) -> Dict:
+        """The Spotify track object of track `number` (from 1) of an album."""
+        album = self.album(album_index)
+        rnd = random.Random(f"{self.seed}:track:{album_index}:{number}")
+        track_id = _spotify_id(rnd)
+        return {
+            "album": album,
+            "artists": album["artists"],
+            "available_markets": ["US"],
+            "disc_number": 1,
+            "duration_ms": rnd.randint(90_000, 420_000),
+            "episode": False,
+            "explicit": rnd.random() < 0.1,
+            "external_ids": {"isrc": f"US{rnd.randrange(10**10):010d}"},
+            "external_urls": {"spotify": f"https://open.spotify.com/track/{track_id}"},
+            "href": f"https://api.spotify.com/v1/tracks/{track_id}",
+            "id": track_id,
+            "is_local": False,
+            "name": f"{_title(rnd, 3)} {album_index}.{number}",
+            "popularity": rnd.randint(0, 100),
+            "preview_url": None,
+            "track": True,
+            "track_number": number,
+            "type": "track",
+            "uri": f"spotify:track:{track_id}",
+        }
+
+    def new_track(self) -> int:
+        """A track not handed out yet, as `album_index * 64 + number`."""
+        for _ in range(8):
+            index = bisect(
+                self._cum_weights, self._rnd.random() * self._cum_weights[-1]
+            )
+            index = min(index, self.n_albums - 1)
+            if self._used[index] < self._sizes[index]:
+                break
+        else:
+            #  Popular albums are full, take the next album with tracks left
+            while (
+                self._next_free < self.n_albums - 1
+                and self._used[self._next_free] >= self._sizes[self._next_free]
+            ):
+                self._next_free += 1
+            index = self._next_free
+        self._used[index] = min(self._used[index] + 1, self._sizes[index])
+        return index * 64 + self._used[index]
+
+    def item(self, key: int, added_at: str) -> Dict:
+        """A playlist item (as in a backup's "tracks") for track `key`."""
+        user = "synthetic"
+        return {
+            "added_at": added_at,
+            "added_by": {
+                "external_urls": {"spotify": f"https://open.spotify.com/user/{user}"},
+                "href": f"https://api.spotify.com/v1/users/{user}",
+                "id": user,
+                "type": "user",
+                "uri": f"spotify:user:{user}",
+            },
+            "is_local": False,
+            "primary_color": None,
+            "track": self.track(key // 64, key % 64),
+            "video_thumbnail": {"url": None},
+        }
+
+
+def _playlist_sizes(rnd: random.Random, n_tracks: int, n_playlists: int) -> List[int]:
+    weights = [rnd.expovariate(1) for _ in range(n_playlists)]
+    total = sum(weights)
+    sizes = [int(n_tracks * w / total) for w in weights]
+    sizes[0] += n_tracks - sum(sizes)
+    return sizes
+
+
+def _write_items(f: TextIO, items: Iterator[Dict]) -> None:
+    f.write("[")
+    for n, item in enumerate(items):
+        if n:
+            f.write(",\n")
+        f.write(json.dumps(item, ensure_ascii=False))
+    f.write("]")
+
+
+def write_backup(
+    f: TextIO,
+    n_tracks: int,
+    n_playlists: Optional[int] = None,
+    duplicate_rate: float = 0.05,
+    album_skew: float = 1.0,
+    liked_fraction: float = 0.3,
+    n_liked_albums: Optional[int] = None,
+    seed: int = 0,
+) -> None:
+    """Write a synthetic `playlists.json` backup of `n_tracks` playlist entries to `f`.
+
+    `liked_fraction` of the entries are in "Liked Songs", the rest are spread over
+    `n_playlists` playlists (default: one per 100 tracks).  A `duplicate_rate` share
+    of the entries repeat a track that is already in the library.
+    """
+    rnd = random.Random(f"{seed}:playlists")
+    library = SyntheticLibrary(n_tracks, album_skew, seed)
+    if n_playlists is None:
+        n_playlists = max(1, n_tracks // 100)
+    if n_liked_albums is None:
+        n_liked_albums = max(1, n_tracks // 1000)
+    n_liked = int(n_tracks * liked_fraction)
+    sizes = [n_liked] + _playlist_sizes(rnd, n_tracks - n_liked, n_playlists)
+    seen = array("q")
+
+    def items(size: int) -> Iterator[Dict]:
+        for _ in range(size):
+            if seen and rnd.random() < duplicate_rate:
+                key = seen[rnd.randrange(len(seen))]
+            else:
+                key = library.new_track()
+                seen.append(key)
+            added_at = f"{rnd.randint(2010, 2024)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}T12:00:00Z"
+            yield library.item(key, added_at)
+
+    f.write('{"playlists": [\n')
+    for p, size in enumerate(sizes):
+        if p:
+            f.write(",\n")
+        if p == 0:
+            header = {"name": "Liked Songs"}
+        else:
+            pl_id = _spotify_id(rnd)
+            header = {
+                "collaborative": False,
+                "description": "",
+                "href": f"https://api.spotify.com/v1/playlists/{pl_id}",
+                "id": pl_id,
+                "name": f"{_title(rnd, 2)} {p}",
+                "public": rnd.random() < 0.5,
+                "type": "playlist",
+                "uri": f"spotify:playlist:{pl_id}",
+            }
+        f.write(json.dumps(header, ensure_ascii=False)[:-1] + ', "tracks": ')
+        _write_items(f, items(size))
+        f.write("}")
+
+    f.write('],\n"albums": ')
+    liked = rnd.sample(range(library.n_albums), min(n_liked_albums, library.n_albums))
+    _write_items(
+        f,
+        (
+            {
+                "added_at": "2020-01-01T12:00:00Z",
+                "album": dict(
+                    library.album(index),
+                    tracks={
+                        "items": [
+                            {
+                                key: value
+                                for key, value in library.track(index, number).items()
+                                if key != "album"
+                            }
+                            for number in range(
+                                1, library.album(index)["total_tracks"] + 1
+                            )
+                        ]
+                    },
+                ),
+            }
+            for index in liked
+        ),
+    )
+    f.write("}\n")
+
+
+@profiled
+def main():
+    """Write a synthetic Spotify backup."""
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--tracks",
+        type=int,
+        default=1000,
+        help="Number of playlist entries, over all playlists (default: 1000)",
+    )
+    parser.add_argument(
+        "--playlists",
+        type=int,
+        help="Number of playlists besides Liked Songs (default: one per 100 tracks)",
+    )
+    parser.add_argument(
+        "--duplicate-rate",
+        type=float,
+        default=0.05,
+        help="Share of the entries that repeat a track already in the library (default: 0.05)",
+    )
+    parser.add_argument(
+        "--album-skew",
+        type=float,
+        default=1.0,
+        help="Zipf exponent of the album popularity, 0 for uniform (default: 1.0)",
+    )
+    parser.add_argument(
+        "--liked-fraction",
+        type=float,
+        default=0.3,
+        help="Share of the entries in Liked Songs (default: 0.3)",
+    )
+    parser.add_argument(
+        "--liked-albums",
+        type=int,
+        help="Number of liked albums (default: one per 1000 tracks)",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="playlists.json",
+        help="The file to write, compressed if it ends in .gz or .zst "
+        "(default: playlists.json)",
+    )
+    args = parser.parse_args()
+
+    with compression.open_file(args.output, "wt", encoding="utf-8") as f:
+        write_backup(
+            f,
+            args.tracks,
+            args.playlists,
+            args.duplicate_rate,
+            args.album_skew,
+            args.liked_fraction,
+            args.liked_albums,
+            args.seed,
+        )
+
+
+if __name__ == "__main__":
+    main()
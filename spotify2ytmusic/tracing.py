@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+
+"""A per-track trace of where a run spends its time.
+
+With `--trace FILE`, every API call (with its duration, retry number and cache
+status), every phase (lookup, write, sleep) and every sleep (with its reason) is
+recorded under the source track `copier` was working on.  `metrics` and
+`profiling.phases` report them here, so tracing needs no changes to the code making
+the calls, and costs nothing when it is off.
+
+Two formats are written:
+
+- jsonl: one line per track, with its calls, sleeps and the exclusive time spent in
+  each phase; calls made outside of a track (creating a playlist, a Spotify request)
+  get a line each.
+- chrome: the Chrome trace event format, to open in chrome://tracing or Perfetto,
+  with a row per thread and the calls and phases nested under each track.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, Optional
+
+if TYPE_CHECKING:
+    from .backend import SongInfo
+
+FORMATS = ("jsonl", "chrome")
+
+#  The tracer in use, see `use()`
+active: Optional["Tracer"] = None
+
+#  Per thread: the cache status of the call being made, and the pending retries
+_state = threading.local()
+
+
+class Tracer:
+    """Writes the trace of the tracks copied to `filename`, in `format`."""
+
+    def __init__(self, filename: str, format: str = "jsonl") -> None:
+        if format not in FORMATS:
+            raise ValueError(f"Unknown trace format: {format}")
+        self.filename = filename
+        self.format = format
+        self.tracks = 0
+        self._start = time.perf_counter()
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        #  The track each thread is working on, by thread ID
+        self._open: Dict[int, Dict] = {}
+        self._local = threading.local()
+        self._events = 0
+        self._file = open(filename, "w", encoding="utf-8")
+        if format == "chrome":
+            self._file.write("[\n")
+
+    def _now(self) -> float:
+        return time.perf_counter() - self._start
+
+    def _write(self, record: Dict) -> None:
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            if self._file is None:
+                return
+            if self.format == "chrome":
+                if self._events:
+                    self._file.write(",\n")
+                self._events += 1
+                self._file.write(line)
+            else:
+                self._file.write(line + "\n")
+
+    def _chrome_event(
+        self,
+        name: str,
+        category: str,
+        start: float,
+        seconds: float,
+        tid: int,
+        args: Dict,
+    ) -> None:
+        self._write(
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": round(start * 1e6),
+                "dur": round(seconds * 1e6),
+                "pid": self._pid,
+                "tid": tid,
+                "args": args,
+            }
+        )
+
+    def _record(self, kind: str, span: Dict) -> None:
+        """Add a call, phase or sleep to the thread's track, or write it on its own."""
+        track = self._open.get(threading.get_ident())
+        if track is not None:
+            track[kind].append(span)
+        elif self.format == "jsonl":
+            self._write({"type": kind[:-1], **span})
+        else:
+            self._span_event(kind, span, threading.get_ident())
+
+    def _span_event(self, kind: str, span: Dict, tid: int) -> None:
+        if kind == "calls":
+            args = {k: span[k] for k in ("retry", "cache", "error")}
+            self._chrome_event(
+                span["endpoint"],
+                span["service"],
+                span["start"],
+                span["seconds"],
+                tid,
+                args,
+            )
+        elif kind == "sleeps":
+            self._chrome_event(
+                f"sleep: {span['reason']}",
+                "sleep",
+                span["start"],
+                span["seconds"],
+                tid,
+                {},
+            )
+        else:
+            self._chrome_event(
+                span["name"], "phase", span["start"], span["seconds"], tid, {}
+            )
+
+    def begin_track(self, track: "SongInfo", index: int) -> None:
+        """Start recording under `track`, ending the thread's previous track."""
+        self.end_track()
+        self._open[threading.get_ident()] = {
+            "index": index,
+            "title": track.title,
+            "artist": track.artist,
+            "album": track.album,
+            "thread": threading.current_thread().name,
+            "start": round(self._now(), 6),
+            "calls": [],
+            "sleeps": [],
+            "phase_spans": [],
+            "phases": {},
+        }
+
+    def end_track(self, tid: Optional[int] = None) -> None:
+        """Write the thread's current track, if any."""
+        if tid is None:
+            tid = threading.get_ident()
+        track = self._open.pop(tid, None)
+        if track is None:
+            return
+        seconds = self._now() - track["start"]
+        phases = track["phases"]
+        phases["other"] = max(0.0, seconds - sum(phases.values()))
+        with self._lock:
+            self.tracks += 1
+        if self.format == "jsonl":
+            record = {k: v for k, v in track.items() if k != "phase_spans"}
+            record["phases"] = {name: round(s, 6) for name, s in phases.items()}
+            self._write({"type": "track", **record, "seconds": round(seconds, 6)})
+            return
+        self._chrome_event(
+            f"{track['title']} - {track['artist']}",
+            "track",
+            track["start"],
+            seconds,
+            tid,
+            {
+                "index": track["index"],
+                "album": track["album"],
+                "calls": len(track["calls"]),
+                "phases": {name: round(s, 6) for name, s in phases.items()},
+            },
+        )
+        for kind in ("calls", "sleeps", "phase_spans"):
+            for span in track[kind]:
+                self._span_event(kind, span, tid)
+
+    def call(
+        self,
+        service: str,
+        endpoint: str,
+        seconds: float,
+        error: bool = False,
+        cache=None,
+    ) -> None:
+        """Record an API call that just ended after `seconds`."""
+        retries = getattr(_state, "retries", None)
+        if retries is None:
+            retries = _state.retries = {}
+        key = (service, endpoint)
+        retry = retries.get(key, 0)
+        if not error:
+            retries.pop(key, None)
+        self._record(
+            "calls",
+            {
+                "service": service,
+                "endpoint": endpoint,
+                "start": round(self._now() - seconds, 6),
+                "seconds": round(seconds, 6),
+                "retry": retry,
+                "cache": cache if cache is not None else getattr(_state, "cache", None),
+                "error": error,
+            },
+        )
+
+    def retry(self, service: str, endpoint: str) -> None:
+        """The next call to `endpoint` (in this thread) retries a failed one."""
+        retries = getattr(_state, "retries", None)
+        if retries is None:
+            retries = _state.retries = {}
+        retries[(service, endpoint)] = retries.get((service, endpoint), 0) + 1
+
+    @contextmanager
+    def phase(self, name: str, detail: Optional[str] = None):
+        """Record the block as phase `name`, its time is exclusive of nested phases."""
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        start = now = self._now()
+        if stack:
+            self._add_phase(stack[-1][0], now - stack[-1][1])
+        stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = self._now()
+            self._add_phase(name, now - stack.pop()[1])
+            if stack:
+                stack[-1][1] = now
+            span = {"start": round(start, 6), "seconds": round(now - start, 6)}
+            if name == "sleep" and detail is not None:
+                self._record("sleeps", {"reason": detail, **span})
+            else:
+                self._record(
+                    "phase_spans" if self._in_track() else "phases",
+                    {"name": name, **span},
+                )
+
+    def _in_track(self) -> bool:
+        return threading.get_ident() in self._open
+
+    def _add_phase(self, name: str, seconds: float) -> None:
+        track = self._open.get(threading.get_ident())
+        if track is not None:
+            track["phases"][name] = track["phases"].get(name, 0.0) + seconds
+
+    def close(self) -> None:
+        for tid in list(self._open):
+            self.end_track(tid)
+        with self._lock:
+            if self._file is None:
+                return
+            if self.format == "chrome":
+                self._file.write("\n]\n")
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "Tracer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def begin_track(track: "SongInfo", index: int) -> None:
+    """Record what follows, in this thread, under `track` (if tracing)."""
+    if active is not None:
+        active.begin_track(track, index)
+
+
+def end_track() -> None:
+    if active is not None:
+        active.end_track()
+
+
+@contextmanager
+def cache_status(status: str):
+    """Mark the API calls made in the block with cache `status`, such as "miss"."""
+    previous = getattr(_state, "cache", None)
+    _state.cache = status
+    try:
+        yield
+    finally:
+        _state.cache = previous
+
+
+@contextmanager
+def use(tracer: Optional[Tracer]):
+    """Make `tracer` the one `metrics`, `profiling.phases` and `copier` report to."""
+    global active
+    previous = active
+    active = tracer
+    try:
+        yield tracer
+    finally:
+        active = previous
+        if tracer is not None:
+            tracer.close()
+
+
+def from_args(args) -> Optional[Tracer]:
+    """The tracer requested with `--trace` on the command line, if any."""
+    if getattr(args, "trace", None):
+        return Tracer(args.trace, args.trace_format)
+    return None
+
+
+def add_arguments(parser) -> None:
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="Write a per-track trace of the API calls, phases and sleeps to FILE",
+    )
+    parser.add_argument(
+        "--trace-format",
+        choices=FORMATS,
+        default="jsonl",
+        help="Trace format: one JSON object per track, or Chrome trace events for "
+        "chrome://tracing and Perfetto (default: jsonl)",
+    )
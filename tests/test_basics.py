@@ -1,12 +1,47 @@
 #!/usr/bin/env python
 
+import json
+import os
+import tempfile
+import threading
+import time
 import unittest
 from unittest.mock import patch, MagicMock
 import spotify2ytmusic
+from spotify2ytmusic import (
+    bench,
+    cassette,
+    commands,
+    compression,
+    events,
+    jsoncodec,
+    readers,
+    response_cache,
+    synth,
+    tracing,
+)
+from spotify2ytmusic.reverse_playlist import reverse_playlist
+from spotify2ytmusic.ratelimit import RateLimiter
+from spotify2ytmusic import runner
+from spotify2ytmusic.daemon import Daemon
+from spotify2ytmusic.plan import apply_plan, make_plan, read_plan
+from spotify2ytmusic.likes import LikeWriter
+from spotify2ytmusic.fake_ytmusic import http_client_factory, serve
+from spotify2ytmusic.sharding import copy_all_playlists_sharded
+from spotify2ytmusic.fake_ytmusic import FakeCatalog, FakeYTMusic
+from spotify2ytmusic.cancel import CancelToken
+from spotify2ytmusic.metrics import (
+    InstrumentedYTMusic,
+    Metrics,
+    instrument_ytmusic,
+    metrics,
+)
+from spotify2ytmusic.profiling import PhaseTimer, _pop_profile_options
+from spotify2ytmusic.response_cache import CachedYTMusic, ResponseCache
 
 
 class TestCopier(unittest.TestCase):
-    @patch("spotify2ytmusic.cli.YTMusic")
+    @patch("spotify2ytmusic.backend.get_ytmusic")
     def test_copier_success(self, mock_ytmusic):
         # Setup mock responses
         mock_ytmusic_instance = MagicMock()
@@ -14,8 +49,8 @@ class TestCopier(unittest.TestCase):
         mock_ytmusic_instance.get_playlist.return_value = {"title": "Test Playlist"}
         mock_ytmusic_instance.add_playlist_items.return_value = None
 
-        spotify2ytmusic.cli.copier(
-            spotify2ytmusic.cli.iter_spotify_playlist(
+        spotify2ytmusic.backend.copier(
+            spotify2ytmusic.backend.iter_spotify_playlist(
                 "68QlHDwCiXfhodLpS72iOx",
                 spotify_playlist_file="tests/playliststest.json",
             ),
@@ -26,7 +61,7 @@ class TestCopier(unittest.TestCase):
             playlistId="dst_test"
         )
 
-    @patch("spotify2ytmusic.cli.YTMusic")
+    @patch("spotify2ytmusic.backend.get_ytmusic")
     def test_copier_albums(self, mock_ytmusic):
         # Setup mock responses
         mock_ytmusic_instance = MagicMock()
@@ -34,8 +69,8 @@ class TestCopier(unittest.TestCase):
         mock_ytmusic_instance.get_playlist.return_value = {"title": "Test Playlist"}
         mock_ytmusic_instance.add_playlist_items.return_value = None
 
-        spotify2ytmusic.cli.copier(
-            spotify2ytmusic.cli.iter_spotify_liked_albums(
+        spotify2ytmusic.backend.copier(
+            spotify2ytmusic.backend.iter_spotify_liked_albums(
                 spotify_playlist_file="tests/playliststest.json"
             ),
             dst_pl_id="dst_test",
@@ -45,7 +80,7 @@ class TestCopier(unittest.TestCase):
             playlistId="dst_test"
         )
 
-    @patch("spotify2ytmusic.cli.YTMusic")
+    @patch("spotify2ytmusic.backend.get_ytmusic")
     def test_copier_liked_playlists(self, mock_ytmusic):
         # Setup mock responses
         mock_ytmusic_instance = MagicMock()
@@ -53,18 +88,1303 @@ class TestCopier(unittest.TestCase):
         mock_ytmusic_instance.get_playlist.return_value = {"title": "Test Playlist"}
         mock_ytmusic_instance.add_playlist_items.return_value = None
 
-        spotify2ytmusic.cli.copier(
-            spotify2ytmusic.cli.iter_spotify_playlist(
-                None, spotify_playlist_file="tests/playliststest.json"
+        #  The test backup has no "Liked Songs" playlist
+        with self.assertRaises(ValueError):
+            spotify2ytmusic.backend.copier(
+                spotify2ytmusic.backend.iter_spotify_playlist(
+                    None, spotify_playlist_file="tests/playliststest.json"
+                ),
+                dst_pl_id="dst_test",
+                track_sleep=0,
+            )
+
+        mock_ytmusic_instance.get_playlist.assert_called_once_with(
+            playlistId="dst_test"
+        )
+
+    def test_copy_playlist_fake_ytmusic(self):
+        with open("tests/playliststest.json") as f:
+            catalog = FakeCatalog.from_backup(json.load(f))
+        yt = FakeYTMusic(catalog)
+
+        spotify2ytmusic.backend.copy_playlist(
+            "68QlHDwCiXfhodLpS72iOx",
+            "+Raid the Data Center",
+            track_sleep=0,
+            spotify_playlist_file="tests/playliststest.json",
+            yt=yt,
+        )
+
+        [playlist] = yt.playlists.values()
+        self.assertEqual(playlist["title"], "Raid the Data Center")
+        self.assertEqual(len(playlist["videoIds"]), 38)
+        self.assertEqual(yt.calls["search:songs"], 38)
+
+    def test_new_playlist_not_readable_is_reported(self):
+        yt = MagicMock()
+        yt.create_playlist.return_value = "PL1"
+        yt.get_playlist.side_effect = Exception("Playlist not found")
+        with patch.object(spotify2ytmusic.backend.metrics, "sleep"), patch(
+            "builtins.print"
+        ) as mock_print:
+            playlist_id = spotify2ytmusic.backend._ytmusic_create_playlist(
+                yt, "New", "", video_ids=["v1"]
+            )
+
+        self.assertEqual(playlist_id, "PL1")
+        self.assertIn("can't be read yet", mock_print.call_args.args[0])
+
+    def test_new_playlist_created_with_tracks(self):
+        data = bench.synthetic_backup(120, n_playlists=1)
+        yt = FakeYTMusic(FakeCatalog.from_backup(data))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "playlists.json")
+            with open(filename, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            [done] = spotify2ytmusic.backend.copy_all_playlists(
+                track_sleep=0,
+                reverse_playlist=False,
+                spotify_playlist_file=filename,
+                yt=yt,
+                events=events.EventBus(),
+            )
+
+        [playlist] = yt.playlists.values()
+        self.assertEqual(done.playlist_id, playlist["playlistId"])
+        self.assertEqual(done.added, len(playlist["videoIds"]))
+        self.assertEqual(
+            [yt.catalog.tracks[v]["title"] for v in playlist["videoIds"]],
+            [t["track"]["name"] for t in data["playlists"][0]["tracks"]][: done.added],
+        )
+        self.assertEqual(yt.calls["create_playlist"], 1)
+        self.assertEqual(
+            yt.calls["add_playlist_items"],
+            -(-done.added // spotify2ytmusic.backend.PLAYLIST_BATCH_SIZE) - 1,
+        )
+
+
+class TestSpotifyBackup(unittest.TestCase):
+    def test_album_tracks_pages(self):
+        from spotify2ytmusic import spotify_backup
+
+        def album(album_id, total):
+            first = [{"name": f"{album_id} {n}"} for n in range(min(total, 50))]
+            return {
+                "album": {
+                    "id": album_id,
+                    "tracks": {
+                        "items": first,
+                        "total": total,
+                        "next": "page 2" if total > 50 else None,
+                    },
+                }
+            }
+
+        class FakeSpotify:
+            def __init__(self):
+                self.urls = []
+
+            def get(self, url, params={}):
+                self.urls.append((url, params["offset"]))
+                album_id = url.split("/")[1]
+                time.sleep(0.05)
+                end = min(
+                    params["offset"] + params["limit"], 175 if album_id == "box" else 0
+                )
+                return {
+                    "items": [
+                        {"name": f"{album_id} {n}"}
+                        for n in range(params["offset"], end)
+                    ]
+                }
+
+        spotify = FakeSpotify()
+        liked = [album("single", 3), album("box", 175)]
+        start = time.perf_counter()
+        self.assertEqual(spotify_backup.fetch_album_tracks(spotify, liked), 3)
+        #  The pages are fetched at once, not one after the other
+        self.assertLess(time.perf_counter() - start, 0.14)
+        self.assertEqual(
+            sorted(spotify.urls), [("albums/box/tracks", n) for n in (50, 100, 150)]
+        )
+        self.assertEqual(
+            [t["name"] for t in liked[1]["album"]["tracks"]["items"]],
+            [f"box {n}" for n in range(175)],
+        )
+        self.assertEqual(len(liked[0]["album"]["tracks"]["items"]), 3)
+
+    def test_expired_token_is_refreshed(self):
+        import io
+        import urllib.error
+        from spotify2ytmusic import spotify_backup
+
+        requests = []
+
+        def urlopen(req):
+            requests.append((req.full_url, req.get_header("Authorization"), req.data))
+            if req.full_url == spotify_backup.SpotifyAPI.TOKEN_URL:
+                body = {
+                    "access_token": "new",
+                    "refresh_token": "r2",
+                    "expires_in": 3600,
+                }
+            elif req.get_header("Authorization") != "Bearer new":
+                raise urllib.error.HTTPError(
+                    req.full_url, 401, "Unauthorized", {}, io.BytesIO(b"")
+                )
+            else:
+                body = {"items": [], "next": None}
+            response = MagicMock()
+            response.__enter__.return_value.read.return_value = json.dumps(body).encode(
+                "utf-8"
+            )
+            return response
+
+        spotify = spotify_backup.SpotifyAPI(
+            "old", refresh_token="r1", client_id="client", expires_in=3600
+        )
+        with patch("urllib.request.urlopen", urlopen), patch("builtins.print"):
+            self.assertEqual(spotify.get("me/tracks")["items"], [])
+            #  The refresh token may be replaced, and is used from then on
+            spotify._expires_at = 0
+            spotify.get("me/tracks")
+
+        self.assertEqual(
+            [(url.split("/")[-1], auth) for url, auth, _ in requests],
+            [
+                ("tracks", "Bearer old"),
+                ("token", None),
+                ("tracks", "Bearer new"),
+                ("token", None),
+                ("tracks", "Bearer new"),
+            ],
+        )
+        self.assertIn(b"refresh_token=r1", requests[1][2])
+        self.assertIn(b"refresh_token=r2", requests[3][2])
+
+
+class TestCancel(unittest.TestCase):
+    def test_cancel_copy_all_playlists(self):
+        import threading
+
+        data = bench.synthetic_backup(90, n_playlists=3)
+        yt = FakeYTMusic(FakeCatalog.from_backup(data))
+        token = CancelToken()
+        quiet = events.EventBus()
+        resolved = []
+
+        def on_event(event):
+            if isinstance(event, events.TrackResolved):
+                resolved.append(event)
+                #  In the middle of the second playlist
+                if len(resolved) == len(data["playlists"][1]["tracks"]) + 5:
+                    token.cancel()
+
+        quiet.subscribe(on_event)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "playlists.json")
+            journal = os.path.join(tmpdir, "journal.jsonl")
+            with open(filename, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+
+            def copy_all(cancel):
+                return spotify2ytmusic.backend.copy_all_playlists(
+                    track_sleep=0,
+                    reverse_playlist=False,
+                    spotify_playlist_file=filename,
+                    yt=yt,
+                    events=quiet,
+                    cancel=cancel,
+                    journal_file=journal,
+                )
+
+            first, second = copy_all(token)
+            self.assertFalse(first.cancelled)
+            self.assertTrue(second.cancelled)
+            #  The tracks looked up before the cancel were written
+            self.assertEqual(len(yt.playlists), 2)
+            self.assertEqual(
+                sorted(len(p["videoIds"]) for p in yt.playlists.values()),
+                sorted([first.added, second.added]),
+            )
+            self.assertLessEqual(second.added, 5)
+
+            #  Resuming skips the first playlist, and finishes while paused at first
+            token = CancelToken()
+            token.pause()
+            threading.Timer(0.2, token.resume).start()
+            resumed = copy_all(token)
+        self.assertEqual(len(resumed), 2)
+        self.assertFalse(any(done.cancelled for done in resumed))
+        self.assertEqual(len(yt.playlists), 3)
+
+    def test_cancel_fetch_user_data(self):
+        from spotify2ytmusic import spotify_backup
+
+        token = CancelToken()
+
+        class FakeSpotify:
+            def list(self, url, params={}, cancel=None):
+                cancel.check()
+                if url == "me/playlists":
+                    return [{"name": n, "tracks": {"href": n}} for n in "abc"]
+                if url == "b":
+                    token.cancel()
+                    cancel.check()
+                return [{"track": url}]
+
+        with patch.object(spotify_backup, "bus", events.EventBus()):
+            playlists, _ = spotify_backup.fetch_user_data(
+                FakeSpotify(), "playlists", token
+            )
+        self.assertEqual(playlists, [{"name": "a", "tracks": [{"track": "a"}]}])
+
+    def test_cancelled_backup_keeps_the_last_one(self):
+        from spotify2ytmusic import spotify_backup
+
+        token = CancelToken()
+        token.cancel()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "playlists.json.gz")
+            with patch.object(spotify_backup, "bus", events.EventBus()):
+                spotify_backup.write_to_file(filename, "json", [{"name": "a"}], [])
+                with patch("builtins.print"):
+                    spotify_backup.main(file=filename, token="token", cancel=token)
+            self.assertEqual(
+                jsoncodec.load_file(filename),
+                {"playlists": [{"name": "a"}], "albums": []},
+            )
+            self.assertEqual(
+                jsoncodec.load_file(os.path.join(tmpdir, "playlists.partial.json.gz")),
+                {"playlists": [], "albums": []},
+            )
+            self.assertEqual(
+                sorted(os.listdir(tmpdir)),
+                ["playlists.json.gz", "playlists.partial.json.gz"],
+            )
+
+
+def _song(title, artist, album, video_id="vid"):
+    return {
+        "title": title,
+        "artists": [{"name": artist}],
+        "album": {"name": album},
+        "videoId": video_id,
+    }
+
+
+class TestLookupSong(unittest.TestCase):
+    def test_high_confidence_song_search_is_one_call(self):
+        yt = MagicMock()
+        yt.search.return_value = [_song("Survival", "Yes", "Yes", "v1")]
+        stats = spotify2ytmusic.backend.LookupStats()
+
+        ret = spotify2ytmusic.backend.lookup_song(
+            yt, "Survival", "Yes", "Yes", 0, stats=stats
+        )
+
+        self.assertEqual(ret["videoId"], "v1")
+        yt.search.assert_called_once_with(query="Survival by Yes", filter="songs")
+        yt.get_album.assert_not_called()
+        self.assertEqual(stats.steps["song_search"].hits, 1)
+
+    def test_album_candidates_ranked_before_fetching(self):
+        yt = MagicMock()
+        albums = [
+            {"browseId": "b1", "title": "Greatest Hits", "artists": [{"name": "Yes"}]},
+            {"browseId": "b2", "title": "Yes", "artists": [{"name": "Yes"}]},
+        ]
+        yt.search.side_effect = lambda query, filter: {
+            "songs": [_song("Survival", "Yes", "Live", "v1")],
+            "albums": albums,
+        }[filter]
+        yt.get_album.return_value = {"tracks": [_song("Survival", "Yes", "Yes", "v2")]}
+
+        ret = spotify2ytmusic.backend.lookup_song(yt, "Survival", "Yes", "Yes", 0)
+
+        self.assertEqual(ret["videoId"], "v2")
+        yt.get_album.assert_called_once_with("b2")
+
+    def test_call_budget(self):
+        yt = MagicMock()
+        yt.search.return_value = [_song("Other", "Someone", "Else")]
+
+        with self.assertRaises(spotify2ytmusic.backend.LookupBudgetExceeded):
+            spotify2ytmusic.backend.lookup_song(
+                yt, "Survival", "Yes", "Yes", 1, max_calls=1
+            )
+        self.assertEqual(yt.search.call_count, 1)
+
+    def test_stats_shared_between_threads(self):
+        stats = spotify2ytmusic.backend.LookupStats()
+
+        def count():
+            for _ in range(2000):
+                stats.record("song_search", True, 1)
+                stats.add_track(1)
+
+        threads = [threading.Thread(target=count) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(stats.tracks, 16000)
+        self.assertEqual(stats.calls, 16000)
+        self.assertEqual(stats.steps["song_search"].attempts, 16000)
+
+
+class TestEvents(unittest.TestCase):
+    def test_copier_events(self):
+        with open("tests/playliststest.json") as f:
+            catalog = FakeCatalog.from_backup(json.load(f))
+        yt = FakeYTMusic(catalog)
+        bus = events.EventBus()
+        subscriber = events.QueueSubscriber()
+        bus.subscribe(subscriber)
+
+        done = spotify2ytmusic.backend.copier(
+            spotify2ytmusic.backend.iter_spotify_playlist(
+                "68QlHDwCiXfhodLpS72iOx",
+                spotify_playlist_file="tests/playliststest.json",
+                events=bus,
             ),
-            dst_pl_id="dst_test",
+            None,
             track_sleep=0,
+            yt=yt,
+            events=bus,
         )
 
-        mock_ytmusic_instance.get_playlist.assert_called_once_with(
-            playlistId="dst_test"
+        received = []
+        while not subscriber.queue.empty():
+            received.append(subscriber.queue.get())
+        kinds = [type(e).__name__ for e in received]
+        self.assertEqual(kinds.count("TrackStarted"), 38)
+        self.assertEqual(kinds.count("TrackWritten"), 38)
+        self.assertIs(received[-1], done)
+        self.assertEqual(done.added, 38)
+        self.assertEqual(len(yt.liked), 38)
+        self.assertEqual(
+            json.loads(json.dumps(received[1].to_dict()))["event"], "TrackStarted"
         )
 
 
+class TestMetrics(unittest.TestCase):
+    def test_instrumented_ytmusic(self):
+        registry = Metrics()
+        yt = InstrumentedYTMusic(FakeYTMusic(), registry)
+
+        yt.search(query="Survival by Yes", filter="songs")
+        with self.assertRaises(Exception):
+            yt.get_album("missing")
+
+        self.assertEqual(registry.endpoints[("ytmusic", "search:songs")].calls, 1)
+        self.assertEqual(registry.endpoints[("ytmusic", "get_album")].errors, 1)
+
+    def test_prometheus_textfile(self):
+        registry = Metrics()
+        registry.observe("ytmusic", "get_album", 0.2)
+        registry.sleeps["backoff"] = 5.0
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "s2yt.prom")
+            registry.write_prometheus(filename)
+            with open(filename) as f:
+                text = f.read()
+
+        self.assertIn(
+            's2yt_api_latency_seconds_bucket{service="ytmusic",endpoint="get_album",le="0.25"} 1',
+            text,
+        )
+        self.assertIn('s2yt_sleep_seconds_total{reason="backoff"} 5.0', text)
+
+
+class TestProfiling(unittest.TestCase):
+    def test_nested_phases_are_exclusive(self):
+        timer = PhaseTimer()
+        timer.enabled = True
+        with timer.phase("write"):
+            with timer.phase("sleep"):
+                time.sleep(0.05)
+
+        self.assertGreaterEqual(timer.seconds["sleep"], 0.05)
+        self.assertLess(timer.seconds["write"], 0.05)
+
+    def test_profile_options_removed_from_argv(self):
+        argv = [
+            "s2yt_load_liked",
+            "--profile=out.pstats",
+            "--dry-run",
+            "--profile-memory",
+        ]
+
+        options = _pop_profile_options(argv)
+
+        self.assertEqual(argv, ["s2yt_load_liked", "--dry-run"])
+        self.assertEqual(options, {"file": "out.pstats", "memory": True})
+
+
+class TestReversePlaylist(unittest.TestCase):
+    def test_reverse_json(self):
+        with open("tests/playliststest.json", encoding="utf-8") as f:
+            original = json.load(f)
+        original["albums"] = [{"album": {"name": "Kept"}}]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "playlists.json")
+            with open(filename, "w", encoding="utf-8") as f:
+                json.dump(original, f, indent=2)
+
+            self.assertEqual(reverse_playlist(filename, verbose=False), 0)
+            with open(filename, encoding="utf-8") as f:
+                result = json.load(f)
+            with open(
+                os.path.join(tmpdir, "playlists_backup.json"), encoding="utf-8"
+            ) as f:
+                self.assertEqual(json.load(f), original)
+            self.assertEqual(
+                result["playlists"][0]["tracks"],
+                original["playlists"][0]["tracks"][::-1],
+            )
+            self.assertEqual(result["albums"], original["albums"])
+
+            #  The backup is not overwritten without replace=True
+            self.assertEqual(reverse_playlist(filename, verbose=False), 1)
+            self.assertEqual(reverse_playlist(filename, verbose=False, replace=True), 0)
+            self.assertEqual(os.listdir(tmpdir).count("playlists.json"), 1)
+            self.assertEqual(len(os.listdir(tmpdir)), 2)
+
+    def test_reverse_tsv_selected(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "playlists.txt")
+            output = os.path.join(tmpdir, "reversed.txt")
+            with open(filename, "w", encoding="utf-8", newline="") as f:
+                f.write("One\r\na\tx\r\nb\tx\r\n\r\nTwo\r\nc\tx\r\nd\tx\r\n\r\n")
+
+            self.assertEqual(
+                reverse_playlist(
+                    filename, verbose=False, output_file=output, playlists=["Two"]
+                ),
+                0,
+            )
+            with open(output, encoding="utf-8", newline="") as f:
+                self.assertEqual(
+                    f.read(), "One\r\na\tx\r\nb\tx\r\n\r\nTwo\r\nd\tx\r\nc\tx\r\n\r\n"
+                )
+
+
+class TestRunner(unittest.TestCase):
+    def test_jobs_over_http(self):
+        import urllib.error
+        import urllib.request
+
+        with open("tests/playliststest.json", encoding="utf-8") as f:
+            catalog = FakeCatalog.from_backup(json.load(f))
+        fakes = {}
+
+        def client_factory(credentials_file):
+            return fakes.setdefault(credentials_file, FakeYTMusic(catalog))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            accounts = []
+            for name in ("alice", "bob"):
+                filename = os.path.join(tmpdir, f"{name}.json")
+                with open(filename, "w") as f:
+                    f.write("{}")
+                accounts.append(filename)
+
+            jobs = runner.Runner(workers=4, rate=0, client_factory=client_factory)
+            server = runner.serve(jobs, port=0)
+            url = "http://%s:%d" % server.server_address[:2]
+
+            def post(body):
+                req = urllib.request.Request(
+                    f"{url}/jobs", data=json.dumps(body).encode("utf-8"), method="POST"
+                )
+                with urllib.request.urlopen(req) as res:
+                    return json.load(res)
+
+            try:
+                submitted = [
+                    post(
+                        {
+                            "operation": "copy_playlist",
+                            "backup_file": "tests/playliststest.json",
+                            "credentials_file": account,
+                            "params": {
+                                "spotify_playlist_id": "68QlHDwCiXfhodLpS72iOx",
+                                "ytmusic_playlist_id": f"+Copy {n}",
+                            },
+                        }
+                    )
+                    for account in accounts
+                    for n in range(2)
+                ]
+                with self.assertRaises(urllib.error.HTTPError) as cm:
+                    post({"operation": "load_everything"})
+                self.assertEqual(cm.exception.code, 400)
+
+                for job in submitted:
+                    self.assertTrue(jobs.jobs[job["id"]].wait(10))
+                with urllib.request.urlopen(f"{url}/jobs/{submitted[0]['id']}") as res:
+                    status = json.load(res)
+            finally:
+                server.shutdown()
+                jobs.stop()
+
+        self.assertEqual(status["status"], "done")
+        self.assertEqual(status["progress"]["added"], 38)
+        for fake in fakes.values():
+            self.assertEqual(len(fake.playlists), 2)
+        #  One job at a time per account
+        for first, second in (submitted[0:2], submitted[2:4]):
+            first, second = jobs.jobs[first["id"]], jobs.jobs[second["id"]]
+            self.assertTrue(
+                first.finished <= second.started or second.finished <= first.started
+            )
+
+    def test_pause_and_cancel(self):
+        import urllib.request
+
+        with open("tests/playliststest.json", encoding="utf-8") as f:
+            catalog = FakeCatalog.from_backup(json.load(f))
+        fake = FakeYTMusic(catalog)
+        jobs = runner.Runner(workers=2, rate=0, client_factory=lambda _: fake)
+        server = runner.serve(jobs, port=0)
+        url = "http://%s:%d" % server.server_address[:2]
+        backup = "tests/playliststest.json"
+        params = {
+            "spotify_playlist_id": "68QlHDwCiXfhodLpS72iOx",
+            "ytmusic_playlist_id": "+Copy",
+        }
+        try:
+            #  Both jobs are for the same account, so the second waits for the first
+            first = jobs.submit("copy_playlist", backup, backup, params)
+            jobs.pause(first.id)
+            second = jobs.submit("copy_playlist", backup, backup, params)
+            req = urllib.request.Request(
+                f"{url}/jobs/{second.id}/cancel", data=b"", method="POST"
+            )
+            with urllib.request.urlopen(req) as res:
+                self.assertEqual(json.load(res)["status"], "cancelled")
+            self.assertFalse(first.wait(0.2))
+            self.assertTrue(first.to_dict()["paused"])
+            jobs.cancel(first.id)
+            self.assertTrue(first.wait(10))
+        finally:
+            server.shutdown()
+            jobs.stop()
+        self.assertEqual(first.status, "cancelled")
+        self.assertLess(first.tracks, 38)
+
+    def test_rate_limiter(self):
+        limiter = RateLimiter(rate=100, burst=2)
+        waits = [limiter.reserve() for _ in range(4)]
+        self.assertEqual(waits[:2], [0.0, 0.0])
+        self.assertAlmostEqual(waits[2], 0.01, delta=0.005)
+        self.assertAlmostEqual(waits[3], 0.02, delta=0.005)
+
+
+class TestDaemon(unittest.TestCase):
+    def test_sync_only_changes(self):
+        with open("tests/playliststest.json", encoding="utf-8") as f:
+            data = json.load(f)
+        fake = FakeYTMusic(FakeCatalog.from_backup(data))
+        new_track = {
+            "track": {
+                "name": "Brand New Song",
+                "artists": [{"name": "Nobody Knows"}],
+                "album": {"name": "Fresh", "release_date": "2024-01-01"},
+                "uri": "spotify:track:new",
+            }
+        }
+        fake.catalog.add(
+            spotify2ytmusic.backend.SongInfo("Brand New Song", "Nobody Knows", "Fresh")
+        )
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            backup = os.path.join(tmpdir, "playlists.json")
+            state = os.path.join(tmpdir, "state.json")
+            with open(backup, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+
+            daemon = Daemon(fake, backup, state, track_sleep=0)
+            with patch("sys.stdout"):
+                self.assertEqual(daemon.sync()[0].added, 38)
+                searches = fake.calls["search:songs"]
+                self.assertEqual(daemon.sync(), [])
+                self.assertEqual(fake.calls["search:songs"], searches)
+
+                data["playlists"][0]["tracks"].insert(0, new_track)
+                with open(backup, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                #  A new process, only the new track is looked up and added
+                results = Daemon(fake, backup, state, track_sleep=0).sync()
+            self.assertEqual(results[0].added, 1)
+            self.assertEqual(fake.calls["create_playlist"], 1)
+            self.assertEqual(fake.calls["add_playlist_items"], 39)
+            pl = next(iter(fake.playlists.values()))
+            self.assertEqual(len(pl["videoIds"]), 39)
+
+            #  The playlist was deleted on YTMusic: it is created again, in full
+            fake.playlists.clear()
+            data["playlists"][0]["tracks"].pop(0)
+            with open(backup, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            with patch("sys.stdout"):
+                results = Daemon(fake, backup, state, track_sleep=0).sync()
+            self.assertEqual(results[0].added, 38)
+            self.assertEqual(fake.calls["create_playlist"], 2)
+            pl = fake.playlists[results[0].playlist_id]
+            self.assertEqual(len(pl["videoIds"]), 38)
+
+    def test_dry_run_creates_nothing(self):
+        with open("tests/playliststest.json", encoding="utf-8") as f:
+            fake = FakeYTMusic(FakeCatalog.from_backup(json.load(f)))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            state = os.path.join(tmpdir, "state.json")
+            daemon = Daemon(
+                fake, "tests/playliststest.json", state, dry_run=True, track_sleep=0
+            )
+            with patch("sys.stdout"):
+                [done] = daemon.sync()
+            self.assertFalse(os.path.exists(state))
+        self.assertEqual(done.errors, 0)
+        self.assertEqual(fake.calls["search:songs"], 38)
+        self.assertEqual(fake.calls["create_playlist"], 0)
+        self.assertEqual(fake.calls["add_playlist_items"], 0)
+        self.assertEqual(fake.playlists, {})
+
+
+class TestPlan(unittest.TestCase):
+    def test_plan_then_apply(self):
+        with open("tests/playliststest.json", encoding="utf-8") as f:
+            fake = FakeYTMusic(FakeCatalog.from_backup(json.load(f)))
+        quiet = events.EventBus()
+
+        with tempfile.TemporaryFile("w+", encoding="utf-8") as plan_file:
+            make_plan(
+                plan_file,
+                "tests/playliststest.json",
+                workers=4,
+                yt=fake,
+                events=quiet,
+            )
+            self.assertEqual(fake.calls["add_playlist_items"], 0)
+            self.assertEqual(fake.calls["create_playlist"], 0)
+
+            plan_file.seek(0)
+            entries = list(read_plan(plan_file))
+            self.assertEqual(len(entries), 38)
+            self.assertTrue(all(e["confidence"] == 1.0 for e in entries))
+            self.assertEqual(entries[0]["playlist"], "Raid the Data Center")
+
+            results = apply_plan(iter(entries), batch_size=20, yt=fake, events=quiet)
+
+        self.assertEqual(results[0].added, 38)
+        self.assertEqual(fake.calls["create_playlist"], 1)
+        self.assertEqual(fake.calls["add_playlist_items"], 2)
+        self.assertEqual(fake.calls["search:songs"], 38)
+        pl = next(iter(fake.playlists.values()))
+        self.assertEqual(pl["videoIds"], [e["video_id"] for e in entries])
+
+    def test_plan_piped_into_apply(self):
+        import io
+        from spotify2ytmusic import plan
+
+        with open("tests/playliststest.json", encoding="utf-8") as f:
+            fake = FakeYTMusic(FakeCatalog.from_backup(json.load(f)))
+        stdout, stderr = io.StringIO(), io.StringIO()
+        argv = ["s2yt_plan", "--spotify-playlist-file", "tests/playliststest.json"]
+        try:
+            with patch.object(
+                spotify2ytmusic.backend, "get_ytmusic", return_value=fake
+            ), patch("sys.stdout", stdout), patch("sys.stderr", stderr):
+                with patch("sys.argv", argv + ["--stats", "-"]):
+                    plan.plan()
+                #  The progress went to standard error, the plan alone to standard output
+                self.assertIn("Spotify:", stderr.getvalue())
+                self.assertIn("endpoint", stderr.getvalue())
+                with patch("sys.argv", ["s2yt_apply", "-"]), patch(
+                    "sys.stdin", io.StringIO(stdout.getvalue())
+                ):
+                    plan.apply()
+        finally:
+            events.set_output("text")
+
+        [pl] = fake.playlists.values()
+        self.assertEqual(len(pl["videoIds"]), 38)
+
+
+class TestLikeWriter(unittest.TestCase):
+    def _load_liked(self, workers, preserve_order):
+        with open("tests/playliststest.json", encoding="utf-8") as f:
+            data = json.load(f)
+        fake = FakeYTMusic(FakeCatalog.from_backup(data))
+        data["playlists"][0]["name"] = "Liked Songs"
+        #  Already liked, should not be liked again
+        fake.liked = list(fake.catalog.tracks)[:5]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "playlists.json")
+            with open(filename, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            quiet = events.EventBus()
+            writer = LikeWriter(fake, workers, 0, preserve_order, events=quiet)
+            try:
+                done = spotify2ytmusic.backend.copier(
+                    spotify2ytmusic.backend.iter_spotify_playlist(
+                        None, spotify_playlist_file=filename, reverse_playlist=False
+                    ),
+                    None,
+                    track_sleep=0,
+                    yt=fake,
+                    events=quiet,
+                    like_writer=writer,
+                )
+            finally:
+                writer.close()
+        return fake, done
+
+    def test_skips_already_liked(self):
+        fake, done = self._load_liked(4, False)
+        self.assertEqual(fake.calls["get_liked_songs"], 1)
+        self.assertEqual(fake.calls["rate_song"], 33)
+        self.assertEqual(done.duplicates, 5)
+        self.assertEqual(done.errors, 0)
+        self.assertEqual(sorted(fake.liked), sorted(fake.catalog.tracks))
+
+    def test_preserve_order(self):
+        fake, done = self._load_liked(4, True)
+        self.assertEqual(fake.liked[5:], list(fake.catalog.tracks)[5:])
+
+    def test_failed_like_cancelled_and_retried(self):
+        yt = MagicMock()
+        yt.get_liked_songs.return_value = {"tracks": []}
+        yt.rate_song.side_effect = Exception("Server error")
+        cancel = CancelToken()
+        writer = LikeWriter(yt, 1, 0, events=events.EventBus(), cancel=cancel)
+        try:
+            self.assertTrue(writer.submit(None, "v1"))
+            time.sleep(0.1)
+            #  Cancelling cuts the 5 second back-off short
+            start = time.perf_counter()
+            cancel.cancel()
+            self.assertEqual(writer.join(), 1)
+            self.assertLess(time.perf_counter() - start, 1)
+            #  The like failed, so the song isn't taken as already liked
+            self.assertTrue(writer.submit(None, "v1"))
+            writer.join()
+        finally:
+            writer.close()
+
+
+class TestSharding(unittest.TestCase):
+    def test_processes_and_journal(self):
+        data = bench.synthetic_backup(60, n_playlists=3)
+        data["playlists"][0]["tracks"] = data["playlists"][0]["tracks"][:5]
+        fake = FakeYTMusic(FakeCatalog.from_backup(data))
+        server = serve(fake)
+        factory = http_client_factory("http://%s:%d" % server.server_address[:2])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "playlists.json")
+            journal = os.path.join(tmpdir, "journal.jsonl")
+            with open(filename, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+
+            def run():
+                return copy_all_playlists_sharded(
+                    2,
+                    track_sleep=0,
+                    spotify_playlist_file=filename,
+                    journal_file=journal,
+                    output="quiet",
+                    client_factory=factory,
+                    events=events.EventBus(),
+                )
+
+            try:
+                results = run()
+                self.assertEqual(sorted(r.added for r in results), [5, 20, 20])
+                self.assertEqual(len(fake.playlists), 3)
+                with open(journal, encoding="utf-8") as f:
+                    self.assertEqual(len(f.readlines()), 3)
+                #  Resuming skips the playlists that are done
+                self.assertEqual(run(), [])
+            finally:
+                server.shutdown()
+        #  New playlists are created with their tracks
+        self.assertEqual(fake.calls["create_playlist"], 3)
+        self.assertEqual(fake.calls["add_playlist_items"], 0)
+        self.assertEqual(
+            sorted(len(pl["videoIds"]) for pl in fake.playlists.values()), [5, 20, 20]
+        )
+
+    def test_workers_dont_write_the_trace(self):
+        data = bench.synthetic_backup(300, n_playlists=2)
+        fake = FakeYTMusic(FakeCatalog.from_backup(data))
+        server = serve(fake)
+        factory = http_client_factory("http://%s:%d" % server.server_address[:2])
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "playlists.json")
+            trace_file = os.path.join(tmpdir, "trace.jsonl")
+            with open(filename, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            try:
+                with tracing.use(tracing.Tracer(trace_file)):
+                    with PhaseTimer().phase("load"):
+                        pass
+                    copy_all_playlists_sharded(
+                        2,
+                        track_sleep=0,
+                        spotify_playlist_file=filename,
+                        output="quiet",
+                        client_factory=factory,
+                        events=events.EventBus(),
+                    )
+            finally:
+                server.shutdown()
+            with open(trace_file, encoding="utf-8") as f:
+                records = [json.loads(line) for line in f]
+        #  The parent's record is written once, not again by each worker
+        self.assertEqual([r["name"] for r in records], ["load", "json_load"])
+
+    def test_trace_rejected_with_processes(self):
+        from spotify2ytmusic import cli
+
+        argv = ["s2yt_copy_all_playlists", "--processes", "2", "--trace", "t.jsonl"]
+        with patch("sys.argv", argv), patch("sys.stderr"):
+            with self.assertRaises(SystemExit):
+                cli.copy_all_playlists()
+        self.assertFalse(os.path.exists("t.jsonl"))
+
+
+class TestGetYTMusic(unittest.TestCase):
+    def test_client_reused_per_credentials_file(self):
+        backend = spotify2ytmusic.backend
+        backend.reset_ytmusic()
+        with tempfile.TemporaryDirectory() as tmp:
+            creds = os.path.join(tmp, "oauth.json")
+            with open(creds, "w") as f:
+                f.write("{}")
+            with patch("ytmusicapi.YTMusic") as mock_ytmusic:
+                first = backend.get_ytmusic(creds)
+                self.assertIs(backend.get_ytmusic(creds), first)
+                self.assertEqual(mock_ytmusic.call_count, 1)
+                session = mock_ytmusic.call_args.kwargs["requests_session"]
+                self.assertEqual(
+                    session.get_adapter("https://music.youtube.com")._pool_maxsize,
+                    backend.HTTP_POOL_SIZE,
+                )
+
+                backend.reset_ytmusic()
+                self.assertIsNot(backend.get_ytmusic(creds), first)
+                self.assertEqual(mock_ytmusic.call_count, 2)
+        backend.reset_ytmusic()
+
+
+class TestCassette(unittest.TestCase):
+    def test_replay_copy_playlist_offline(self):
+        backend = spotify2ytmusic.backend
+        with open("tests/playliststest.json") as f:
+            fake = FakeYTMusic(FakeCatalog.from_backup(json.load(f)))
+        dst_pl_id = fake.create_playlist("Raid the Data Center", "")
+
+        def copy(yt):
+            return backend.copier(
+                backend.iter_spotify_playlist(
+                    "68QlHDwCiXfhodLpS72iOx",
+                    spotify_playlist_file="tests/playliststest.json",
+                ),
+                dst_pl_id,
+                track_sleep=0,
+                yt=yt,
+            )
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "copy.jsonl.gz")
+            with cassette.use(cassette.Cassette(filename, cassette.RECORD)) as tape:
+                recorded = copy(cassette.CassetteYTMusic(fake, tape))
+            self.assertEqual(tape.calls, sum(fake.calls.values()) - 1)
+
+            metrics.reset()
+            tape = cassette.Cassette(filename, cassette.REPLAY, latency="none")
+            with cassette.use(tape):
+                start = time.process_time()
+                replayed = copy(backend.get_ytmusic("no-such-oauth.json"))
+                cpu = time.process_time() - start
+
+        self.assertEqual(tape.misses, 0)
+        self.assertEqual((replayed.added, replayed.errors), (recorded.added, 0))
+        for endpoint in ("search:songs", "add_playlist_items"):
+            self.assertEqual(
+                metrics.endpoints[("ytmusic", endpoint)].calls, fake.calls[endpoint]
+            )
+        self.assertLess(cpu / recorded.added, 0.05)
+
+
+class TestResponseCache(unittest.TestCase):
+    def test_cached_calls_skip_the_service(self):
+        with open("tests/playliststest.json") as f:
+            fake = FakeYTMusic(FakeCatalog.from_backup(json.load(f)))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = ResponseCache(os.path.join(tmpdir, "cache.sqlite"))
+            metrics.reset()
+            for _ in range(2):
+                yt = CachedYTMusic(fake, cache)
+                first = yt.search("Comfort Eagle by CAKE", filter="songs")
+                self.assertEqual(
+                    yt.search("Comfort Eagle by CAKE", filter="songs"), first
+                )
+                yt.get_library_playlists(limit=5000)
+            yt.create_playlist("New", "")
+            self.assertEqual(len(yt.get_library_playlists(limit=5000)), 1)
+            cache.close()
+
+        self.assertEqual(fake.calls["search:songs"], 1)
+        self.assertEqual(fake.calls["get_library_playlists"], 2)
+        self.assertEqual(metrics.endpoints[("ytmusic", "search:songs")].cache_hits, 3)
+
+    def test_accounts_kept_apart(self):
+        backend = spotify2ytmusic.backend
+        backend.reset_ytmusic()
+        libraries = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ResponseCache(os.path.join(tmp, "cache.sqlite"))
+            shared = {os.path.abspath(response_cache.CACHE_FILE): cache}
+
+            def client(credentials_file, requests_session):
+                fake = libraries[credentials_file] = FakeYTMusic(FakeCatalog())
+                fake.create_playlist(os.path.basename(credentials_file), "")
+                return fake
+
+            clients = []
+            with patch("ytmusicapi.YTMusic", client), patch.dict(
+                response_cache._shared, shared
+            ):
+                for account in ("alice.json", "bob.json"):
+                    creds = os.path.join(tmp, account)
+                    with open(creds, "w") as f:
+                        f.write("{}")
+                    clients.append(backend.get_ytmusic(creds))
+                for _ in range(2):
+                    self.assertEqual(
+                        [
+                            [p["title"] for p in yt.get_library_playlists()]
+                            for yt in clients
+                        ],
+                        [["alice.json"], ["bob.json"]],
+                    )
+            cache.close()
+        backend.reset_ytmusic()
+        #  Each account is fetched once, then answered from the cache
+        for fake in libraries.values():
+            self.assertEqual(fake.calls["get_library_playlists"], 1)
+
+
+class TestTracing(unittest.TestCase):
+    def _copy(self, yt, trace_file, format):
+        with tracing.use(tracing.Tracer(trace_file, format)):
+            spotify2ytmusic.backend.copy_playlist(
+                "68QlHDwCiXfhodLpS72iOx",
+                "+Raid the Data Center",
+                track_sleep=0,
+                spotify_playlist_file="tests/playliststest.json",
+                yt=yt,
+                events=events.EventBus(),
+            )
+
+    def test_trace_formats(self):
+        with open("tests/playliststest.json") as f:
+            fake = FakeYTMusic(FakeCatalog.from_backup(json.load(f)))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = ResponseCache(os.path.join(tmpdir, "cache.sqlite"))
+            yt = CachedYTMusic(instrument_ytmusic(fake), cache)
+            self._copy(yt, os.path.join(tmpdir, "trace.jsonl"), "jsonl")
+            self._copy(yt, os.path.join(tmpdir, "trace.json"), "chrome")
+            cache.close()
+            with open(os.path.join(tmpdir, "trace.jsonl"), encoding="utf-8") as f:
+                records = [json.loads(line) for line in f]
+            with open(os.path.join(tmpdir, "trace.json"), encoding="utf-8") as f:
+                chrome = json.load(f)
+
+        tracks = [r for r in records if r["type"] == "track"]
+        self.assertEqual(len(tracks), 38)
+        self.assertEqual([t["index"] for t in tracks], list(range(38)))
+        [search] = tracks[0]["calls"]
+        self.assertEqual(
+            (search["endpoint"], search["cache"], search["retry"]),
+            ("search:songs", "miss", 0),
+        )
+        self.assertEqual(set(tracks[0]["phases"]), {"lookup", "other"})
+        #  Creating the playlist happens after the lookups, outside of any track
+        self.assertIn(
+            "create_playlist", [r["endpoint"] for r in records if r["type"] == "call"]
+        )
+
+        #  The second copy is answered from the cache
+        chrome_tracks = [e for e in chrome if e["cat"] == "track"]
+        self.assertEqual(len(chrome_tracks), 38)
+        calls = [e for e in chrome if e["name"] == "search:songs"]
+        self.assertEqual({e["args"]["cache"] for e in calls}, {"hit"})
+        self.assertTrue(all(e["ph"] == "X" and e["dur"] >= 0 for e in chrome))
+
+    def test_retries(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "trace.jsonl")
+            with tracing.use(tracing.Tracer(filename)):
+                for error in (True, True, False, False):
+                    metrics.observe("spotify", "me/tracks", 0.01, error)
+                    if error:
+                        metrics.retry("spotify", "me/tracks")
+                        metrics.sleep("spotify_backoff", 0.001)
+            with open(filename, encoding="utf-8") as f:
+                records = [json.loads(line) for line in f]
+        calls = [r for r in records if r["type"] == "call"]
+        self.assertEqual([r["retry"] for r in calls], [0, 1, 2, 0])
+        sleeps = [r for r in records if r["type"] == "sleep"]
+        self.assertEqual([r["reason"] for r in sleeps], ["spotify_backoff"] * 2)
+
+
+class TestReaders(unittest.TestCase):
+    def test_formats(self):
+        from spotify2ytmusic import spotify_backup
+
+        backend = spotify2ytmusic.backend
+        quiet = events.EventBus()
+        with open("tests/playliststest.json") as f:
+            data = json.load(f)
+        expected = list(
+            backend.iter_spotify_playlist(
+                "68QlHDwCiXfhodLpS72iOx",
+                spotify_playlist_file="tests/playliststest.json",
+                reverse_playlist=False,
+                events=quiet,
+            )
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tsv = os.path.join(tmpdir, "playlists")
+            with patch.object(spotify_backup, "bus", quiet):
+                spotify_backup.write_to_file(tsv, "tsv", data["playlists"], [])
+            self.assertEqual(
+                list(
+                    readers.iter_tracks(
+                        tsv, playlist="Raid the Data Center", events=quiet
+                    )
+                ),
+                expected,
+            )
+
+            jsonl = os.path.join(tmpdir, "tracks.jsonl")
+            with open(jsonl, "w", encoding="utf-8") as f:
+                for song in expected[:2]:
+                    f.write(json.dumps(song._asdict()) + "\n")
+                f.write("\n")
+            self.assertEqual(
+                list(readers.iter_tracks(jsonl, events=quiet)), expected[:2]
+            )
+
+            csv_file = os.path.join(tmpdir, "export")
+            with open(csv_file, "w", encoding="utf-8") as f:
+                f.write("Track URI,Track Name,Artist Name(s),Album Name\n")
+                f.write(
+                    'spotify:track:1,"Comfort Eagle","CAKE,Someone",Comfort Eagle\n'
+                )
+            self.assertEqual(
+                list(readers.iter_tracks(csv_file, events=quiet)),
+                [backend.SongInfo("Comfort Eagle", "CAKE", "Comfort Eagle")],
+            )
+
+    def test_artist_names_with_commas(self):
+        quiet = events.EventBus()
+        lines = [
+            "Mix\r\n",
+            "September\tEarth, Wind & Fire\tThe Best Of\tspotify:track:1\t1978\r\n",
+            "EARFQUAKE\tTyler, The Creator, Playboi Carti\tIGOR\tspotify:track:2\t2019\r\n",
+            "Teach Me How to Dougie\tCali Swag District, Someone\tX\tspotify:track:3\t2010\r\n",
+            "Sing About Me\tKendrick Lamar, The Weeknd\tX\tspotify:track:4\t2012\r\n",
+            "Wants and Needs\tDrake, lil nas x\tX\tspotify:track:5\t2021\r\n",
+            "Come Closer\tDrake, Future & Wizkid\tX\tspotify:track:6\t2017\r\n",
+            "\r\n",
+        ]
+        self.assertEqual(
+            [song.artist for song in readers.iter_tsv(lines, events=quiet)],
+            [
+                "Earth, Wind & Fire",
+                "Tyler, The Creator",
+                "Cali Swag District",
+                "Kendrick Lamar",
+                "Drake",
+                "Drake",
+            ],
+        )
+
+        rows = [
+            "Track Name,Artist Name(s),Album Name\n",
+            'September,"Earth, Wind & Fire",The Best Of\n',
+            'EARFQUAKE,"Tyler, The Creator,Playboi Carti",IGOR\n',
+        ]
+        self.assertEqual(
+            [song.artist for song in readers.iter_exportify_csv(rows, events=quiet)],
+            ["Earth, Wind & Fire", "Tyler, The Creator"],
+        )
+
+    def test_copy_tracks_from_jsonl(self):
+        with open("tests/playliststest.json") as f:
+            yt = FakeYTMusic(FakeCatalog.from_backup(json.load(f)))
+        lines = [
+            json.dumps(
+                {"title": "Comfort Eagle", "artist": "CAKE", "album": "Comfort Eagle"}
+            ),
+            "not json",
+        ]
+        quiet = events.EventBus()
+        done = spotify2ytmusic.backend.copy_tracks(
+            readers.iter_jsonl(lines, events=quiet),
+            "+From JSONL",
+            track_sleep=0,
+            yt=yt,
+            events=quiet,
+        )
+        [playlist] = yt.playlists.values()
+        self.assertEqual((playlist["title"], done.added), ("From JSONL", 1))
+
+
+class TestSynth(unittest.TestCase):
+    def test_synthetic_backup(self):
+        backend = spotify2ytmusic.backend
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "playlists.json")
+            with open(filename, "w", encoding="utf-8") as f:
+                synth.write_backup(f, 2000, n_playlists=5, duplicate_rate=0.1, seed=1)
+            data = backend.load_playlists_json(filename)
+            liked = list(
+                backend.iter_spotify_playlist(
+                    None, spotify_playlist_file=filename, events=events.EventBus()
+                )
+            )
+            result = bench.file_benchmark(
+                "iter_spotify_liked_albums", 2000, filename, tmpdir
+            )
+
+        uris = [t["track"]["uri"] for pl in data["playlists"] for t in pl["tracks"]]
+        self.assertEqual(len(uris), 2000)
+        self.assertEqual(len(data["playlists"]), 6)
+        self.assertEqual(len(liked), 600)
+        self.assertAlmostEqual(1 - len(set(uris)) / len(uris), 0.1, delta=0.03)
+        self.assertEqual(len(data["albums"]), 2)
+        self.assertGreater(result.seconds, 0)
+
+
+class TestCompression(unittest.TestCase):
+    def _round_trip(self, ext):
+        from spotify2ytmusic import spotify_backup
+
+        backend = spotify2ytmusic.backend
+        data = backend.load_playlists_json("tests/playliststest.json")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "playlists.json" + ext)
+            with patch.object(spotify_backup, "bus", events.EventBus()):
+                spotify_backup.write_to_file(filename, "json", data["playlists"], [])
+            self.assertEqual(
+                compression.detect(filename), compression.codec_for(filename)
+            )
+            self.assertLess(
+                os.path.getsize(filename),
+                os.path.getsize("tests/playliststest.json") / 5,
+            )
+            self.assertEqual(
+                backend.load_playlists_json(filename)["playlists"], data["playlists"]
+            )
+
+            self.assertEqual(reverse_playlist(filename, verbose=False), 0)
+            self.assertTrue(
+                os.path.exists(os.path.join(tmpdir, "playlists_backup.json" + ext))
+            )
+            self.assertEqual(
+                compression.detect(filename), compression.codec_for(filename)
+            )
+            reversed_data = backend.load_playlists_json(filename)
+            self.assertEqual(
+                reversed_data["playlists"][0]["tracks"],
+                data["playlists"][0]["tracks"][::-1],
+            )
+
+            #  Detected by the magic bytes, not the name
+            renamed = os.path.join(tmpdir, "backup")
+            os.rename(filename, renamed)
+            self.assertEqual(backend.load_playlists_json(renamed), reversed_data)
+
+            tsv = os.path.join(tmpdir, "playlists.tsv" + ext)
+            with patch.object(spotify_backup, "bus", events.EventBus()):
+                spotify_backup.write_to_file(tsv, "tsv", data["playlists"], [])
+            songs = list(readers.iter_tracks(tsv, events=events.EventBus()))
+            self.assertEqual(
+                len(songs), sum(len(p["tracks"]) for p in data["playlists"])
+            )
+
+    def test_gzip(self):
+        self._round_trip(".gz")
+
+    def test_zstd(self):
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            self.skipTest("zstandard is not installed")
+        self._round_trip(".zst")
+
+
+class TestJsonCodec(unittest.TestCase):
+    def test_same_output_as_stdlib(self):
+        with open("tests/playliststest.json", encoding="utf-8") as f:
+            data = json.load(f)
+        self.assertEqual(
+            jsoncodec.dumps(data),
+            json.dumps(data, ensure_ascii=False, indent=2).encode(),
+        )
+        self.assertEqual(json.loads(jsoncodec.dumps(data, compact=True)), data)
+        self.assertEqual(jsoncodec.loads(jsoncodec.dumps(data)), data)
+        #  Too large for orjson, written by the json module
+        self.assertEqual(
+            jsoncodec.dumps({"n": 2**70}, compact=True),
+            b'{"n":1180591620717411303424}',
+        )
+
+    def test_write_to_file_compact(self):
+        from spotify2ytmusic import spotify_backup
+
+        data = spotify2ytmusic.backend.load_playlists_json("tests/playliststest.json")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "playlists.json")
+            with patch.object(spotify_backup, "bus", events.EventBus()):
+                spotify_backup.write_to_file(
+                    filename, "json", data["playlists"], [], compact=True
+                )
+            with open(filename, encoding="utf-8") as f:
+                text = f.read()
+        self.assertNotIn("\n", text)
+        self.assertEqual(json.loads(text)["playlists"], data["playlists"])
+
+
+class TestCommands(unittest.TestCase):
+    def test_registry_covers_cli(self):
+        import inspect
+        from spotify2ytmusic import cli
+
+        public = {
+            name
+            for name, obj in inspect.getmembers(cli, inspect.isfunction)
+            if obj.__module__ == cli.__name__ and not name.startswith("_")
+        }
+        self.assertLessEqual(public, set(commands.COMMANDS))
+        for name in commands.COMMANDS:
+            self.assertTrue(callable(commands.resolve(name)))
+
+    def test_light_commands_skip_heavy_imports(self):
+        for name in ("list_liked_albums", "copy_playlist"):
+            result = bench.import_time(name, repeat=1)
+            self.assertEqual(result["heavy_modules"], [], name)
+
+
 if __name__ == "__main__":
     unittest.main()